@@ -0,0 +1,17 @@
+from . import bench_aio
+from . import bench_atomic
+from . import bench_buffer
+from . import bench_counter
+from . import bench_executor
+from . import bench_isolate
+from . import bench_logger
+from . import bench_metrics
+from . import bench_net
+from . import bench_par
+from . import bench_parking
+from . import bench_queue
+from . import bench_semaphore
+from . import bench_shm
+from . import bench_stack
+from . import bench_timer
+from . import bench_wait
@@ -0,0 +1,20 @@
+from . import *
+
+if __name__ == '__main__':
+    bench_parking.main()
+    bench_wait.main()
+    bench_atomic.main()
+    bench_counter.main()
+    bench_buffer.main()
+    bench_par.main()
+    bench_isolate.main()
+    bench_shm.main()
+    bench_net.main()
+    bench_aio.main()
+    bench_timer.main()
+    bench_stack.main()
+    bench_executor.main()
+    bench_queue.main()
+    bench_semaphore.main()
+    bench_metrics.main()
+    bench_logger.main()
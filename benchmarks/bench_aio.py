@@ -0,0 +1,39 @@
+import resource
+import time
+
+from cpo import *
+from demos import demo_primes
+
+def sieve_seconds(num_primes: int, asynchronous: bool) -> float:
+    start = time.perf_counter()
+    demo_primes.run_demo(num_primes, asynchronous=asynchronous)
+    return time.perf_counter() - start
+
+def chain_seconds(n: int) -> float:
+    """Returns the seconds taken to pass a value along a chain of n async
+    processes, each of which reads from one channel and writes to the next"""
+    chans = [OneOne() for _ in range(n + 1)]
+    async def link(i):
+        await chans[i + 1].awrite(await chans[i].aread() + 1)
+    start = time.perf_counter()
+    Par('chain', [async_proc(link, i) for i in range(n)] +
+        [proc(lambda: chans[0] << 0), proc(lambda: ~chans[n])])()
+    return time.perf_counter() - start
+
+def run_bench(num_primes: int = 300, chain: int = 100000):
+    return {
+        f'sieve of {num_primes} primes, threads':
+            sieve_seconds(num_primes, False),
+        f'sieve of {num_primes} primes, async':
+            sieve_seconds(num_primes, True),
+        f'chain of {chain} async processes': chain_seconds(chain),
+    }
+
+def main():
+    for name, seconds in run_bench().items():
+        print(f'{name:>40}: {seconds:6.2f}s')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+    print(f'{"peak memory":>40}: {peak} MB')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import contextlib
+import time
+
+from cpo import *
+from cpo import atomic
+from cpo import channel
+
+@contextlib.contextmanager
+def channels_with(backend):
+    prev = channel.Atomic
+    channel.Atomic = backend
+    try:
+        yield
+    finally:
+        channel.Atomic = prev
+
+def throughput(n: int) -> float:
+    """Returns the number of messages per second passed from one process to
+    another over a OneOne channel."""
+    c = OneOne()
+
+    @proc
+    def writer():
+        for i in range(n):
+            c << i
+        c.close()
+
+    @proc
+    @repeat
+    def reader():
+        ~c
+
+    start = time.perf_counter()
+    (writer | reader)()
+    return n / (time.perf_counter() - start)
+
+def run_bench(n: int = 20000):
+    results = {}
+    for backend in [atomic.LockedAtomic, atomic.GILAtomic]:
+        with channels_with(backend):
+            results[backend.__name__] = throughput(n)
+    return results
+
+def main():
+    print(f'GIL enabled: {atomic.gil_enabled()}, '
+          f'Atomic is {atomic.Atomic.__name__}')
+    for name, rate in run_bench().items():
+        print(f'{name:>12}: {rate:10.0f} OneOne messages per second')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import contextlib
+import time
+
+from cpo import *
+from cpo import channel
+from cpo import util
+# after the star import, which brings in cpo.queue
+import queue
+
+class QueueBuffer:
+    """The engine buffered channels used before the ring, a queue.Queue
+    which is drained one value at a time on close"""
+
+    def __init__(self, size: int, name: str) -> None:
+        self.name = name
+        self.queue: queue.Queue = queue.Queue(maxsize=size)
+        self.closed = False
+
+    def __len__(self) -> int:
+        return self.queue.qsize()
+
+    def is_empty(self) -> bool:
+        return self.queue.empty()
+
+    def is_full(self) -> bool:
+        return self.queue.full()
+
+    def put(self, value, timeout=None) -> bool:
+        if self.closed:
+            raise util.Closed(self.name)
+        try:
+            self.queue.put(
+                value, timeout=None if timeout is None else timeout.to_seconds())
+            return True
+        except queue.Full:
+            return False
+
+    def put_many(self, values, timeout=None) -> int:
+        for value in values:
+            self.put(value)
+        return len(values)
+
+    def get(self, timeout=None):
+        # the queue cannot be woken on close, so poll for it
+        while True:
+            if self.closed:
+                raise util.Closed(self.name)
+            try:
+                return self.queue.get(timeout=0.01)
+            except queue.Empty:
+                pass
+
+    def get_many(self, max_n, timeout=None):
+        return [self.get(timeout)]
+
+    def close_output(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+        try:
+            while True:
+                self.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+@contextlib.contextmanager
+def buffers_with(engine):
+    prev = channel.RingBuffer
+    channel.RingBuffer = engine
+    try:
+        yield
+    finally:
+        channel.RingBuffer = prev
+
+def throughput(writers: int, readers: int, n: int, size: int = 64) -> float:
+    """Returns the number of messages per second passed through an N2NBuf
+    shared by the given numbers of writers and readers."""
+    c = N2NBuf(size=size, writers=writers, readers=readers)
+    per_writer = n // writers
+
+    @procs(range(writers))
+    def write(i):
+        for j in range(per_writer):
+            c << j
+        c.close_out()
+
+    @procs(range(readers))
+    @repeat
+    def read(i):
+        ~c
+
+    start = time.perf_counter()
+    (write | read)()
+    return per_writer * writers / (time.perf_counter() - start)
+
+def run_bench(n: int = 50000):
+    shapes = {'1:1': (1, 1), 'N:1': (8, 1), 'N:N': (8, 8)}
+    results = {}
+    for shape, (writers, readers) in shapes.items():
+        results[shape] = {}
+        for engine in [QueueBuffer, channel.RingBuffer]:
+            with buffers_with(engine):
+                results[shape][engine.__name__] = \
+                    throughput(writers, readers, n)
+    return results
+
+def main():
+    for shape, rates in run_bench().items():
+        print(f'{shape:>4}: ' + ', '.join(
+            f'{name} {rate:10.0f} msgs/s' for name, rate in rates.items()))
+
+if __name__ == '__main__':
+    main()
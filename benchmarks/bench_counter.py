@@ -0,0 +1,36 @@
+import time
+
+from cpo import *
+
+def contended(counter, n_threads: int, total: int) -> float:
+    """Returns the number of increments per second when n_threads share
+    total increments of counter."""
+    per_thread = max(total // n_threads, 1)
+
+    @procs(range(n_threads))
+    def workers(i):
+        for _ in range(per_thread):
+            counter.inc(1)
+
+    start = time.perf_counter()
+    workers()
+    elapsed = time.perf_counter() - start
+    assert counter.get() == per_thread * n_threads
+    return per_thread * n_threads / elapsed
+
+def run_bench(threads=(1, 10, 100, 1000), total: int = 200000):
+    results = {}
+    for n in threads:
+        results[n] = {
+            'AtomicNum': contended(AtomicNum(0), n, total),
+            'StripedCounter': contended(StripedCounter(), n, total),
+        }
+    return results
+
+def main():
+    for n, rates in run_bench().items():
+        print(f'{n:>5} threads: ' + ', '.join(
+            f'{name} {rate:10.0f} incs/s' for name, rate in rates.items()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import contextlib
+import os
+import time
+
+from cpo import *
+from cpo import executor
+from cpo.tests import test_stress
+
+@contextlib.contextmanager
+def executor_with(ex: executor.CPOExecutor):
+    orig = executor.executor
+    executor.executor = ex
+    try:
+        yield ex
+    finally:
+        executor.executor = orig
+        ex.shutdown()
+
+def adaptive() -> executor.CPOExecutor:
+    return executor.size_pooled_cpo_executor(0)
+
+def stealing() -> executor.CPOExecutor:
+    return executor.StealingExecutor(
+        os.cpu_count() or 1,
+        Nanoseconds.from_seconds(executor.poolKEEPALIVE),
+        Nanoseconds.from_seconds(executor.poolSTALL),
+    )
+
+STRESS = {
+    'proc': test_stress.test_stress_proc,
+    'lock': test_stress.test_stress_lock,
+    'channel': test_stress.test_stress_channel,
+    'queue': test_stress.test_stress_queue,
+}
+
+def timed(make, body):
+    """Returns the seconds body took, and the stats of its executor"""
+    with executor_with(make()) as ex:
+        start = time.perf_counter()
+        body()
+        took = time.perf_counter() - start
+        stats = ex.stats() if isinstance(ex, executor.StealingExecutor) \
+            else None
+    return took, stats
+
+def run_bench():
+    results = {}
+    for name, body in STRESS.items():
+        results[f'{name}, ADAPTIVE'] = timed(adaptive, body)
+        results[f'{name}, STEALING'] = timed(stealing, body)
+    return results
+
+def main():
+    for name, (took, stats) in run_bench().items():
+        line = f'{name:>18}: {took * 1000:8.1f}ms'
+        if stats is not None:
+            line += f'  workers={stats["workers"]} ' \
+                    f'local={stats["local hits"]} ' \
+                    f'shared={stats["shared hits"]} ' \
+                    f'steals={stats["steals"]} ' \
+                    f'compensations={stats["compensations"]}'
+        print(line)
+
+if __name__ == '__main__':
+    main()
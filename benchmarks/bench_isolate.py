@@ -0,0 +1,31 @@
+import time
+
+from cpo import *
+from demos import demo_pi
+
+def estimate_time(num_workers: int, isolate: bool, num_drops: float) -> float:
+    start = time.perf_counter()
+    demo_pi.run_demo(num_drops, num_workers, isolate)
+    return time.perf_counter() - start
+
+def run_bench(cores=(1, 2, 4, 8), num_drops: float = 2e6):
+    # start the worker processes before timing
+    demo_pi.run_demo(max(cores) * demo_pi.DROPS_PER_TASK, max(cores), True)
+    results = {}
+    for n in cores:
+        results[n] = {
+            'threads': estimate_time(n, False, num_drops),
+            'isolated': estimate_time(n, True, num_drops),
+        }
+    return results
+
+def main():
+    results = run_bench()
+    base = results[min(results)]
+    for n, times in results.items():
+        print(f'{n:>2} workers: ' + ', '.join(
+            f'{name} {t:6.2f}s (x{base[name] / t:4.1f})'
+            for name, t in times.items()))
+
+if __name__ == '__main__':
+    main()
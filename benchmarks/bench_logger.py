@@ -0,0 +1,72 @@
+import collections
+import inspect
+import os
+import tempfile
+import threading
+import time
+
+from cpo import *
+
+class LockedLogger:
+    """The Logger which preceded the flight recorder, which took a global
+    lock and read the caller's source line for every event"""
+
+    def __init__(self, log_size: int):
+        self.log_size = log_size
+        self.entries = collections.deque()
+        self.lock = threading.Lock()
+
+    def log(self, text, bits=None):
+        with self.lock:
+            frame = inspect.currentframe()
+            tb = None if frame is None else inspect.getframeinfo(frame)
+            self.entries.append((time.time_ns(), threading.current_thread(),
+                                 tb, text))
+            if self.log_size > 0 and len(self.entries) > self.log_size:
+                self.entries.popleft()
+
+def logs(logger, n_threads: int, n: int = 20000) -> float:
+    """Returns the events logged per second by n_threads threads logging n
+    events each"""
+    barrier = threading.Barrier(n_threads + 1)
+    def run():
+        barrier.wait()
+        for i in range(n):
+            logger.log(i)
+    threads_ = [threading.Thread(target=run) for _ in range(n_threads)]
+    for t in threads_:
+        t.start()
+    start = time.perf_counter()
+    barrier.wait()
+    for t in threads_:
+        t.join()
+    return n_threads * n / (time.perf_counter() - start)
+
+def rejects(n: int = 1000000) -> float:
+    """Returns the events masked out per second"""
+    logger = Logger('bench', 1000, mask=1)
+    start = time.perf_counter()
+    for i in range(n):
+        logger.log(i, 2)
+    return n / (time.perf_counter() - start)
+
+def run_bench():
+    results = {}
+    for n_threads in (1, 8):
+        results[f'LockedLogger, {n_threads} threads'] = \
+            logs(LockedLogger(1000), n_threads)
+        results[f'Logger, {n_threads} threads'] = \
+            logs(Logger('bench', 1000), n_threads)
+    results['Logger, masked out'] = rejects()
+    with tempfile.TemporaryDirectory() as tmp:
+        with TraceSink(os.path.join(tmp, 'bench')) as sink:
+            results['Logger to a TraceSink'] = \
+                logs(Logger('bench', 1000, sink=sink), 1)
+    return results
+
+def main():
+    for name, rate in run_bench().items():
+        print(f'{name:>26}: {rate:10.0f} events per second')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import threading
+import time
+
+from cpo import *
+from cpo import metrics
+
+def rendezvous(waits: bool, n: int = 100000) -> float:
+    """Returns the rendezvous per second of a OneOne, with or without its
+    waits observed"""
+    c = OneOne()
+    if not waits:
+        c._read_waits = c._write_waits = None
+    def reader():
+        for _ in range(n):
+            ~c
+    t = threading.Thread(target=reader)
+    start = time.perf_counter()
+    t.start()
+    for x in range(n):
+        c << x
+    t.join()
+    return n / (time.perf_counter() - start)
+
+def observes(n: int = 1000000) -> float:
+    """Returns the observations per second of a histogram"""
+    h = metrics.Histogram('bench', {})
+    start = time.perf_counter()
+    for x in range(n):
+        h.observe(x)
+    return n / (time.perf_counter() - start)
+
+def scrape(channels: int = 1000) -> float:
+    """Returns the seconds taken to render the metrics of channels
+    channels"""
+    chans = [OneOne() for _ in range(channels)]
+    start = time.perf_counter()
+    metrics.render()
+    elapsed = time.perf_counter() - start
+    del chans
+    return elapsed
+
+def run_bench():
+    return {
+        'rendezvous, waits not observed': rendezvous(False),
+        'rendezvous, waits observed': rendezvous(True),
+        'histogram observes': observes(),
+    }
+
+def main():
+    for name, rate in run_bench().items():
+        print(f'{name:>32}: {rate:10.0f} per second')
+    print(f'{"scrape of 1000 channels":>32}: {scrape() * 1000:10.2f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import time
+
+from cpo import *
+from cpo import net
+
+def messages_per_second(n: int, size: int, coalesce_delay: float) -> float:
+    """Returns the messages per second passed over a loopback TCP channel,
+    by a connection which lets small frames gather for coalesce_delay"""
+    server = NetServer(('127.0.0.1', 0), window=256)
+    inp = server.in_port('bench')
+    pool = net.ConnectionPool(coalesce_delay=coalesce_delay)
+    out = NetOutPort(server.address, 'bench', pool=pool)
+    payload = bytes(size)
+    writer = fork(proc(lambda: [out << payload for _ in range(n)]))
+    start = time.perf_counter()
+    for _ in range(n):
+        ~inp
+    elapsed = time.perf_counter() - start
+    writer.join()
+    stats = f'{pool.connections[server.address]}'
+    pool.close()
+    server.close()
+    return n / elapsed, stats
+
+def run_bench(n: int = 20000, sizes=(16, 1024)):
+    results = {}
+    for size in sizes:
+        results[size] = {
+            'no coalescing': messages_per_second(n, size, 0),
+            'coalescing': messages_per_second(n, size, 0.0002),
+        }
+    return results
+
+def main():
+    for size, rates in run_bench().items():
+        for name, (rate, stats) in rates.items():
+            print(f'{size:>6} byte payloads, {name:>13}: '
+                  f'{rate:8.0f} messages per second, {stats}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+import time
+
+from cpo import *
+
+def runs_per_second(run, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        run()
+    return n / (time.perf_counter() - start)
+
+def run_bench(n: int = 2000, width: int = 3):
+    @procs(range(width))
+    def workers(i):
+        pass
+    p = workers | (workers | workers)
+    return {
+        # what each run cost before Par was compiled once
+        'recompiled': runs_per_second(lambda: Par(p.name, p.procs)(), n),
+        'compiled once': runs_per_second(p, n),
+    }
+
+def main():
+    for name, rate in run_bench().items():
+        print(f'{name:>14}: {rate:8.0f} runs per second')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import contextlib
+import threading
+import time
+from typing import Optional
+
+from cpo import *
+from cpo import threads
+
+class EventParkingLot:
+    """The parking scheme which preceded threads.Parker, an Event is
+    allocated and entered into a global dict on every park. An unpark which
+    arrives before the park is lost, so we bound each park to stop the
+    ping pong from deadlocking; any lost wakeups show up as latency."""
+
+    def __init__(self, max_park: float = 0.01):
+        self.max_park = max_park
+        self.parking_lot = {}
+
+    def park_current_thread(self, timeout: Optional[Nanoseconds] = None):
+        timeout_sec = self.max_park if timeout is None \
+            else min(timeout.to_seconds(), self.max_park)
+        ident = threading.get_ident()
+        self.parking_lot[ident] = threading.Event()
+        self.parking_lot[ident].wait(timeout=timeout_sec)
+        self.parking_lot[ident].clear()
+        del self.parking_lot[ident]
+
+    def unpark(self, blocker: Optional[threading.Thread]):
+        if blocker is None:
+            return
+        pl = self.parking_lot.get(blocker.ident)
+        if pl is not None:
+            pl.set()
+
+@contextlib.contextmanager
+def parking_with(lot: Optional[EventParkingLot]):
+    if lot is None:
+        yield
+        return
+    park, unpark = threads.park_current_thread, threads.unpark
+    threads.park_current_thread, threads.unpark = \
+        lot.park_current_thread, lot.unpark
+    try:
+        yield
+    finally:
+        threads.park_current_thread, threads.unpark = park, unpark
+
+def ping_pong(n: int, make_channel=OneOne) -> float:
+    """Returns the mean round trip time in microseconds of n rendezvous
+    round trips between two processes over a pair of channels."""
+    ping, pong = make_channel(), make_channel()
+
+    @proc
+    def pinger():
+        for i in range(n):
+            ping << i
+            ~pong
+        ping.close()
+
+    @proc
+    @repeat
+    def ponger():
+        pong << ~ping
+
+    start = time.perf_counter()
+    (pinger | ponger)()
+    return (time.perf_counter() - start) / n * 1e6
+
+def run_bench(n: int = 10000):
+    results = {}
+    with parking_with(EventParkingLot()):
+        results['event per park'] = ping_pong(n)
+    results['parker'] = ping_pong(n)
+    return results
+
+def main():
+    for name, us in run_bench().items():
+        print(f'{name:>16}: {us:8.2f}us per rendezvous round trip')
+
+if __name__ == '__main__':
+    main()
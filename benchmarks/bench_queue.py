@@ -0,0 +1,71 @@
+import queue as _queue
+import time
+
+from cpo import *
+from cpo import queue
+
+class QueueQueue(queue.Queue):
+    """The LockFreeQueue which preceded GILQueue, a queue.Queue, which takes
+    its mutex for every operation"""
+
+    def __init__(self):
+        self.queue = _queue.Queue()
+
+    def enqueue(self, value) -> None:
+        self.queue.put(value, block=False)
+
+    def dequeue(self):
+        try:
+            return self.queue.get(block=False)
+        except _queue.Empty:
+            return None
+
+    def peek(self):
+        with self.queue.mutex:
+            return next(iter(self.queue.queue), None)
+
+def stress(Backend, n: int = 200, m: int = 1000) -> float:
+    """Returns the operations per second of test_stress_queue, with n
+    readers and n writers of m values each"""
+    q = Backend()
+    @procs(range(n))
+    def readers(i):
+        for _ in range(m):
+            q.dequeue()
+    @procs(range(n))
+    def writers(i):
+        for x in range(m):
+            q.enqueue((i, x))
+    start = time.perf_counter()
+    (readers | writers)()
+    return 2 * n * m / (time.perf_counter() - start)
+
+def peeks(Backend, n: int = 1000000) -> float:
+    """Returns the peeks per second of a queue of 100 values"""
+    q = Backend()
+    for x in range(100):
+        q.enqueue(x)
+    start = time.perf_counter()
+    for _ in range(n):
+        q.peek()
+    return n / (time.perf_counter() - start)
+
+BACKENDS = {
+    'queue.Queue': QueueQueue,
+    'LockedQueue': queue.LockedQueue,
+    'GILQueue': queue.GILQueue,
+}
+
+def run_bench():
+    results = {}
+    for name, Backend in BACKENDS.items():
+        results[f'stress, {name}'] = stress(Backend)
+        results[f'peek, {name}'] = peeks(Backend)
+    return results
+
+def main():
+    for name, rate in run_bench().items():
+        print(f'{name:>20}: {rate:10.0f} ops per second')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import threading
+import time
+
+from cpo import *
+from cpo import conc
+
+def percentile(sorted_values, p: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1,
+                             int(p * len(sorted_values)))]
+
+def latencies(acquire, release, n: int = 16, per: int = 500):
+    """Returns the sorted acquisition latencies, in microseconds, of n
+    processes each acquiring per times under contention, and the fewest and
+    most acquisitions any process managed in the time the first finished"""
+    times = [[] for _ in range(n)]
+    counts = [0] * n
+    first_done = threading.Event()
+    snapshot = []
+    start_together = threading.Barrier(n)
+    @procs(range(n))
+    def workers(i):
+        start_together.wait()
+        for _ in range(per):
+            start = time.perf_counter()
+            acquire()
+            times[i].append(time.perf_counter() - start)
+            counts[i] += 1
+            # hold the semaphore while letting the others run, so that they
+            # contend for it rather than each run through under the GIL
+            time.sleep(0)
+            release()
+        if not first_done.is_set():
+            first_done.set()
+            snapshot.extend(counts)
+    workers()
+    result = sorted(t * 1e6 for ts in times for t in ts)
+    return result, min(snapshot), max(snapshot)
+
+def fair_and_unfair():
+    for fair in [False, True]:
+        mode = 'fair' if fair else 'unfair'
+        s = BooleanSemaphore(available=True, fair=fair)
+        yield f'BooleanSemaphore, {mode}', s.acquire, s.release
+        s = CountingSemaphore(2, fair=fair)
+        yield f'CountingSemaphore(2), {mode}', s.acquire, s.release
+    lock = conc.RLockClass()
+    yield 'RLock', lock.acquire, lock.release
+    lock = conc.FairRLock()
+    yield 'FairRLock', lock.acquire, lock.release
+
+def chunks(fair: bool, bulk: bool, n: int = 64, rounds: int = 5000) -> float:
+    """Returns the seconds per round of taking and returning n permits,
+    either in one step or one at a time"""
+    s = CountingSemaphore(n, fair=fair)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        if bulk:
+            s.acquire(n)
+            s.release(n)
+        else:
+            for _ in range(n):
+                s.acquire()
+            for _ in range(n):
+                s.release()
+    return (time.perf_counter() - start) / rounds
+
+def run_bench():
+    results = {}
+    for name, acquire, release in fair_and_unfair():
+        values, fewest, most = latencies(acquire, release)
+        results[name] = (percentile(values, 0.5), percentile(values, 0.99),
+                         percentile(values, 0.999), fewest, most)
+    return results
+
+def run_bulk_bench():
+    results = {}
+    for fair in [False, True]:
+        mode = 'fair' if fair else 'unfair'
+        results[f'64 one at a time, {mode}'] = chunks(fair, False)
+        results[f'64 in one step, {mode}'] = chunks(fair, True)
+    return results
+
+def main():
+    for name, (p50, p99, p999, fewest, most) in run_bench().items():
+        print(f'{name:>26}: p50 {p50:8.1f}us  p99 {p99:8.1f}us  '
+              f'p999 {p999:8.1f}us  acquisitions {fewest}-{most}')
+    for name, took in run_bulk_bench().items():
+        print(f'{name:>26}: {took * 1e6:8.1f}us per round')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import multiprocessing
+import time
+
+from cpo import *
+
+def write_shm(c, n: int, size: int) -> None:
+    payload = bytes(size)
+    for _ in range(n):
+        c << payload
+    c.close_out()
+
+def write_pipe(conn, n: int, size: int) -> None:
+    payload = bytes(size)
+    for _ in range(n):
+        conn.send(payload)
+    conn.send(None)
+
+def shm_throughput(n: int, size: int, view: bool = False) -> float:
+    """Returns the GB/s passed from a writer process to this one over a
+    ShmOneOne channel, reading copies of the values or, if view, views onto
+    their slots"""
+    ctx = multiprocessing.get_context('spawn')
+    c = ShmOneOne(slots=8, slot_size=size)
+    writer = ctx.Process(target=write_shm, args=(c, n, size))
+    writer.start()
+    # wait for the writer to start before timing
+    received = len(~c)
+    start = time.perf_counter()
+    if view:
+        while True:
+            try:
+                with c.view() as value:
+                    received += len(value)
+            except Closed:
+                break
+    else:
+        for value in c:
+            received += len(value)
+    elapsed = time.perf_counter() - start
+    writer.join()
+    return (received - size) / elapsed / 1e9
+
+def pipe_throughput(n: int, size: int) -> float:
+    """Returns the GB/s passed from a writer process to this one by pickling
+    over a pipe"""
+    ctx = multiprocessing.get_context('spawn')
+    recv, send = ctx.Pipe(duplex=False)
+    writer = ctx.Process(target=write_pipe, args=(send, n, size))
+    writer.start()
+    received = len(recv.recv())
+    start = time.perf_counter()
+    while True:
+        payload = recv.recv()
+        if payload is None:
+            break
+        received += len(payload)
+    elapsed = time.perf_counter() - start
+    writer.join()
+    return (received - size) / elapsed / 1e9
+
+def run_bench(sizes=(1 << 12, 1 << 16, 1 << 20, 1 << 23),
+              total: int = 1 << 30):
+    results = {}
+    for size in sizes:
+        n = max(total // size, 10)
+        results[size] = {
+            'pickle over pipe': pipe_throughput(n, size),
+            'ShmOneOne': shm_throughput(n, size),
+            'ShmOneOne view': shm_throughput(n, size, view=True),
+        }
+    return results
+
+def main():
+    for size, rates in run_bench().items():
+        print(f'{size:>8} byte payloads: ' + ', '.join(
+            f'{name} {rate:6.2f} GB/s' for name, rate in rates.items()))
+
+if __name__ == '__main__':
+    main()
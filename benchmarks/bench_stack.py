@@ -0,0 +1,57 @@
+import contextlib
+import time
+
+from cpo import *
+from cpo import executor
+
+def memory_kib(field: str) -> int:
+    """A field of /proc/self/status, in KiB"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return 0
+
+@contextlib.contextmanager
+def executor_with(ex: executor.CPOExecutor):
+    orig = executor.executor
+    executor.executor = ex
+    try:
+        yield ex
+    finally:
+        executor.executor = orig
+        ex.shutdown()
+
+def fan_out(n: int, stack_size: int):
+    """Returns the growth in virtual and resident memory, in MiB, while n
+    processes with the given stack size are blocked at once"""
+    ex = executor.SizePooledExecutor(Nanoseconds.from_seconds(1), False)
+    with executor_with(ex):
+        go = N2NBuf(size=0, writers=1, readers=n)
+        vm, rss = memory_kib('VmSize'), memory_kib('VmRSS')
+        handles = [Simple(lambda: ~go).with_stack_size(stack_size).fork()
+                   for _ in range(n)]
+        while ex.stats().get(ex.bucket(stack_size), {}).get('live', 0) < n:
+            time.sleep(0.01)
+        grown = ((memory_kib('VmSize') - vm) / 1024,
+                 (memory_kib('VmRSS') - rss) / 1024)
+        go.write_many(range(n))
+        for handle in handles:
+            handle.join()
+    # let the threads exit before anything else is measured
+    while any(stats['live'] for stats in ex.stats().values()):
+        time.sleep(0.01)
+    return grown
+
+def run_bench(n: int = 2000):
+    return {
+        f'{n} processes, default stack': fan_out(n, 0),
+        f'{n} processes, 32KiB stack': fan_out(n, 32 * 1024),
+    }
+
+def main():
+    for name, (vm, rss) in run_bench().items():
+        print(f'{name:>32}: {vm:8.1f}MiB virtual, {rss:6.1f}MiB resident')
+
+if __name__ == '__main__':
+    main()
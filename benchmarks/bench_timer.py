@@ -0,0 +1,49 @@
+import contextlib
+import time
+
+from cpo import *
+from cpo import threads
+from cpo import timer
+
+@contextlib.contextmanager
+def timer_parks(enabled: bool):
+    """Park timed waits on the timer service, as timerPARKS does, or not"""
+    orig = threads.timer_parks
+    threads.timer_parks = enabled
+    try:
+        yield
+    finally:
+        threads.timer_parks = orig
+
+def timed_reads(readers: int, n: int, timeout_us: float = 200) -> float:
+    """Returns the mean microseconds per round of timed reads, for readers
+    processes each making n timed reads of an idle channel, which all time
+    out"""
+    timeout = Nanoseconds.from_seconds(timeout_us * 1e-6)
+    chans = [OneOne() for _ in range(readers)]
+
+    @procs(range(readers))
+    def reader(i):
+        c = chans[i]
+        for _ in range(n):
+            c.read_before(timeout)
+
+    start = time.perf_counter()
+    reader()
+    return (time.perf_counter() - start) / n * 1e6
+
+def run_bench(readers: int = 200, n: int = 50):
+    results = {}
+    with timer_parks(False):
+        results['timeout per park'] = timed_reads(readers, n)
+    with timer_parks(True):
+        results['timer service'] = timed_reads(readers, n)
+    return results
+
+def main():
+    for name, us in run_bench().items():
+        print(f'{name:>18}: {us:8.2f}us per round of timed out reads')
+    print(f'{"":>18}  {timer.timers}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+from cpo import *
+
+from .bench_parking import ping_pong
+
+def run_bench(n: int = 10000, spins=(1, 10, 100, 1000)):
+    strategies = [ParkWait()] + [SpinParkWait(spin) for spin in spins]
+    results = {}
+    for strategy in strategies:
+        us = ping_pong(n, lambda: OneOne(wait_strategy=strategy))
+        results[str(strategy)] = us
+    return results
+
+def main():
+    for name, us in run_bench().items():
+        print(f'{us:8.2f}us per rendezvous round trip with {name}')
+
+if __name__ == '__main__':
+    main()
@@ -6,19 +6,28 @@ MIN_PYTHON = (3, 7)
 if _sys.version_info < MIN_PYTHON:
     _sys.exit('Python 3.7+ is required')
 
-from .atomic import Atomic, AtomicNum, AtomicCounter
+from .alternation import alt, prialt, serve, priserve, InEvent, OutEvent, \
+    After, OrElse
+from .atomic import Atomic, AtomicNum, AtomicCounter, StripedCounter
 from .barrier import Barrier, CombiningBarrier, AndBarrier, OrBarrier
 from .channel import OneOne, N2N, OneMany, ManyOne, ManyMany, OneOneBuf, \
-    N2NBuf, FaultyOneOne
+    N2NBuf, FaultyOneOne, Ticker, after
 from .debugger import DEBUGGER
+from .deadlock import Deadlock, DeadlockDetector
 from .flag import Flag
+from .isolate import Isolated
 from .lock import SimpleLock
 from .logger import Logger, LOG
 from .meta import proc, procs, ordered_procs, attempt, repeat, fork, fork_proc,\
-    fork_procs, stop, gen_proc, fork_gen_proc
+    fork_procs, stop, gen_proc, fork_gen_proc, isolated_proc, isolated_procs, \
+    async_proc
 from .monitor import Monitor
+from .net import NetServer, NetInPort, NetOutPort, PickleCodec, BytesCodec
 from .process import Simple, IterToChannel, SKIP, Par,  OrderedProcs,\
-    ParSyntax, OrderedSyntax
-from .queue import LockFreeQueue
+    ParSyntax, OrderedSyntax, AsyncProc
+from .queue import LockFreeQueue, LockFreeDequeue
 from .semaphore import BooleanSemaphore, CountingSemaphore
-from .util import Closed, Crashed, Stopped, Nanoseconds
+from .shm import ShmOneOne, ShmN2NBuf
+from .trace import TraceSink
+from .util import Abort, Cancelled, Closed, Crashed, Stopped, Nanoseconds
+from .wait import ParkWait, SpinParkWait
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import threading
+from typing import Awaitable, Callable, Optional
+import weakref
+
+from . import util
+from .util import Nanoseconds
+
+# A coroutine which waits on a channel takes the place of a thread in the
+# channel's reader or writer slot. The Strand standing in for its task has a
+# parker of its own, which threads.unpark finds as it would a thread's, so
+# channels wake tasks and threads alike, whichever side of the channel they
+# are on.
+
+class AsyncParker:
+    """The parker of a task. As with threads.Parker, an unpark which arrives
+    before the matching park is not lost. Unpark may be called from any
+    thread, park only from the task's event loop."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop,
+                 loop_ident: int) -> None:
+        self.loop = loop
+        self.loop_ident = loop_ident
+        self._permit = False
+        self._waiter: Optional[asyncio.Future] = None
+
+    def _wake(self) -> None:
+        self._permit = True
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def unpark(self) -> None:
+        """Make the permit available. Permits do not accumulate."""
+        if threading.get_ident() == self.loop_ident:
+            self._wake()
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._wake)
+
+    async def park(self, timeout: Optional[Nanoseconds] = None) -> bool:
+        """Consume the permit, suspending the task for up to timeout for it to
+        be made available. Returns whether the permit was consumed."""
+        if not self._permit:
+            self._waiter = self.loop.create_future()
+            timer = None
+            if timeout is not None:
+                timer = self.loop.call_later(
+                    max(timeout.to_seconds(), 0),
+                    lambda w=self._waiter: w.done() or w.set_result(None))
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+                if timer is not None:
+                    timer.cancel()
+        permit, self._permit = self._permit, False
+        return permit
+
+    def has_permit(self) -> bool:
+        return self._permit
+
+    def __repr__(self) -> str:
+        return f'AsyncParker({self.loop})'
+
+
+class Strand:
+    """Stands in for the thread of a task, wherever a channel or the
+    debugger expects one"""
+
+    daemon = True
+    ident = None
+
+    def __init__(self, task: asyncio.Task,
+                 loop: asyncio.AbstractEventLoop) -> None:
+        get_name = getattr(task, 'get_name', None)
+        self.name = get_name() if get_name is not None else f'Task-{id(task)}'
+        self.task = weakref.ref(task)
+        self._cpo_parker = AsyncParker(loop, threading.get_ident())
+
+    def getName(self) -> str:
+        return self.name
+
+    def setName(self, name: str) -> None:
+        self.name = name
+
+    def is_alive(self) -> bool:
+        task = self.task()
+        return task is not None and not task.done()
+
+    async def park(self, timeout: Optional[Nanoseconds] = None) -> bool:
+        return await self._cpo_parker.park(timeout)
+
+    def __repr__(self) -> str:
+        return f'Strand({self.name})'
+
+_strands: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+def current_strand() -> Strand:
+    """The strand of the running task"""
+    task = asyncio.current_task()
+    if task is None:
+        raise RuntimeError('cpo async operations must be awaited in a task')
+    strand = _strands.get(task)
+    if strand is None:
+        strand = _strands[task] = Strand(task, asyncio.get_running_loop())
+    return strand
+
+async def wait_until(strand: Strand, condition: Callable[[], bool]) -> None:
+    """Suspend the task until condition holds, rechecking it whenever the
+    task is unparked"""
+    while not condition():
+        await strand.park()
+
+async def wait_until_elapsed_or(strand: Strand, timeout: Nanoseconds,
+                                condition: Callable[[], bool]) -> Nanoseconds:
+    """As threads.park_current_thread_until_elapsed_or, for a task"""
+    deadline = timeout + util.nano_time()
+    left = timeout
+    while left > 0 and not condition():
+        await strand.park(left)
+        left = deadline - util.nano_time()
+    return left
+
+
+class EventLoopThread:
+    """An event loop running forever in a daemon thread of its own. Async
+    processes run as tasks on the shared loop, so they need no thread each."""
+
+    def __init__(self, name: str = 'cpo-asyncio') -> None:
+        self.loop = asyncio.new_event_loop()
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=name,
+                                       daemon=True)
+        self.thread.start()
+        self.started.wait()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self.started.set)
+        self.loop.run_forever()
+
+    def in_loop(self) -> bool:
+        """Whether the caller is running on the loop's thread"""
+        return threading.current_thread() is self.thread
+
+    def submit(self, coro: Awaitable) -> concurrent.futures.Future:
+        """Run coro as a task on the loop, from any thread"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, fn: Callable, *args) -> None:
+        """Call fn on the loop, from any thread"""
+        if self.in_loop():
+            self.loop.call_soon(fn, *args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+_loop_thread: Optional[EventLoopThread] = None
+_loop_lock = threading.Lock()
+
+def get_loop_thread() -> EventLoopThread:
+    """The shared event loop, which is started on first use"""
+    global _loop_thread
+    if _loop_thread is None:
+        with _loop_lock:
+            if _loop_thread is None:
+                _loop_thread = EventLoopThread()
+    return _loop_thread
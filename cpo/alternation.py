@@ -1,4 +1,330 @@
+import collections
+import random
+import threading
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, \
+    Tuple, TypeVar, Union
 
-raise NotImplementedError
+from .channel import CLOSEDSTATE, READYSTATE, InPort, OutPort, PortListener, \
+    PortState
+from . import threads
+from . import timer
+from . import util
+from .util import Nanoseconds
 
-# `nyi. TODO
\ No newline at end of file
+T = TypeVar('T')
+
+Guard = Union[bool, Callable[[], bool]]
+
+def _holds(guard: Guard) -> bool:
+    return guard() if callable(guard) else guard
+
+# returned by commit when the port closed before its action completed
+_CLOSED = object()
+
+class Event:
+    """A branch of an alternation, which may only be chosen while its guard
+    holds. A guard may be a bool or a function, which is evaluated once each
+    time the alternation chooses a branch."""
+
+    def __init__(self, guard: Guard = True) -> None:
+        self.guard = guard
+
+    def is_enabled(self) -> bool:
+        return _holds(self.guard)
+
+
+class PortEvent(Event):
+    """A branch which is chosen once its port is ready"""
+
+    def state(self) -> PortState:
+        raise NotImplementedError
+
+    def is_feasible(self) -> bool:
+        return self.is_enabled() and self.state() is not CLOSEDSTATE
+
+    def add_listener(self, listener: PortListener) -> None:
+        raise NotImplementedError
+
+    def remove_listener(self, listener: PortListener) -> None:
+        raise NotImplementedError
+
+    def commit(self) -> Any:
+        """Perform the port's action and run the branch. Returns the result of
+        the branch, or _CLOSED if the port closed first."""
+        raise NotImplementedError
+
+
+class InEvent(PortEvent):
+    """Read a value from port and pass it to fn"""
+
+    def __init__(self, port: InPort[T], fn: Callable[[T], Any],
+                 guard: Guard = True) -> None:
+        """
+
+        Args:
+            port: The port to read from.
+            fn: The body of the branch, called with the value read.
+            guard: Whether the branch may be chosen.
+        """
+        super().__init__(guard)
+        self.port = port
+        self.fn = fn
+
+    def state(self) -> PortState:
+        return self.port.in_port_state
+
+    def add_listener(self, listener: PortListener) -> None:
+        self.port.add_in_listener(listener)
+
+    def remove_listener(self, listener: PortListener) -> None:
+        self.port.remove_in_listener(listener)
+
+    def commit(self) -> Any:
+        try:
+            value = ~self.port
+        except util.Closed:
+            return _CLOSED
+        return self.fn(value)
+
+
+class OutEvent(PortEvent):
+    """Write the value of value() to port, then call then"""
+
+    def __init__(self, port: OutPort[T], value: Callable[[], T],
+                 then: Optional[Callable[[], Any]] = None,
+                 guard: Guard = True) -> None:
+        """
+
+        Args:
+            port: The port to write to.
+            value: Computes the value to write, once the branch is chosen.
+            then: The body of the branch, called after the write.
+            guard: Whether the branch may be chosen.
+        """
+        super().__init__(guard)
+        self.port = port
+        self.value = value
+        self.then = then
+
+    def state(self) -> PortState:
+        return self.port.out_port_state
+
+    def add_listener(self, listener: PortListener) -> None:
+        self.port.add_out_listener(listener)
+
+    def remove_listener(self, listener: PortListener) -> None:
+        self.port.remove_out_listener(listener)
+
+    def commit(self) -> Any:
+        value = self.value()
+        try:
+            self.port << value
+        except util.Closed:
+            return _CLOSED
+        return None if self.then is None else self.then()
+
+
+class After(Event):
+    """Chosen if no port event has been chosen within timeout"""
+
+    def __init__(self, timeout: Nanoseconds, fn: Callable[[], Any],
+                 guard: Guard = True) -> None:
+        super().__init__(guard)
+        self.timeout = timeout
+        self.fn = fn
+
+
+class OrElse(Event):
+    """Chosen if no port event is feasible, that is if each has a false guard
+    or a closed port"""
+
+    def __init__(self, fn: Callable[[], Any], guard: Guard = True) -> None:
+        super().__init__(guard)
+        self.fn = fn
+
+
+class Alternation:
+    """Chooses between the branches of an alternation on behalf of a single
+    process. The process listens to the port of each feasible branch and
+    parks until one of them signals a port event, so a waiting alternation
+    costs nothing however many ports it has, and a wake up only rechecks the
+    ports which signalled."""
+
+    def __init__(self, events: Sequence[Event], priority: bool) -> None:
+        """
+
+        Args:
+            events: The branches to choose between.
+            priority: Whether ready branches are chosen in the order given,
+                rather than fairly.
+        """
+        self.ports: List[PortEvent] = []
+        self.after: Optional[After] = None
+        self.orelse: Optional[OrElse] = None
+        for event in events:
+            if isinstance(event, PortEvent):
+                self.ports.append(event)
+            elif isinstance(event, After):
+                if self.after is not None:
+                    raise ValueError('An alternation may have one After')
+                self.after = event
+            elif isinstance(event, OrElse):
+                if self.orelse is not None:
+                    raise ValueError('An alternation may have one OrElse')
+                self.orelse = event
+            else:
+                raise TypeError(f'Not an alternation event: {event}')
+        self.priority = priority
+        self.start = 0 if priority or not self.ports \
+            else random.randrange(len(self.ports))
+        self.thread = threading.current_thread()
+        # indices of ports which have signalled since they were last checked
+        self.fired: Deque[int] = collections.deque()
+        self.listeners: Dict[int, PortListener] = {}
+
+    def _listener(self, i: int) -> PortListener:
+        def listener(port_state: PortState) -> None:
+            self.fired.append(i)
+            threads.unpark(self.thread)
+        return listener
+
+    def _listen(self, feasible: List[int]) -> None:
+        """Listen to exactly the feasible ports, keeping the listeners of a
+        previous choice where they are still wanted"""
+        wanted = set(feasible)
+        for i in [i for i in self.listeners if i not in wanted]:
+            self.ports[i].remove_listener(self.listeners.pop(i))
+        for i in feasible:
+            if i not in self.listeners:
+                listener = self.listeners[i] = self._listener(i)
+                self.ports[i].add_listener(listener)
+
+    def close(self) -> None:
+        """Stop listening to every port"""
+        for i, listener in self.listeners.items():
+            self.ports[i].remove_listener(listener)
+        self.listeners.clear()
+
+    def _take_fired(self) -> List[int]:
+        fired = []
+        while self.fired:
+            fired.append(self.fired.popleft())
+        if self.priority:
+            return sorted(set(fired))
+        return list(dict.fromkeys(fired))
+
+    def _none_feasible(self,
+                       deadline: Optional[Nanoseconds]) -> Tuple[Event, Any]:
+        if self.orelse is not None and self.orelse.is_enabled():
+            return self.orelse, self.orelse.fn()
+        if deadline is not None:
+            threads.park_current_thread_until_deadline_or(
+                deadline, lambda: False)
+            return self.after, self.after.fn()
+        raise util.Abort()
+
+    def select(self) -> Tuple[Event, Any]:
+        """Wait for a branch to become ready, then run it.
+
+        Returns: The branch chosen, and its result. Raises Abort if no branch
+        is feasible and there is neither an OrElse nor an After.
+
+        """
+        assert threading.current_thread() is self.thread, \
+            'An alternation belongs to the process which created it'
+        deadline = None
+        if self.after is not None and self.after.is_enabled():
+            deadline = util.nano_time() + self.after.timeout
+        n = len(self.ports)
+        feasible = [i % n for i in range(self.start, self.start + n)
+                    if self.ports[i % n].is_feasible()]
+        # listen before looking at the ports, any port which becomes ready
+        # after it has been looked at then signals
+        self._listen(feasible)
+        self.fired.clear()
+        # a single timeout unparks us at the deadline, however often we wake
+        timeout = None
+        if deadline is not None and threads.timer_parks:
+            timeout = timer.timers.schedule(
+                deadline, threads.get_parker(self.thread).unpark)
+        try:
+            return self._select(feasible, deadline)
+        finally:
+            if timeout is not None:
+                timeout.cancel()
+
+    def _select(self, feasible: List[int],
+                deadline: Optional[Nanoseconds]) -> Tuple[Event, Any]:
+        n = len(self.ports)
+        live = set(feasible)
+        candidates = feasible
+        while True:
+            for i in candidates:
+                if i not in live:
+                    continue
+                state = self.ports[i].state()
+                if state is CLOSEDSTATE:
+                    live.discard(i)
+                elif state is READYSTATE:
+                    result = self.ports[i].commit()
+                    if result is _CLOSED:
+                        live.discard(i)
+                        continue
+                    if not self.priority:
+                        self.start = (i + 1) % n
+                    return self.ports[i], result
+            if not live:
+                return self._none_feasible(deadline)
+            if deadline is not None and deadline <= util.nano_time():
+                return self.after, self.after.fn()
+            if deadline is None or threads.timer_parks:
+                threads.park_current_thread()
+            else:
+                threads.park_current_thread(deadline - util.nano_time())
+            candidates = self._take_fired()
+
+
+def _alt(events: Sequence[Event], priority: bool) -> Any:
+    alternation = Alternation(events, priority)
+    try:
+        return alternation.select()[1]
+    finally:
+        alternation.close()
+
+def alt(*events: Event) -> Any:
+    """Wait until one of the feasible branches is ready and run it, choosing
+    fairly between branches which are ready together. A port taking part in
+    an alternation should not be used by another process on the same side
+    of its channel, nor by an alternation at the other end.
+
+    Returns: The result of the branch. Raises Abort if no branch is feasible
+    and there is neither an OrElse nor an After.
+    """
+    return _alt(events, priority=False)
+
+def prialt(*events: Event) -> Any:
+    """As alt, but choosing the first ready branch in the order given"""
+    return _alt(events, priority=True)
+
+def _serve(events: Sequence[Event], priority: bool) -> None:
+    alternation = Alternation(events, priority)
+    try:
+        while True:
+            event, _ = alternation.select()
+            if event is alternation.orelse:
+                break
+    except util.Stopped:
+        pass
+    finally:
+        alternation.close()
+
+def serve(*events: Event) -> None:
+    """Repeatedly alt between the branches, rotating their priority so that
+    each ready branch is served in turn, until no branch is feasible or a
+    branch raises Stopped. An OrElse branch is run as the serve finishes.
+    The serve listens to its ports throughout rather than once per choice."""
+    _serve(events, priority=False)
+
+def priserve(*events: Event) -> None:
+    """As serve, but choosing the first ready branch in the order given"""
+    _serve(events, priority=True)
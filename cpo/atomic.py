@@ -1,10 +1,19 @@
 
-from threading import Lock
+import itertools
+import sys
+from threading import Lock, local
 from typing import TypeVar, Generic
 
+def gil_enabled() -> bool:
+    """Whether the interpreter has a GIL. Free-threaded builds of CPython
+    3.13+ can run without one."""
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
 T = TypeVar('T')
-class Atomic(Generic[T]):
-    """A class providing a variable with atomic operations"""
+class LockedAtomic(Generic[T]):
+    """A class providing a variable with atomic operations, every operation
+    takes the lock. This is correct without a GIL."""
     # these atomic operations can be implemented much more effectively
     # at the machine level by using opcodes XCHG etc.
     def __init__(self, value: T) -> None:
@@ -23,7 +32,6 @@ class Atomic(Generic[T]):
 
         """
         with self._lock:
-            # is this lock needed?
             return self._value
 
     def set(self, v: T) -> None:
@@ -36,7 +44,6 @@ class Atomic(Generic[T]):
 
         """
         with self._lock:
-            # is this lock needed?
             self._value = v
 
     def get_and_set(self, v: T):
@@ -91,6 +98,23 @@ class Atomic(Generic[T]):
     def __repr__(self) -> str:
         return f'Atomic({repr(self._value)})'
 
+
+class GILAtomic(LockedAtomic[T]):
+    """A class providing a variable with atomic operations. Under the GIL a
+    single load of an attribute is already atomic, so get doesn't take the
+    lock. set still does, so that it is ordered with the read-modify-write
+    operations rather than being overwritten by one it races."""
+
+    def get(self) -> T:
+        """
+
+        Returns: The current value of the atomic
+
+        """
+        return self._value
+
+Atomic = GILAtomic if gil_enabled() else LockedAtomic
+
 TNum = TypeVar('TNum', int, float)
 class AtomicNum(Atomic[TNum]):
     """A class providing a number with atomic operations"""
@@ -132,3 +156,86 @@ class AtomicCounter(AtomicNum):
 
     def __next__(self):
         return self.inc(1)
+
+
+class _Cell:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self, value) -> None:
+        self.value = value
+        self.lock = Lock()
+
+
+class StripedCounter:
+    """A counter for heavy contention, in the manner of Java's LongAdder.
+    Each thread increments its own cell, so threads only contend once there
+    are more of them than cells, and the cells are only added up by get."""
+
+    def __init__(self, value: int = 0, stripes: int = 64) -> None:
+        """
+
+        Args:
+            value: The initial value of the counter.
+            stripes: The number of cells to spread increments across.
+        """
+        assert stripes >= 1
+        self._cells = [_Cell(0) for _ in range(stripes)]
+        self._cells[0].value = value
+        self._next_cell = itertools.count()
+        self._local = local()
+
+    def _cell(self) -> _Cell:
+        try:
+            return self._local.cell
+        except AttributeError:
+            # next() on itertools.count is atomic in CPython, and a clash
+            # only costs us some contention
+            i = next(self._next_cell) % len(self._cells)
+            cell = self._local.cell = self._cells[i]
+            return cell
+
+    def inc(self, d: int) -> None:
+        """Increment the counter by d. Unlike AtomicNum this does not return
+        the new value, as that would mean adding up every cell.
+
+        Args:
+            d: The amount to increment the counter by.
+
+        Returns: None
+
+        """
+        cell = self._cell()
+        with cell.lock:
+            cell.value += d
+
+    def dec(self, d: int) -> None:
+        """Decrement the counter by d.
+
+        Args:
+            d: The amount to decrement the counter by.
+
+        Returns: None
+
+        """
+        self.inc(-d)
+
+    def get(self) -> int:
+        """The current value of the counter. This is only a snapshot if there
+        are concurrent updates.
+
+        Returns: The sum of the cells.
+
+        """
+        return sum(cell.value for cell in self._cells)
+
+    def reset(self) -> None:
+        """Set the counter back to zero"""
+        for cell in self._cells:
+            with cell.lock:
+                cell.value = 0
+
+    def __str__(self) -> str:
+        return str(self.get())
+
+    def __repr__(self) -> str:
+        return f'StripedCounter({self.get()})'
@@ -2,18 +2,27 @@
 from __future__ import annotations
 
 from abc import ABC
-import queue
+import asyncio
 import random
 import threading
-from typing import Generic, List, Optional, TypeVar, Callable
+import time
+from time import perf_counter_ns
+from typing import Generic, Iterable, List, Optional, Tuple, TypeVar, \
+    Callable
 
+from . import aio
 from .atomic import Atomic, AtomicNum
 from . import conc
+from . import metrics
 from .name import Named, NameGenerator
-from .register import Debuggable
+from .register import Debuggable, Sample
+from .ring import RingBuffer
 from . import threads
+from . import timer
+from . import trace
 from . import util
 from .util import Nanoseconds, Singleton, synced_print
+from . import wait
 
 class PortState(metaclass=Singleton):
     """A type denoting the state of readiness/commitment of a port. Used in the
@@ -50,6 +59,8 @@ class _READYSTATE(PortState):
 READYSTATE = _READYSTATE()
 
 
+PortListener = Callable[[PortState], None]
+
 TI = TypeVar('TI')
 O = TypeVar('O')
 class InPort(Generic[TI]):
@@ -75,6 +86,34 @@ class InPort(Generic[TI]):
         """
         raise NotImplementedError
 
+    def read_many(self, max_n: int,
+                  timeout: Optional[Nanoseconds] = None) -> List[TI]:
+        """ Block until at least one value is available, or timeout has
+        passed, then read and return up to max_n of the values which are
+        available without further waiting.
+
+        Args:
+            max_n: The maximum number of values to read.
+            timeout: The number of nanoseconds to wait, or None to wait
+                indefinitely.
+
+        Returns: The values read, which is empty only if the timeout passed.
+        Raises Closed if the channel closes before any value has been read.
+
+        """
+        raise NotImplementedError
+
+    async def aread(self) -> Optional[TI]:
+        """ Suspend the calling coroutine until a value is available, then
+        read and return it. Ports which cannot wake a coroutine themselves
+        read on a thread of the event loop's default executor.
+
+        Returns: The value from the channel.
+
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.__invert__)
+
     def __call__(self, func) -> InPortFunc[TI]:
         """Block until a value t is available, then return f(t).
         If our channel is c and our function is f, the full syntax is ~c(f).
@@ -113,6 +152,15 @@ class InPort(Generic[TI]):
         except util.Stopped:
             raise StopIteration
 
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.aread()
+        except util.Stopped:
+            raise StopAsyncIteration
+
 
 class InPortFunc(Generic[TI]):
 
@@ -131,6 +179,29 @@ class OutPort(Generic[TO]):
         """Output value to the port's channel"""
         raise NotImplementedError
 
+    async def awrite(self, value: TO) -> Optional[TO]:
+        """Output value to the port's channel, suspending the calling
+        coroutine rather than blocking its thread. Ports which cannot wake a
+        coroutine themselves write on a thread of the event loop's default
+        executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.__lshift__, value)
+
+    def write_many(self, values: Iterable[TO]) -> int:
+        """Output each of values to the port's channel, in order, paying for
+        the synchronisation once per batch rather than once per value.
+
+        Args:
+            values: The values to write.
+
+        Returns: The number of values accepted by the channel. This is less
+        than the number of values only if the channel closed partway through
+        the batch. Raises Closed if the channel closes before any value has
+        been accepted.
+
+        """
+        raise NotImplementedError
+
     def write_before(self, nswait: Nanoseconds, value: TO) -> bool:
         """Output value to the port's channel before nswait has elapsed and return
         true, or else false.
@@ -165,20 +236,66 @@ class Chan(InPort[T], OutPort[T], Named, Debuggable, ABC):
 
     def __init__(self):
         Debuggable.__init__(self)
+        # listeners are replaced rather than mutated so that events can
+        # iterate over them without taking the lock
+        self._listener_lock = threading.Lock()
+        self.in_listeners: Tuple[PortListener, ...] = ()
+        self.out_listeners: Tuple[PortListener, ...] = ()
 
     def close(self) -> None:
         """Signal that the channel is to be closed forthwith"""
         raise NotImplementedError
 
+    @property
+    def kind(self) -> str:
+        """The kind of channel, for metrics"""
+        return type(self).__name__.lstrip('_')
+
+    def get_blocked(self) -> Tuple[List[threading.Thread],
+                                   List[threading.Thread]]:
+        """The readers and the writers waiting on the channel"""
+        return [], []
+
+    def metrics(self) -> List[Sample]:
+        labels = {'channel': self.name, 'kind': self.kind}
+        readers, writers = self.get_blocked()
+        return [
+            ('cpo_channel_blocked_readers', labels, len(readers)),
+            ('cpo_channel_blocked_writers', labels, len(writers)),
+        ]
+
     def out_port_event(self, port_state: PortState) -> None:
         """The channel has just changd its state in a way that will affect
         out_port_state()"""
-        pass
+        for listener in self.out_listeners:
+            listener(port_state)
 
     def in_port_event(self, port_state: PortState) -> None:
         """The channel has just changd its state in a way that will affect
           in_port_state()"""
-        pass
+        for listener in self.in_listeners:
+            listener(port_state)
+
+    def add_in_listener(self, listener: PortListener) -> None:
+        """Call listener with the new state on each in port event. Used by
+        alternations to wait on many ports at once."""
+        with self._listener_lock:
+            self.in_listeners += (listener,)
+
+    def remove_in_listener(self, listener: PortListener) -> None:
+        with self._listener_lock:
+            self.in_listeners = tuple(
+                l for l in self.in_listeners if l is not listener)
+
+    def add_out_listener(self, listener: PortListener) -> None:
+        """Call listener with the new state on each out port event"""
+        with self._listener_lock:
+            self.out_listeners += (listener,)
+
+    def remove_out_listener(self, listener: PortListener) -> None:
+        with self._listener_lock:
+            self.out_listeners = tuple(
+                l for l in self.out_listeners if l is not listener)
 
 class SyncChan(Chan[T], ABC):
     """A channel which is guaranteed to be synchronous."""
@@ -194,29 +311,38 @@ class _OneOne(SyncChan[T]):
     """A synchronised channel to be used by at most one reader and at most one
      writer process simultaneously."""
 
-    def __init__(self, name):
+    def __init__(self, name, wait_strategy: Optional[wait.WaitStrategy] = None):
         """
 
         Args:
             name: The name of the channel for debugging.
+            wait_strategy: How processes wait to rendezvous, the default
+                strategy from cpo.config if None.
         """
         SyncChan.__init__(self)
         self.set_name(name)
+        self.wait_strategy = wait.get_wait_strategy(wait_strategy)
         self.reader: Atomic[Optional[threading.Thread]] = Atomic(None)
         self.writer: Atomic[Optional[threading.Thread]] = Atomic(None)
         self.closed, self.full = Atomic(False), Atomic(False)
         self.buffer = None
+        # a batch from write_many is handed over in a single rendezvous,
+        # the writer is released once the readers have taken all of it
+        self.batch: Optional[List[T]] = None
+        self.taken = 0
         self.reads = AtomicNum(0)
         self.writes = AtomicNum(0)
+        self._read_waits = metrics.waits(self.kind, 'read')
+        self._write_waits = metrics.waits(self.kind, 'write')
         self.register()
 
-    def _finished_read(self) -> int:
+    def _finished_read(self, n: int = 1) -> int:
         """Increment the count of finished reads"""
-        return self.reads.inc(1)
+        return self.reads.inc(n)
 
-    def _finished_write(self) -> int:
+    def _finished_write(self, n: int = 1) -> int:
         """Increment the count of finished writes"""
-        return self.writes.inc(1)
+        return self.writes.inc(n)
 
     def finished_rw(self) -> str:
         """Get a string repr of the number of finished reads and writes"""
@@ -254,7 +380,12 @@ class _OneOne(SyncChan[T]):
             result = "idle"
         else:
             if ww is not None:
-                if self.full.get():
+                batch = self.batch
+                if self.full.get() and batch is not None:
+                    result = f'write ({len(batch) - self.taken} of ' \
+                             f'{len(batch)} batched) from' \
+                             f' {threads.get_thread_identity(ww)}'
+                elif self.full.get():
                     result = f'write ({self.buffer}) from' \
                              f' {threads.get_thread_identity(ww)}'
                 else:
@@ -267,6 +398,40 @@ class _OneOne(SyncChan[T]):
         closed = "(CLOSED)" if self.closed.get() else ""
         return f'{self.name}: {closed} {self.current_state}'
 
+    def get_waiting(self) -> List[threading.Thread]:
+        """The reader or writer waiting for the other to arrive. While both
+        slots are taken the rendezvous is under way."""
+        readers, writers = self.get_blocked()
+        return readers + writers
+
+    def get_blocked(self) -> Tuple[List[threading.Thread],
+                                   List[threading.Thread]]:
+        reader, writer = self.reader.get(), self.writer.get()
+        if reader is None and writer is not None:
+            return [], [writer]
+        if writer is None and reader is not None:
+            return [reader], []
+        if writer is not None and not self.full.get():
+            # the reader has claimed the value and is taking it, as an
+            # extended rendezvous may take a while
+            return [], [writer]
+        return [], []
+
+    def get_blockers(self, thread: threading.Thread) -> List[threading.Thread]:
+        """A writer is blocked by a reader taking its value"""
+        reader = self.reader.get()
+        if thread is self.writer.get() and reader is not None and \
+                reader is not thread:
+            return [reader]
+        return []
+
+    def metrics(self) -> List[Sample]:
+        labels = {'channel': self.name, 'kind': self.kind}
+        return super().metrics() + [
+            ('cpo_channel_reads_total', labels, self.reads.get()),
+            ('cpo_channel_writes_total', labels, self.writes.get()),
+        ]
+
     def show_state(self, file) -> None:
         """Print the current state of the channel to file"""
         synced_print(f"CHANNEL {self.name}: {self.name_generator._kind} ",
@@ -285,11 +450,28 @@ class _OneOne(SyncChan[T]):
         self.full.set(True)
         self.in_port_event(READYSTATE)
         threads.unpark(self.reader.get())
-        while not self.closed.get() and self.full.get():
-            threads.park_current_thread()
-        if self.full.get():
+        # the reader clears the writer slot once it has taken the value, we
+        # wait on that rather than on full, which another writer may have
+        # set again before we are scheduled
+        start = perf_counter_ns()
+        sink = trace.sink
+        if sink is not None:
+            sink.record(trace.WRITE, self.name)
+        try:
+            self.wait_strategy.wait_until(
+                lambda: self.closed.get() or self.writer.get() is not current
+            )
+        except util.Cancelled:
+            self._withdraw_write(current)
+            raise
+        finally:
+            # a cancelled write ends too, so its slice is closed
+            if sink is not None:
+                sink.record(trace.WRITE_END, self.name)
+        if self._write_waits is not None:
+            self._write_waits.observe(perf_counter_ns() - start)
+        if self.writer.get() is current:
             self.check_open()
-        self.writer.set(None)
         self._finished_write()
         return value
 
@@ -307,23 +489,217 @@ class _OneOne(SyncChan[T]):
                                   f'[{threads.get_thread_identity(last_reader)}]' \
                                   f' in {threads.get_thread_identity(current)}'
         self.out_port_event(READYSTATE)
-        while not self.closed.get() and not self.full.get():
-            threads.park_current_thread()
+        start = perf_counter_ns()
+        sink = trace.sink
+        if sink is not None:
+            sink.record(trace.READ, self.name)
+        try:
+            self._claim_before(None)
+        except util.Cancelled:
+            self._withdraw_read(current)
+            raise
+        finally:
+            if sink is not None:
+                sink.record(trace.READ_END, self.name)
+        if self._read_waits is not None:
+            self._read_waits.observe(perf_counter_ns() - start)
+        return self._take(fn)
+
+    def _readable(self) -> bool:
+        return self.closed.get() or self.full.get()
+
+    # A writer offers a value by setting full, and may withdraw it until a
+    # reader has taken it. Both claim the value by setting full from True to
+    # False, so only one of them can: the reader takes the value only if its
+    # claim wins, and the writer withdraws it only if its claim wins.
+
+    def _claim(self) -> bool:
+        return self.full.compare_and_set(True, False)
+
+    def _claim_before(self, deadline: Optional[Nanoseconds]) -> bool:
+        """Wait for a value, until deadline if there is one, and claim it.
+        Returns False if the deadline passed first."""
+        while True:
+            if deadline is None:
+                self.wait_strategy.wait_until(self._readable)
+            else:
+                threads.park_current_thread_until_deadline_or(
+                    deadline, self._readable)
+            self.check_open()
+            if self._claim():
+                return True
+            # the writer withdrew the value
+            if deadline is not None and deadline <= util.nano_time():
+                return False
+
+    def _withdraw_read(self, current) -> None:
+        """The waiting reader, current, has given up"""
+        self.reader.compare_and_set(current, None)
+
+    def _withdraw_write(self, current) -> bool:
+        """The waiting writer, current, has given up. Withdraw what it
+        offered, unless a reader has claimed it, in which case wait for the
+        reader to finish with it. Returns whether it was withdrawn."""
+        while self.writer.get() is current:
+            if self._claim():
+                self.buffer = None
+                self.batch = None
+                self.writer.compare_and_set(current, None)
+                return True
+            # a reader is taking the value, or the next of a batch
+            time.sleep(0)
+        return False
+
+    async def aread(self) -> T:
+        self.check_open()
+        current = aio.current_strand()
+        last_reader = self.reader.get_and_set(current)
+        assert last_reader is None, f'~c overtaking ' \
+                                  f'[{threads.get_thread_identity(last_reader)}]' \
+                                  f' in {threads.get_thread_identity(current)}'
+        self.out_port_event(READYSTATE)
+        try:
+            while True:
+                await aio.wait_until(current, self._readable)
+                self.check_open()
+                if self._claim():
+                    break
+        except asyncio.CancelledError:
+            self._withdraw_read(current)
+            raise
+        return self._take(util.identity_fn)
+
+    async def awrite(self, value: T) -> T:
         self.check_open()
-        result = fn(self.buffer)
+        current = aio.current_strand()
+        last_writer = self.writer.get_and_set(current)
+        assert last_writer is None, f'c << {value} overtaking ' \
+                                f'[{threads.get_thread_identity(last_writer)}]' \
+                                f' in {threads.get_thread_identity(current)}'
+        self.buffer = value
+        self.full.set(True)
+        self.in_port_event(READYSTATE)
+        threads.unpark(self.reader.get())
+        try:
+            await aio.wait_until(
+                current,
+                lambda: self.closed.get() or self.writer.get() is not current
+            )
+        except asyncio.CancelledError:
+            self._withdraw_write(current)
+            raise
+        if self.writer.get() is current:
+            self.check_open()
+        self._finished_write()
+        return value
+
+    def _take(self, fn: Callable):
+        """Apply fn to the next value from the waiting writer, which the
+        reader has claimed"""
+        batch = self.batch
+        if batch is None:
+            try:
+                result = fn(self.buffer)
+            finally:
+                # the value has been taken even if fn failed, and the
+                # writer can't withdraw it, so it must be released
+                self._handed_over()
+        else:
+            try:
+                result = fn(batch[self.taken])
+            finally:
+                self.taken += 1
+                if self.taken == len(batch):
+                    self._handed_over()
+                else:
+                    self._offer_rest()
+        self._finished_read()
+        return result
+
+    def _offer_rest(self) -> None:
+        """Offer the rest of a batch to the next reader"""
+        self.reader.set(None)
+        self.full.set(True)
+
+    def _handed_over(self) -> None:
+        """Release the writer once everything it offered has been taken"""
         self.buffer = None
+        self.batch = None
         self.full.set(False)
-        threads.unpark(self.writer.get_and_set(None))
         self.reader.set(None)
-        self._finished_read()
+        threads.unpark(self.writer.get_and_set(None))
+
+    def read_many(self, max_n: int,
+                  timeout: Optional[Nanoseconds] = None) -> List[T]:
+        assert max_n > 0
+        self.check_open()
+        current = threading.current_thread()
+        last_reader: threading.Thread = self.reader.get_and_set(current)
+        assert last_reader is None, f'~c overtaking ' \
+                                  f'[{threads.get_thread_identity(last_reader)}]' \
+                                  f' in {threads.get_thread_identity(current)}'
+        self.out_port_event(READYSTATE)
+        deadline = None if timeout is None else util.nano_time() + timeout
+        try:
+            claimed = self._claim_before(deadline)
+        except util.Cancelled:
+            self._withdraw_read(current)
+            raise
+        if not claimed:
+            self.reader.set(None)
+            return []
+        batch = self.batch
+        if batch is None:
+            result = [self.buffer]
+            self._handed_over()
+        else:
+            result = batch[self.taken:self.taken + max_n]
+            self.taken += len(result)
+            if self.taken == len(batch):
+                self._handed_over()
+            else:
+                self._offer_rest()
+        self._finished_read(len(result))
         return result
 
+    def write_many(self, values: Iterable[T]) -> int:
+        self.check_open()
+        batch = list(values)
+        if len(batch) == 0:
+            return 0
+        current = threading.current_thread()
+        last_writer: threading.Thread = self.writer.get_and_set(current)
+        assert last_writer is None, f'c.write_many overtaking ' \
+                                f'[{threads.get_thread_identity(last_writer)}]' \
+                                f' in {threads.get_thread_identity(current)}'
+        self.taken = 0
+        self.batch = batch
+        self.full.set(True)
+        self.in_port_event(READYSTATE)
+        threads.unpark(self.reader.get())
+        try:
+            self.wait_strategy.wait_until(
+                lambda: self.closed.get() or self.writer.get() is not current
+            )
+        except util.Cancelled:
+            self._withdraw_write(current)
+            raise
+        if self.writer.get() is current:
+            # closed before the readers took the whole batch, withdraw the
+            # rest once a reader which claimed some of it has finished
+            self._withdraw_write(current)
+        taken = self.taken
+        if taken == 0:
+            self.check_open()
+        self._finished_write(taken)
+        return taken
+
     def close(self):
         if not self.closed.get_and_set(True):
             self.out_port_event(CLOSEDSTATE)
             self.in_port_event(CLOSEDSTATE)
-            threads.unpark(self.reader.get_and_set(None))
-            threads.unpark(self.writer.get_and_set(None))
+            threads.unpark(self.reader.get())
+            threads.unpark(self.writer.get())
             self.unregister()
 
     @property
@@ -342,8 +718,10 @@ class _OneOne(SyncChan[T]):
 
     def check_open(self) -> None:
         if self.closed.get():
-            self.writer.set(None)
-            self.reader.set(None)
+            # close may not have seen the slots before they were cleared, so
+            # wake whoever was in them
+            threads.unpark(self.writer.get_and_set(None))
+            threads.unpark(self.reader.get_and_set(None))
             raise util.Closed(self.name)
 
     def read_before(self, timeout: Nanoseconds) -> Optional[T]:
@@ -354,18 +732,15 @@ class _OneOne(SyncChan[T]):
         curr = threading.current_thread()
         self.reader.set(curr)
         self.out_port_event(READYSTATE)
-        success = 0 < threads.park_current_thread_until_elapsed_or(
-            timeout,
-            lambda: self.closed.get() or self.full.get(),
-        )
-        self.check_open()
-        result = self.buffer
-        self.buffer = None
-        self.full.set(False)
-        threads.unpark(self.writer.get_and_set(None))
-        self.reader.set(None)
-        self._finished_read()
-        return result if success else None
+        try:
+            claimed = self._claim_before(util.nano_time() + timeout)
+        except util.Cancelled:
+            self._withdraw_read(curr)
+            raise
+        if not claimed:
+            self.reader.set(None)
+            return None
+        return self._take(util.identity_fn)
 
     def write_before(self, timeout: Nanoseconds, value: T) -> bool:
         assert self.writer.get() is None, f"c << {value} in " \
@@ -378,14 +753,21 @@ class _OneOne(SyncChan[T]):
         self.writer.set(curr)
         self.full.set(True)
         self.in_port_event(READYSTATE)
-        threads.unpark(self.reader.get_and_set(None))
-        success = 0 < threads.park_current_thread_until_elapsed_or(
-            timeout,
-            lambda: self.closed.get() or not self.full.get(),
-        )
+        # the reader keeps its slot until it has taken the value, if we time
+        # out first it goes on waiting for the next writer
+        threads.unpark(self.reader.get())
+        try:
+            success = 0 < threads.park_current_thread_until_elapsed_or(
+                timeout,
+                lambda: self.closed.get() or self.writer.get() is not curr,
+            )
+        except util.Cancelled:
+            self._withdraw_write(curr)
+            raise
         if not success:
-            self.full.set(False)
-        self.writer.set(None)
+            # a reader may have claimed the value as we timed out
+            success = not self._withdraw_write(curr)
+        self.writer.compare_and_set(curr, None)
         self.check_open()
         self._finished_write()
         return success
@@ -395,16 +777,18 @@ class _OneOneFactory(NameGenerator, metaclass=Singleton):
     def __init__(self):
         super().__init__('OneOne')
 
-    def __call__(self, name: Optional[str] = None) -> _OneOne:
+    def __call__(self, name: Optional[str] = None,
+                 wait_strategy: Optional[wait.WaitStrategy] = None) -> _OneOne:
         """
         Args:
             name: The name for the channel.
+            wait_strategy: How processes wait to rendezvous.
 
         Returns: A new OneOne channel
         """
         if name is None:
             name = self._new_name()
-        return _OneOne(name)
+        return _OneOne(name, wait_strategy)
 
 OneOne = _OneOneFactory()
 
@@ -412,8 +796,9 @@ class _N2N(SharedChan[T], _OneOne[T]):
     """"""
 
     def __init__(self, writers: int, readers: int,
-                 name: str, fair_out: bool, fair_in: bool) -> None:
-        super().__init__(name)
+                 name: str, fair_out: bool, fair_in: bool,
+                 wait_strategy: Optional[wait.WaitStrategy] = None) -> None:
+        super().__init__(name, wait_strategy)
         self.ws = AtomicNum(writers)
         self.rs = AtomicNum(readers)
         self.wm = conc.TrackedFairRLock() if fair_out else conc.TrackedRLock()
@@ -446,14 +831,41 @@ class _N2N(SharedChan[T], _OneOne[T]):
         else:
             return False
 
+    def write_many(self, values: Iterable[T]) -> int:
+        with self.wm:
+            return super().write_many(values)
+
     def __invert__(self) -> T:
         with self.rm:
             return super().__invert__()
 
+    def read_many(self, max_n: int,
+                  timeout: Optional[Nanoseconds] = None) -> List[T]:
+        if timeout is None:
+            with self.rm:
+                return super().read_many(max_n)
+        deadline = util.nano_time() + timeout
+        if self.rm.acquire(timeout=timeout.to_seconds()):
+            try:
+                remaining = deadline - util.nano_time()
+                if remaining > 0:
+                    return super().read_many(max_n, remaining)
+                else:
+                    return []
+            finally:
+                self.rm.release()
+        else:
+            return []
+
     def extended_rendezvous(self, func):
         with self.rm:
             super().extended_rendezvous(func)
 
+    # the port locks are held by threads, so coroutines take them on a
+    # thread of the executor
+    aread = InPort.aread
+    awrite = OutPort.awrite
+
     def read_before(self, ns: Nanoseconds) -> Optional[T]:
         deadline = util.nano_time() + ns
         if self.rm.acquire(timeout=float(ns)):
@@ -468,10 +880,21 @@ class _N2N(SharedChan[T], _OneOne[T]):
         else:
             return None
 
-    def get_waiting(self) -> List[threading.Thread]:
-        return super().get_waiting() + \
-               self.wm.get_waiting() + \
-               self.rm.get_waiting()
+    def get_blocked(self) -> Tuple[List[threading.Thread],
+                                   List[threading.Thread]]:
+        """Those waiting for a port lock as well as for a peer"""
+        readers, writers = super().get_blocked()
+        return readers + self.rm.get_waiting(), \
+            writers + self.wm.get_waiting()
+
+    def get_blockers(self, thread: threading.Thread) -> List[threading.Thread]:
+        """A thread waiting for a port is blocked by the thread holding it"""
+        blockers = super().get_blockers(thread)
+        if thread in self.wm.get_waiting():
+            blockers += self.wm.get_holders()
+        if thread in self.rm.get_waiting():
+            blockers += self.rm.get_holders()
+        return blockers
 
     def show_state(self, file) -> None:
         ww = self.wm.num_waiting()
@@ -495,27 +918,33 @@ class _N2NFactory(NameGenerator, metaclass=Singleton):
         super().__init__('N2N')
 
     def __call__(self, writers: int = 0, readers: int = 0, name: Optional[str] = None,
-                 fair_out: bool = False, fair_in: bool = False) -> _N2N:
+                 fair_out: bool = False, fair_in: bool = False,
+                 wait_strategy: Optional[wait.WaitStrategy] = None) -> _N2N:
         if name is None:
             name = self._new_name()
-        return _N2N(writers, readers, name, fair_out, fair_in)
+        return _N2N(writers, readers, name, fair_out, fair_in, wait_strategy)
 
 N2N = _N2NFactory()
 
-def ManyOne(writers: int = 0, name: Optional[str] = None):
+def ManyOne(writers: int = 0, name: Optional[str] = None,
+            wait_strategy: Optional[wait.WaitStrategy] = None):
     if name is None:
         name = N2N._new_name('ManyOne')
-    return N2N(writers=writers, readers=1, name=name)
+    return N2N(writers=writers, readers=1, name=name,
+               wait_strategy=wait_strategy)
 
-def OneMany(readers: int = 0, name: Optional[str] = None):
+def OneMany(readers: int = 0, name: Optional[str] = None,
+            wait_strategy: Optional[wait.WaitStrategy] = None):
     if name is None:
         name = N2N._new_name('OneMany')
-    return N2N(writers=1, readers=readers, name=name)
+    return N2N(writers=1, readers=readers, name=name,
+               wait_strategy=wait_strategy)
 
-def ManyMany(name: Optional[str] = None):
+def ManyMany(name: Optional[str] = None,
+             wait_strategy: Optional[wait.WaitStrategy] = None):
     if name is None:
         name = N2N._new_name('ManyMany')
-    return N2N(name=name)
+    return N2N(name=name, wait_strategy=wait_strategy)
 
 class _N2NBuf(SharedChan[T]):
 
@@ -529,7 +958,9 @@ class _N2NBuf(SharedChan[T]):
         self.output_closed = Atomic(False)
         self.reads = AtomicNum(0)
         self.writes = AtomicNum(0)
-        self.queue: queue.Queue = queue.Queue(maxsize=size)
+        self.ring: RingBuffer[T] = RingBuffer(size, self.name)
+        self._read_waits = metrics.waits(self.kind, 'read')
+        self._write_waits = metrics.waits(self.kind, 'write')
         self.register()
 
     @property
@@ -537,7 +968,7 @@ class _N2NBuf(SharedChan[T]):
         if self.input_closed.get():
             return CLOSEDSTATE
         if self.is_empty():
-            return UNKNOWNSTATE
+            return CLOSEDSTATE if self.output_closed.get() else UNKNOWNSTATE
         return READYSTATE
 
     @property
@@ -552,11 +983,11 @@ class _N2NBuf(SharedChan[T]):
     def name_generator(self) -> NameGenerator:
         return N2NBuf
 
-    def _finished_read(self):
-        return self.reads.inc(1)
+    def _finished_read(self, n: int = 1):
+        return self.reads.inc(n)
 
-    def _finished_write(self):
-        return self.writes.inc(1)
+    def _finished_write(self, n: int = 1):
+        return self.writes.inc(n)
 
     def finished_rw(self):
         return f'(READ {self.reads.get()}, WRITTEN {self.writes.get()})'
@@ -569,30 +1000,44 @@ class _N2NBuf(SharedChan[T]):
                f"{self.state('OutPort', self.output_closed.get())} " \
                f"{self.state('InPort', self.input_closed.get())}" \
                f"(writers={self.ws.get()}, readers={self.rs.get()}) " \
-               f"size={self.size}, length={self.queue.qsize()}) " \
+               f"size={self.size}, length={len(self.ring)}) " \
                f"{self.finished_rw()}"
 
     def show_state(self, file) -> None:
         print(str(self), end='', file=file)
 
+    def get_waiting(self) -> List[threading.Thread]:
+        return list(self.ring.blocked)
+
+    def get_blocked(self) -> Tuple[List[threading.Thread],
+                                   List[threading.Thread]]:
+        return list(self.ring.blocked_readers), \
+            list(self.ring.blocked_writers)
+
+    def metrics(self) -> List[Sample]:
+        labels = {'channel': self.name, 'kind': self.kind}
+        return super().metrics() + [
+            ('cpo_channel_reads_total', labels, self.reads.get()),
+            ('cpo_channel_writes_total', labels, self.writes.get()),
+        ]
+
     def close(self) -> None:
         self.output_closed.set(True)
         self.input_closed.set(True)
+        self.ring.close()
         self.out_port_event(CLOSEDSTATE)
         self.in_port_event(CLOSEDSTATE)
-        # clear the queue
-        try:
-            while True:
-                self.queue.get_nowait()
-        except queue.Empty:
-            pass
         self.unregister()
 
     def close_out(self) -> None:
         if self.ws.dec(1) == 0:
             self.output_closed.set(True)
-            if self.is_empty:
+            # readers may drain what is left before they see Closed
+            self.ring.close_output()
+            if self.is_empty():
                 self.close()
+            else:
+                self.in_port_event(self.in_port_state)
 
     def close_in(self):
         if self.rs.dec(1) == 0:
@@ -609,60 +1054,136 @@ class _N2NBuf(SharedChan[T]):
         return not self.input_closed.get()
 
     def is_empty(self) -> bool:
-        return self.queue.empty()
+        return self.ring.is_empty()
 
     def is_full(self) -> bool:
-        return self.queue.full()
+        return self.ring.is_full()
 
-    def __invert__(self) -> Optional[T]:
+    def _check_can_read(self) -> None:
         if self.input_closed.get():
             raise util.Closed(self.name)
         if self.output_closed.get() and self.is_empty():
             self.close()
             raise util.Closed(self.name)
+
+    def _drained(self) -> None:
+        """The ring closed under a reader, which happens once the output is
+        closed and the ring is empty"""
+        if not self.input_closed.get():
+            self.close()
+
+    def __invert__(self) -> Optional[T]:
+        self._check_can_read()
+        start = perf_counter_ns()
+        sink = trace.sink
+        if sink is not None:
+            sink.record(trace.READ, self.name)
         try:
-            self.out_port_event(READYSTATE)
-            r = self.queue.get()
-            self._finished_read()
-            return r
-        except queue.Empty:
-            return None
-        except InterruptedError:
-            raise util.Closed(self.name)
+            r = self.ring.get()
+        except util.Closed:
+            self._drained()
+            raise
+        finally:
+            if sink is not None:
+                sink.record(trace.READ_END, self.name)
+        if self._read_waits is not None:
+            self._read_waits.observe(perf_counter_ns() - start)
+        # there is now room for a writer
+        self.out_port_event(READYSTATE)
+        self._finished_read()
+        return r
 
     def read_before(self, ns: Nanoseconds) -> Optional[T]:
-        if self.input_closed.get():
-            raise util.Closed(self.name)
-        if self.output_closed.get() and self.is_empty():
-            self.close()
-            raise util.Closed(self.name)
+        self._check_can_read()
+        try:
+            r = self.ring.get(ns)
+        except util.Closed:
+            self._drained()
+            raise
         self.out_port_event(READYSTATE)
+        return r
+
+    def read_many(self, max_n: int,
+                  timeout: Optional[Nanoseconds] = None) -> List[T]:
+        assert max_n > 0
+        self._check_can_read()
         try:
-            return self.queue.get(timeout=ns.to_seconds())
-        except queue.Empty:
-            return None
+            result = self.ring.get_many(max_n, timeout)
+        except util.Closed:
+            self._drained()
+            raise
+        if result:
+            self.out_port_event(READYSTATE)
+        self._finished_read(len(result))
+        return result
 
-    def __lshift__(self, value: T) -> T:
+    async def aread(self) -> T:
+        self._check_can_read()
+        current = aio.current_strand()
+        try:
+            ok, r = self.ring.poll(current)
+            while not ok:
+                await current.park()
+                ok, r = self.ring.poll(current)
+        except util.Closed:
+            self._drained()
+            raise
+        except asyncio.CancelledError:
+            self.ring.withdraw(current, True)
+            raise
+        self.out_port_event(READYSTATE)
+        self._finished_read()
+        return r
+
+    async def awrite(self, value: T) -> T:
         if self.output_closed.get() or self.input_closed.get():
-            raise util.Closed(self)
+            raise util.Closed(self.name)
+        current = aio.current_strand()
         try:
-            self.queue.put(value)
-            self.in_port_event(READYSTATE)
-            self._finished_write()
-        except InterruptedError:
+            while not self.ring.offer(value, current):
+                await current.park()
+        except asyncio.CancelledError:
+            self.ring.withdraw(current, False)
+            raise
+        self.in_port_event(READYSTATE)
+        self._finished_write()
+        return value
+
+    def write_many(self, values: Iterable[T]) -> int:
+        if self.output_closed.get() or self.input_closed.get():
             raise util.Closed(self.name)
-        if self.input_closed.get():
+        written = self.ring.put_many(list(values))
+        if written > 0:
+            self.in_port_event(READYSTATE)
+            self._finished_write(written)
+        return written
+
+    def __lshift__(self, value: T) -> T:
+        if self.output_closed.get() or self.input_closed.get():
             raise util.Closed(self.name)
+        start = perf_counter_ns()
+        sink = trace.sink
+        if sink is not None:
+            sink.record(trace.WRITE, self.name)
+        try:
+            self.ring.put(value)
+        finally:
+            if sink is not None:
+                sink.record(trace.WRITE_END, self.name)
+        if self._write_waits is not None:
+            self._write_waits.observe(perf_counter_ns() - start)
+        self.in_port_event(READYSTATE)
+        self._finished_write()
         return value
 
     def write_before(self, ns: Nanoseconds, value: T) -> bool:
         if self.output_closed.get() or self.input_closed.get():
             raise util.Closed(self.name)
-        try:
-            self.queue.put(value, timeout=ns.to_seconds())
+        if self.ring.put(value, ns):
+            self.in_port_event(READYSTATE)
+            self._finished_write()
             return True
-        except queue.Full:
-            return False
+        return False
 
 class _N2NBufFactory(NameGenerator, metaclass=Singleton):
 
@@ -682,6 +1203,70 @@ def OneOneBuf(size: int = 0, name: Optional[str] = None):
         name = N2N._new_name('OneOneBuf')
     return N2NBuf(size=size, writers=1, readers=1, name=name)
 
+class _Ticker(_N2NBuf[Nanoseconds]):
+    """A channel onto which the timer service writes the time every period.
+    While the reader is behind, ticks are dropped rather than queued."""
+
+    external = True
+
+    def __init__(self, period: Nanoseconds, count: Optional[int],
+                 name: str) -> None:
+        super().__init__(1, 1, 1, name)
+        self.period = period
+        self.remaining = count
+        self.deadline = util.nano_time() + period
+        self.timeout = timer.timers.schedule(self.deadline, self._tick)
+
+    def _tick(self) -> None:
+        if self.output_closed.get():
+            return
+        now = util.nano_time()
+        try:
+            written = self.write_before(Nanoseconds(0), now)
+        except util.Closed:
+            return
+        # only ticks which were delivered count
+        if written and self.remaining is not None:
+            self.remaining -= 1
+            if self.remaining <= 0:
+                self.close_out()
+                return
+        # keep to the period, skipping any ticks we are too late for
+        self.deadline += self.period
+        if self.deadline <= now:
+            self.deadline = now + self.period
+        self.timeout = timer.timers.schedule(self.deadline, self._tick)
+
+    def close(self) -> None:
+        self.timeout.cancel()
+        super().close()
+
+class _TickerFactory(NameGenerator, metaclass=Singleton):
+
+    def __init__(self):
+        super().__init__('Ticker')
+
+    def __call__(self, period: Nanoseconds, count: Optional[int] = None,
+                 name: Optional[str] = None) -> _Ticker:
+        """
+        Args:
+            period: The time between ticks.
+            count: The number of ticks after which the channel closes, if
+                it should.
+            name: The name for the channel.
+
+        Returns: A new Ticker channel
+        """
+        if name is None:
+            name = self._new_name()
+        return _Ticker(period, count, name)
+
+Ticker = _TickerFactory()
+
+def after(ns: Nanoseconds, name: Optional[str] = None) -> _Ticker:
+    """A channel which delivers the time once, ns from now, and then closes"""
+    return Ticker(ns, count=1, name=name)
+
 class FaultyMixin:
 
     def __init__(self, *args, prob_loss=0, **kwargs):
@@ -692,6 +1277,12 @@ class FaultyMixin:
         if random.random() > self.prob_loss:
             return super().__lshift__(value)
 
+    def write_many(self, values) -> int:
+        values = list(values)
+        super().write_many([v for v in values
+                            if random.random() > self.prob_loss])
+        return len(values)
+
     def write_before(self, timeout: Nanoseconds, value) -> bool:
         if random.random() < self.prob_loss:
             threads.park_current_thread(timeout)
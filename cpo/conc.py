@@ -1,10 +1,12 @@
 
 from abc import ABC
+from collections import deque
 import threading
 import dummy_threading
-from typing import List, Optional, Type
+from typing import Deque, List, Optional, Type
 
 from .atomic import AtomicNum
+from . import threads
 from . import util
 from .util import Nanoseconds
 
@@ -22,6 +24,14 @@ class CountDownLatch:
     def wait(self):
         self._event.wait()
 
+    def reset(self, count: int = 1):
+        """Rearm the latch to be reused, once every waiter has been released"""
+        self._count.set(count)
+        if count <= 0:
+            self._event.set()
+        else:
+            self._event.clear()
+
 NoLock = dummy_threading.Lock
 
 # TODO find a better (but still safe) way of doing this
@@ -71,10 +81,92 @@ class Lock(Lockable):
         return self._lock
 
 
-class FairRLock(RLockClass):
-    # TODO
+class FairRLock(Lockable):
+    """A reentrant lock which is granted in the order it was asked for.
+    Rather than waking its waiters to race for it, a release which frees the
+    lock hands it straight to the longest waiting thread. The mutex only
+    guards the handover, nobody parks holding it."""
+
     def __init__(self):
-        raise NotImplementedError
+        self._mutex = threading.Lock()
+        self._owner: Optional[threading.Thread] = None
+        self._count = 0
+        self._waiting: Deque[threading.Thread] = deque()
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        current = threading.current_thread()
+        with self._mutex:
+            if self._owner is current:
+                self._count += 1
+                return True
+            if self._owner is None and not self._waiting:
+                self._owner = current
+                self._count = 1
+                return True
+            if not blocking:
+                return False
+            self._waiting.append(current)
+        try:
+            if timeout < 0:
+                while self._owner is not current:
+                    threads.park_current_thread()
+            else:
+                threads.park_current_thread_until_elapsed_or(
+                    Nanoseconds.from_seconds(timeout),
+                    lambda: self._owner is current)
+        except util.Cancelled:
+            self._withdraw(current)
+            raise
+        with self._mutex:
+            if self._owner is current:
+                return True
+            self._waiting.remove(current)
+            return False
+
+    def _withdraw(self, current: threading.Thread) -> None:
+        """current stopped waiting, pass the lock on if it had been handed
+        it meanwhile"""
+        with self._mutex:
+            if self._owner is not current:
+                self._waiting.remove(current)
+                return
+            successor = self._hand_over()
+        threads.unpark(successor)
+
+    def _hand_over(self) -> Optional[threading.Thread]:
+        """Give the lock to the head waiter, with the mutex held"""
+        successor = self._waiting.popleft() if self._waiting else None
+        self._owner = successor
+        self._count = 0 if successor is None else 1
+        return successor
+
+    def release(self) -> None:
+        with self._mutex:
+            if self._owner is not threading.current_thread():
+                raise RuntimeError('cannot release un-acquired lock')
+            self._count -= 1
+            if self._count > 0:
+                return
+            successor = self._hand_over()
+        threads.unpark(successor)
+
+    def locked(self) -> bool:
+        return self._owner is not None
+
+    def _is_owned(self) -> bool:
+        return self._owner is threading.current_thread()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def __repr__(self) -> str:
+        owner = threads.get_thread_identity(self._owner) \
+            if self._owner is not None else 'unlocked'
+        return f'FairRLock({owner}, count={self._count}, ' \
+               f'waiting={len(self._waiting)})'
 
 
 class Tracked:
@@ -88,6 +180,9 @@ class Tracked:
     def latest_owners(self):
         raise NotImplementedError
 
+    def get_holders(self) -> List[threading.Thread]:
+        raise NotImplementedError
+
 
 class TrackedMixin(Tracked, ABC):
 
@@ -95,15 +190,40 @@ class TrackedMixin(Tracked, ABC):
         super().__init__()
         self._waiters = set()
         self._last_owner = None
+        # the thread holding the lock, and how many times it has taken it
+        self._holder: Optional[threading.Thread] = None
+        self._depth = 0
 
     def acquire(self, *args, **kwargs) -> bool:
         t = threading.current_thread()
         self._waiters.add(t)
-        result = super().acquire(*args, **kwargs)
-        self._last_owner = t
-        self._waiters.remove(t)
+        try:
+            result = super().acquire(*args, **kwargs)
+        finally:
+            self._waiters.discard(t)
+        if result:
+            self._last_owner = t
+            self._holder = t
+            self._depth += 1
         return result
 
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            self._holder = None
+        super().release()
+
+    # the C locks would otherwise take themselves without being tracked
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def get_holders(self) -> List[threading.Thread]:
+        holder = self._holder
+        return [] if holder is None else [holder]
+
     def get_waiting(self, cond=None):
         if cond is None:
             return list(self._waiters)
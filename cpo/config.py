@@ -1,8 +1,12 @@
 
 log_size = 50
 logging = 0
+# logDUMP = False  # dump LOG when a process crashes
+# logTRACE = ''  # the path of a trace file to append LOG's events to
 port = 0
 # suppress = ''
+# deadlockWATCHDOG = 0  # seconds between deadlock scans, 0 for none
+# metricsWAITS = True  # time channel waits for /metrics
 
 poolKIND ='ADAPTIVE'
 poolMAX = 1024
@@ -10,6 +14,15 @@ poolMAX = 1024
 # poolG = 0
 # poolM = 6
 # poolK = 0
+# poolKEEPALIVE = 60
+# poolWORKERS = 0  # STEALING threads before stalls are compensated, 0 for the cpu count
+# poolSTALL = 0.001
+
+# isolateMETHOD = 'spawn'
+
+waitKIND = 'PARK'
+waitSPIN = 100
+# timerPARKS = False  # timed parks unparked by the timer service, not a timeout each
 
 def get(key, default):
     return globals().get(key, default)
@@ -0,0 +1,237 @@
+
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from . import register
+from . import threads
+from . import util
+
+# The wait-for graph has an edge from each waiting thread to each thread it
+# is blocked by: the owner of a semaphore or the holder of a port lock, the
+# reader taking a writer's value, or the waiter ahead in a semaphore's
+# queue. A cycle in it is a deadlock. Most CSO waits are for a peer to
+# arrive at a channel, and there is no knowing which thread that will be,
+# so a network of processes which are all waiting is a deadlock too, a
+# stall. It is only a stall if each of them waits on something which only
+# another process can do: a process reading a Ticker, or a channel from
+# another OS process, is waiting for the timer or that process.
+#
+# Snapshots of the graph are not atomic, so a deadlock is only reported once
+# it has been seen at two scans in a row. Scans are incremental: a cycle
+# which has persisted since the previous scan, but not since the one before,
+# passes through a thread whose edges changed at the previous scan and not
+# since, so the search for cycles need only start from those threads.
+
+Waits = Dict[threading.Thread, List[register.Debuggable]]
+Edges = Dict[threading.Thread, FrozenSet[threading.Thread]]
+
+def stack_trace(thread: threading.Thread) -> List[str]:
+    """The formatted stack of a live thread"""
+    frame = sys._current_frames().get(thread.ident)
+    if frame is None:
+        return []
+    return traceback.format_stack(frame)
+
+class Deadlock:
+    """Threads which are waiting for one another, kind is 'cycle' or
+    'stall'"""
+
+    def __init__(self, kind: str, threads_: List[threading.Thread],
+                 waits: Waits, edges: Edges) -> None:
+        self.kind = kind
+        self.threads = threads_
+        self.waits = {t: waits.get(t, []) for t in threads_}
+        self.edges = {t: edges.get(t, frozenset()) for t in threads_}
+        self.key = (kind, frozenset(threads_))
+        # the number of times it has been found, having been broken between
+        self.count = 1
+
+    def __str__(self) -> str:
+        ids = ', '.join(threads.get_thread_identity(t) for t in self.threads)
+        times = f' (found {self.count} times)' if self.count > 1 else ''
+        return f'DEADLOCK ({self.kind}) of {len(self.threads)} threads: ' \
+               f'{ids}{times}'
+
+    def show(self, file=None) -> None:
+        """Print the deadlock with what each thread is waiting for and its
+        stack"""
+        if file is None:
+            file = sys.stdout
+        print(f'== {self} ==', file=file)
+        for thread in self.threads:
+            print(f'THREAD {threads.get_thread_identity(thread)}', file=file)
+            for obj in self.waits[thread]:
+                print('\twaiting for ', end='', file=file)
+                try:
+                    obj.show_state(file)
+                except Exception:
+                    print('<state not available>', end='', file=file)
+                print('', file=file)
+            for blocker in self.edges[thread]:
+                print(f'\tblocked by {threads.get_thread_identity(blocker)}',
+                      file=file)
+            for line in stack_trace(thread):
+                print('\t' + line.rstrip().replace('\n', '\n\t'), file=file)
+
+class DeadlockDetector:
+    """Finds deadlocks in the threads waiting on registered objects, on
+    demand with detect or periodically with watch"""
+
+    # the most deadlocks kept in found
+    KEEP = 100
+
+    def __init__(self) -> None:
+        self._edges: Edges = {}
+        # the threads whose edges changed at the previous scan
+        self._changed: Set[threading.Thread] = set()
+        self._stalled: Optional[FrozenSet[Tuple[threading.Thread, int]]] = None
+        self._reported: Set[Tuple[str, FrozenSet[threading.Thread]]] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.scans = 0
+        # the deadlocks found, oldest first, one for each set of threads
+        self._found: Dict[Tuple[str, FrozenSet[threading.Thread]],
+                          Deadlock] = {}
+
+    @staticmethod
+    def snapshot() -> Tuple[Waits, Edges]:
+        """What each waiting thread is waiting for, and the wait-for graph"""
+        waits = register.waiting()
+        edges = {}
+        for thread, objs in waits.items():
+            blockers = set()
+            for obj in objs:
+                blockers.update(b for b in obj.get_blockers(thread)
+                                if b is not thread)
+            if blockers:
+                edges[thread] = frozenset(blockers)
+        return waits, edges
+
+    @staticmethod
+    def _cycle(edges: Edges,
+               root: threading.Thread) -> Optional[List[threading.Thread]]:
+        """A cycle of the graph through root, if there is one"""
+        path = [root]
+        visited = {root}
+        stack = [iter(edges.get(root, ()))]
+        while stack:
+            nxt = next(stack[-1], None)
+            if nxt is None:
+                stack.pop()
+                path.pop()
+            elif nxt is root:
+                return list(path)
+            elif nxt not in visited and nxt in edges:
+                visited.add(nxt)
+                path.append(nxt)
+                stack.append(iter(edges[nxt]))
+        return None
+
+    def _stall(self, waits: Waits) -> Optional[List[threading.Thread]]:
+        """Every process, if every one is waiting on things only another
+        process can release, and has been waiting for the same things since
+        the previous scan"""
+        procs = threads.process_threads()
+        if not procs or any(t not in waits or
+                            any(obj.external for obj in waits[t])
+                            for t in procs):
+            self._stalled = None
+            return None
+        stalled = frozenset((t, id(obj)) for t in procs for obj in waits[t])
+        previous, self._stalled = self._stalled, stalled
+        return procs if stalled == previous else None
+
+    def scan(self) -> List[Deadlock]:
+        """Compare the graph with the one seen at the previous scan,
+        returning the deadlocks which have persisted since then and which
+        have not already been reported"""
+        with self._lock:
+            self.scans += 1
+            waits, edges = self.snapshot()
+            changed = {t for t in edges.keys() | self._edges.keys()
+                       if edges.get(t) != self._edges.get(t)}
+            deadlocks = []
+            seen = set()
+            for root in self._changed:
+                if root in changed or root not in edges or root in seen:
+                    continue
+                cycle = self._cycle(edges, root)
+                if cycle is not None:
+                    seen.update(cycle)
+                    deadlocks.append(Deadlock('cycle', cycle, waits, edges))
+            # forget deadlocks which have been broken, so that they are
+            # reported again should they recur
+            self._reported = {key for key in self._reported
+                              if all(t in waits for t in key[1])}
+            for kind, cycle in self._reported:
+                if kind == 'cycle':
+                    seen.update(cycle)
+            stalled = self._stall(waits)
+            # a stall of threads which are all in cycles tells us nothing more
+            if stalled is not None and not all(t in seen for t in stalled):
+                deadlocks.append(Deadlock('stall', stalled, waits, edges))
+            self._edges, self._changed = edges, changed
+            new = [d for d in deadlocks if d.key not in self._reported]
+            self._reported.update(d.key for d in new)
+            self._record(new)
+            return new
+
+    def _record(self, new: List[Deadlock]) -> None:
+        """Add the deadlocks new to found, with the lock held. A deadlock
+        which recurs replaces the one found before, and counts it, and only
+        the last KEEP are kept."""
+        for deadlock in new:
+            old = self._found.pop(deadlock.key, None)
+            if old is not None:
+                deadlock.count = old.count + 1
+            self._found[deadlock.key] = deadlock
+        while len(self._found) > self.KEEP:
+            del self._found[next(iter(self._found))]
+
+    @property
+    def found(self) -> List[Deadlock]:
+        """The deadlocks found, oldest first"""
+        with self._lock:
+            return list(self._found.values())
+
+    @staticmethod
+    def detect(settle: float = 0.1) -> List[Deadlock]:
+        """The deadlocks which persist for settle seconds"""
+        detector = DeadlockDetector()
+        detector.scan()
+        time.sleep(settle)
+        return detector.scan()
+
+    def watch(self, interval: float,
+              on_deadlock: Optional[Callable[[Deadlock], None]] = None) -> None:
+        """Scan every interval seconds from a daemon thread, passing each
+        deadlock found to on_deadlock, which by default prints it"""
+        if on_deadlock is None:
+            on_deadlock = lambda deadlock: deadlock.show()
+        self.stop()
+        self._stop = threading.Event()
+        def run(stop: threading.Event) -> None:
+            while not stop.wait(interval):
+                for deadlock in self.scan():
+                    try:
+                        on_deadlock(deadlock)
+                    except Exception as e:
+                        util.synced_print(
+                            f'Reporting {deadlock} failed with {e}')
+        self._thread = threading.Thread(target=run, args=(self._stop,),
+                                        name='cpo-deadlock-watchdog',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop watching"""
+        self._stop.set()
+        self._thread = None
+
+    @property
+    def watching(self) -> bool:
+        return self._thread is not None
@@ -1,34 +1,46 @@
 
 import datetime
-import socket
+import io
+import json
 import sys
 import threading
 import traceback
-from typing import Callable, Dict, Optional
+from typing import Callable, Dict, List, Optional
 
+from .channel import Chan
 from . import config
+from .deadlock import Deadlock, DeadlockDetector, stack_trace
+from . import metrics
 from . import register
+from .semaphore import Semaphore
 from . import server
 from . import threads
 from . import util
 
 class DEBUGGER:
 
+    BACKLOG = 64
+    PAGE = 100
+    MAX_PAGE = 1000
+
     def __init__(self, debug_port: int = 0):
         self.debug_port = debug_port
         self.host = 'localhost'
         self.port = config.get('port', self.debug_port)
         self.SUPPRESS = config.get('suppress', '')
         self.monitored: Dict[str, Optional[Callable[[], str]]] = {}
+        self.detector = DeadlockDetector()
+        watchdog = config.get('deadlockWATCHDOG', 0)  # seconds
+        if watchdog > 0:
+            self.watch_deadlocks(watchdog)
         if self.port >= 0:
-            self.socket = server.create_server(self.host, self.port)
+            self.socket = server.create_server(self.host, self.port,
+                                               self.BACKLOG)
             self.port = self.socket.getsockname()[1]
-            self.thread = threading.Thread(
-                name=str(self),
-                target=self.run_server,
-                daemon=True,
-            )
-            self.thread.start()
+            self.server = server.HTTPServer(self.socket, self.route,
+                                            name=str(self))
+            self.thread = self.server.thread
+            self.server.start()
             util.synced_print(str(self) + ': ACTIVE')
 
     def __str__(self):
@@ -43,49 +55,152 @@ class DEBUGGER:
     def clear_monitor(self):
         self.monitored = {}
 
-    def run_server(self):
-        try:
-            while True:
-                conn, addr = self.socket.accept()
-                handler = threading.Thread(
-                    name="CSO Debugger Responder",
-                    target=self.handle,
-                    args=(conn,),
-                    daemon=True,
-                )
-                handler.start()
-        finally:
-            self.socket.close()
-
-    def handle(self, conn: socket.socket):
-        try:
-            in_ = conn.makefile('r')
-            out = conn.makefile('w')
-
-            # we must read in the full header even if we dont
-            # intend to use it...
-            header = []
-            line = " "
-            while line not in ['\n', '\r\n', '']:
-                line = in_.readline()
-                header.append(line)
-
-            print(
-f"""HTTP/1.1 201
-Content-Type: text/plain; charset=UTF-8
-Server-name: CPO debugger
-
-CPO State {datetime.datetime.now()}
-""", file=out)
+    def stop(self):
+        """Stop serving, and watching for deadlocks"""
+        if self.port >= 0:
+            self.server.stop()
+        self.stop_watching_deadlocks()
+
+    def route(self, path: str, params: Dict[str, str]) -> server.Response:
+        """Answer a request for path, from the server thread"""
+        if path in ('', '/'):
+            out = io.StringIO()
+            print(f'CPO State {datetime.datetime.now()}\n', file=out)
             self.show_cso_state(file=out)
+            return server.Response(200, out.getvalue())
+        if path == '/state.json':
+            try:
+                offset = max(0, int(params.get('offset', 0)))
+                limit = min(self.MAX_PAGE,
+                            max(1, int(params.get('limit', self.PAGE))))
+            except ValueError:
+                return server.Response(400, 'offset and limit must be '
+                                            'integers\n')
+            return self._json(self.state(offset, limit))
+        if path.startswith('/threads/'):
+            try:
+                ident = int(path[len('/threads/'):])
+            except ValueError:
+                return server.Response(400, 'thread ids are integers\n')
+            state = self.thread_state(ident)
+            if state is None:
+                return server.Response(404, f'no thread {ident}\n')
+            return self._json(state)
+        if path == '/metrics':
+            return server.Response(200, metrics.render(),
+                                   metrics.CONTENT_TYPE)
+        return server.Response(404, f'no such page {path}\n')
+
+    @staticmethod
+    def _json(value) -> server.Response:
+        return server.Response(200, json.dumps(value, default=str),
+                               'application/json')
 
-            out.flush()
-            out.close()
-            conn.shutdown(0)
-            conn.close()
-        finally:
-            if conn is not None:
-                conn.close()
+    @staticmethod
+    def _object_kind(obj: register.Debuggable) -> str:
+        if isinstance(obj, Chan):
+            return 'channel'
+        if isinstance(obj, Semaphore):
+            return 'semaphore'
+        return type(obj).__name__
+
+    @staticmethod
+    def _object_state(obj: register.Debuggable) -> str:
+        out = io.StringIO()
+        try:
+            obj.show_state(out)
+        except Exception as e:
+            return f'<state not available: {e}>'
+        return out.getvalue().strip()
+
+    def state(self, offset: int = 0, limit: int = 100) -> dict:
+        """A page of the threads, registered objects and deadlocks found.
+        The registry and the threads are each copied once, and everything is
+        described from those copies, so a page never mixes objects registered
+        at different times."""
+        objects = [(key, obj) for key, obj in
+                   ((key, ref()) for key, ref in
+                    list(register.registered.items()))
+                   if obj is not None]
+        active = list(threads.get_active_threads())
+        procs = set(threads.process_threads())
+        waiting: Dict[threading.Thread, List[register.Debuggable]] = {}
+        obj_waiting: Dict[int, List[threading.Thread]] = {}
+        for key, obj in objects:
+            try:
+                waiters = [t for t in obj.get_waiting() if t is not None]
+            except Exception:
+                waiters = []
+            obj_waiting[key] = waiters
+            for thread in waiters:
+                waiting.setdefault(thread, []).append(obj)
+        keys = {id(obj): key for key, obj in objects}
+        page_threads = active[offset:offset + limit]
+        page_objects = objects[offset:offset + limit]
+        found = self.detector.found
+        return {
+            'time': datetime.datetime.now().isoformat(),
+            'offset': offset,
+            'limit': limit,
+            'threads': {
+                'total': len(active),
+                'items': [{
+                    'id': t.ident,
+                    'name': t.name,
+                    'daemon': t.daemon,
+                    'process': t in procs,
+                    'waiting_for': [keys[id(o)] for o in waiting.get(t, [])],
+                } for t in page_threads],
+            },
+            'objects': {
+                'total': len(objects),
+                'items': [{
+                    'key': key,
+                    'kind': self._object_kind(obj),
+                    'name': getattr(obj, 'name', None),
+                    'state': self._object_state(obj),
+                    'waiting': [t.ident for t in obj_waiting[key]],
+                } for key, obj in page_objects],
+            },
+            'deadlocks': {
+                'total': len(found),
+                'items': [{
+                    'kind': d.kind,
+                    'threads': [t.ident for t in d.threads],
+                    'count': d.count,
+                    'text': str(d),
+                } for d in found[offset:offset + limit]],
+            },
+        }
+
+    def thread_state(self, ident: int) -> Optional[dict]:
+        """The state of a live thread, with its stack"""
+        thread = next((t for t in threads.get_active_threads()
+                       if t.ident == ident), None)
+        if thread is None:
+            return None
+        waits = [(obj, obj.get_blockers(thread))
+                 for obj in register.waiting().get(thread, [])]
+        frame = sys._current_frames().get(ident)
+        stack = [] if frame is None else traceback.extract_stack(frame)
+        return {
+            'id': ident,
+            'name': thread.name,
+            'daemon': thread.daemon,
+            'process': thread in threads.process_threads(),
+            'waiting_for': [{
+                'kind': self._object_kind(obj),
+                'name': getattr(obj, 'name', None),
+                'state': self._object_state(obj),
+                'blocked_by': [b.ident for b in blockers],
+            } for obj, blockers in waits],
+            'stack': [{
+                'file': f.filename,
+                'line': f.lineno,
+                'function': f.name,
+                'code': f.line,
+            } for f in stack],
+        }
 
     def show_cso_state(self, file=None):
         if file is None:
@@ -99,6 +214,11 @@ CPO State {datetime.datetime.now()}
             self.show_thread_state(file, thread, waiting.get(thread, None))
 
         print('', file=file)
+        found = self.detector.found
+        if found:
+            print('== Deadlocks ==', file=file)
+            for deadlock in found:
+                print(deadlock, file=file)
         if len(self.monitored) > 0:
             print('== Monitored Expressions ==', file=file)
             for name, state in self.monitored.items():
@@ -109,7 +229,7 @@ CPO State {datetime.datetime.now()}
                     print(state(), file=file)
 
         announced = False
-        for _, ref in registered.items():
+        for ref in list(registered.values()):
             obj: register.Debuggable = ref()
             if obj is not None:
                 if not announced:
@@ -132,6 +252,8 @@ CPO State {datetime.datetime.now()}
                 try:
                     thing.show_state(file)
                     print('', file=file)
+                    for blocker in thing.get_blockers(thread):
+                        self.show_blocker(blocker, file)
                 except Exception as e:
                     print("Exception while showing the state "
                           "of a registered component", file=file)
@@ -142,9 +264,31 @@ CPO State {datetime.datetime.now()}
             # blocker = LockSupper.get_blocker(thread) # nyi TODO
             print(threads.get_thread_identity(thread), file=file)
 
-    def show_blocker(self, blocker, file):
-        raise NotImplementedError
+    def show_blocker(self, blocker: threading.Thread, file):
+        print(f'\tblocked by {threads.get_thread_identity(blocker)}',
+              file=file)
+
+    def show_stack_trace(self, thread: threading.Thread, file):
+        for line in stack_trace(thread):
+            print('\t' + line.rstrip().replace('\n', '\n\t'), file=file)
+
+    def detect_deadlocks(self, settle: float = 0.1,
+                         file=None) -> List[Deadlock]:
+        """Print, and return, the deadlocks which persist for settle
+        seconds"""
+        if file is None:
+            file = sys.stdout
+        deadlocks = self.detector.detect(settle)
+        for deadlock in deadlocks:
+            deadlock.show(file)
+        return deadlocks
+
+    def watch_deadlocks(self, interval: float = 1.0,
+                        on_deadlock: Optional[Callable[[Deadlock], None]] = None):
+        """Look for deadlocks every interval seconds, printing each one found
+        unless on_deadlock is given"""
+        self.detector.watch(interval, on_deadlock)
 
-    def show_stack_trace(self, thread, file):
-        raise NotImplementedError
+    def stop_watching_deadlocks(self):
+        self.detector.stop()
 
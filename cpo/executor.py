@@ -1,12 +1,17 @@
 
 from abc import ABC
+import atexit
+from collections import deque, OrderedDict
 from concurrent.futures import ThreadPoolExecutor
+import os
+import random
 import threading
-from typing import List, Optional
+from typing import Deque, Dict, List, Optional
 
 from . import atomic
 from . import config
 from . import threads
+from . import timer
 from . import util
 
 class CPOExecutor(ABC):
@@ -17,24 +22,37 @@ class CPOExecutor(ABC):
     def shutdown(self) -> None:
         raise NotImplementedError
 
+    def activity(self) -> Dict[str, int]:
+        """How many threads the executor has, how many of them are running
+        processes, and how many processes are queued waiting for one"""
+        raise NotImplementedError
+
 class UnpooledExecutor(CPOExecutor):
 
     def __init__(self) -> None:
         self.thread_count = atomic.AtomicCounter()
 
     def execute(self, runnable: util.Runnable, stack_size: int) -> None:
+        thread = threading.Thread(
+            target=runnable.run,
+            name='cpo-unpooled-%d' % self.thread_count.inc(1),
+            daemon=True,
+        )
         with threads.StackSize(stack_size):
-            thread = threading.Thread(
-                target=runnable.run,
-                name='cpo-unpooled-%d' % self.thread_count.inc(1),
-                daemon=True,
-            )
-        thread.start()
+            thread.start()
+
+    def activity(self) -> Dict[str, int]:
+        live = sum(1 for t in threading.enumerate()
+                   if t.name.startswith('cpo-unpooled-'))
+        return {'threads': live, 'active': live, 'queued': 0}
 
     def shutdown(self) -> None:
         pass
 
 class ThreadPooledExecutor(CPOExecutor):
+    """Runs processes on a ThreadPoolExecutor. The pool creates and reuses
+    its threads as it sees fit, so they all have the pool's stack size
+    whatever the process asks for."""
 
     def __init__(self, report: bool, pool: ThreadPoolExecutor, stack_size: int = 0) -> None:
         self.report = report
@@ -43,43 +61,510 @@ class ThreadPooledExecutor(CPOExecutor):
         self.was_active = False
 
     def execute(self, runnable: util.Runnable, stack_size: int) -> None:
-        with threads.StackSize(stack_size):
+        # the pool starts any new thread within submit
+        with threads.StackSize(self.stack_size):
             self.pool.submit(runnable.run)
         self.was_active = True
 
+    @property
+    def threads_created(self) -> int:
+        return len(self.pool._threads)
+
+    def activity(self) -> Dict[str, int]:
+        live = self.threads_created
+        # the pool releases the semaphore as each of its threads goes idle
+        idle = getattr(self.pool, '_idle_semaphore', None)
+        idle_count = 0 if idle is None else idle._value
+        return {
+            'threads': live,
+            'active': max(0, live - idle_count),
+            'queued': self.pool._work_queue.qsize(),
+        }
+
+    def format_report(self) -> str:
+        size = threads.round_stack_size(self.stack_size)
+        return format_report({size: {
+            'created': self.threads_created,
+            'live': self.threads_created,
+            'peak live': self.threads_created,
+        }})
+
     def shutdown(self) -> None:
-        self.pool.shutdown()
+        # processes may be blocked for good, so don't wait for them
+        self.pool.shutdown(wait=False)
         if self.report and self.was_active:
-            raise NotImplementedError
+            util.synced_print(self.format_report())
 
 class SizePooledExecutor(CPOExecutor):
+    """Runs each process on a thread whose stack is the smallest of SIZES
+    which is at least what the process asks for. Each size has a
+    CachedExecutor of its own, which starts its threads with that stack size
+    and reuses them only for processes of the same size. Processes which ask
+    for no size run on threads of the platform's default size, and those
+    which ask for more than the largest of SIZES on threads of their own
+    size, rounded up to a page."""
 
-    def __init__(self, make_pool, report: bool) -> None:
-        self.make_pool = make_pool
+    SIZES = [1 << x for x in [15, 17, 19, 21, 23]]  # 32KiB to 8MiB
+
+    def __init__(self, keep_alive: util.Nanoseconds, report: bool) -> None:
+        """
+
+        Args:
+            keep_alive: How long a thread may be idle before it exits.
+            report: Whether to print the threads of each size at shutdown.
+        """
+        self.keep_alive = keep_alive
         self.report = report
-        self.SIZES = [1 << x for x in [8, 10, 12, 14, 16]]
-        self.N = len(self.SIZES)
-        self.pools: List[ThreadPooledExecutor] = [
-            make_pool(s) for s in self.SIZES]
-        self.other: ThreadPooledExecutor = make_pool(0)
+        self.lock = threading.Lock()
+        self.pools: Dict[int, CachedExecutor] = {}
+
+    def bucket(self, stack_size: Optional[int]) -> int:
+        """The stack size of the threads which run processes asking for
+        stack_size"""
+        if not stack_size:
+            return 0
+        for size in self.SIZES:
+            if stack_size <= size:
+                return size
+        return threads.round_stack_size(stack_size)
+
+    def execute(self, runnable: util.Runnable, stack_size: int) -> None:
+        size = self.bucket(stack_size)
+        pool = self.pools.get(size)
+        if pool is None:
+            with self.lock:
+                pool = self.pools.get(size)
+                if pool is None:
+                    pool = self.pools[size] = CachedExecutor(self.keep_alive)
+        pool.execute(runnable, size)
+
+    def stats(self) -> Dict[int, Dict[str, int]]:
+        """The threads of each stack size: how many have been created, how
+        many are live, and the most which have been live and running at
+        once"""
+        with self.lock:
+            pools = sorted(self.pools.items())
+        return {size: pool.stats() for size, pool in pools}
+
+    def reserved_stack(self) -> int:
+        """The bytes of stack reserved by the live threads, not counting those
+        of the platform's default size"""
+        with self.lock:
+            pools = list(self.pools.items())
+        return sum(size * pool.live_threads for size, pool in pools)
+
+    def activity(self) -> Dict[str, int]:
+        with self.lock:
+            pools = list(self.pools.values())
+        result = {'threads': 0, 'active': 0, 'queued': 0}
+        for pool in pools:
+            for k, v in pool.activity().items():
+                result[k] += v
+        return result
+
+    def format_report(self) -> str:
+        return format_report(self.stats())
+
+    def shutdown(self) -> None:
+        with self.lock:
+            pools = list(self.pools.values())
+        for pool in pools:
+            pool.shutdown()
+        if self.report and pools:
+            util.synced_print(self.format_report())
+
+def format_report(stats: Dict[int, Dict[str, int]]) -> str:
+    """Describe the threads of each stack size, and the stack they reserve
+    at their peak"""
+    lines = ['CPO executor threads by stack size']
+    reserved = 0
+    for size, counts in stats.items():
+        name = f'{size // 1024}KiB' if size else 'default'
+        counts_ = ', '.join(f'{k}={v}' for k, v in counts.items())
+        lines.append(f'{name:>10}: {counts_}')
+        reserved += size * counts['peak live']
+    lines.append(f'peak reserved stack {reserved // 1024}KiB, excluding '
+                 f'threads of the default size')
+    return '\n'.join(lines)
+
+
+class _CachedWorker:
+    """A thread of a CachedExecutor, and the task handed to it"""
+
+    def __init__(self, stack_size: int) -> None:
+        self.stack_size = stack_size
+        self.task: Optional[util.Runnable] = None
+        self.thread: Optional[threading.Thread] = None
+
+class CachedExecutor(CPOExecutor):
+    """Runs each process on an idle thread if there is one, and otherwise on
+    a new thread, so that any number of processes can block on each other at
+    once. Threads are only reused for processes which ask for the same stack
+    size, and are reaped once they have been idle for longer than keep_alive.
+    """
+
+    def __init__(self, keep_alive: util.Nanoseconds) -> None:
+        """
+
+        Args:
+            keep_alive: How long a thread may be idle before it exits.
+        """
+        self.keep_alive = keep_alive
+        self.lock = threading.Lock()
+        # idle workers by stack size, the most recently idle last so that
+        # it is reused first and the others can time out
+        self.idle: Dict[int, OrderedDict] = {}
+        self.live = 0
+        self.running = 0
+        self.peak_live = 0
+        self.peak_running = 0
+        self.thread_count = atomic.AtomicCounter()
+        self.is_shutdown = False
+
+    @property
+    def live_threads(self) -> int:
+        return self.live
+
+    @property
+    def idle_threads(self) -> int:
+        with self.lock:
+            return sum(len(workers) for workers in self.idle.values())
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                'created': self.thread_count.get(),
+                'live': self.live,
+                'peak live': self.peak_live,
+                'peak running': self.peak_running,
+            }
+
+    def activity(self) -> Dict[str, int]:
+        return {'threads': self.live, 'active': self.running, 'queued': 0}
+
+    def __str__(self) -> str:
+        return f'CachedExecutor(live={self.live_threads}, ' \
+               f'idle={self.idle_threads}, ' \
+               f'keep_alive={self.keep_alive.to_seconds()}s)'
+
+    def execute(self, runnable: util.Runnable, stack_size: int) -> None:
+        with self.lock:
+            if self.is_shutdown:
+                raise RuntimeError('CachedExecutor has been shut down')
+            workers = self.idle.get(stack_size)
+            if workers:
+                _, worker = workers.popitem(last=True)
+                worker.task = runnable
+            else:
+                worker = None
+                self.live += 1
+                self.peak_live = max(self.peak_live, self.live)
+            self.running += 1
+            self.peak_running = max(self.peak_running, self.running)
+        if worker is not None:
+            threads.unpark(worker.thread)
+            return
+        worker = _CachedWorker(stack_size)
+        try:
+            worker.thread = threading.Thread(
+                target=self._work,
+                args=(worker, runnable),
+                name='cpo-cached-%d' % self.thread_count.inc(1),
+                daemon=True,
+            )
+            with threads.StackSize(stack_size):
+                worker.thread.start()
+        except BaseException:
+            with self.lock:
+                self.live -= 1
+                self.running -= 1
+            raise
+
+    def _work(self, worker: _CachedWorker,
+              task: Optional[util.Runnable]) -> None:
+        try:
+            while task is not None:
+                task.run()
+                task = self._next_task(worker)
+        finally:
+            with self.lock:
+                self.idle.get(worker.stack_size, {}).pop(id(worker), None)
+                self.live -= 1
+
+    def _next_task(self, worker: _CachedWorker) -> Optional[util.Runnable]:
+        """Wait, idle, for up to keep_alive to be handed another task"""
+        with self.lock:
+            self.running -= 1
+            if self.is_shutdown:
+                return None
+            worker.task = None
+            workers = self.idle.setdefault(worker.stack_size, OrderedDict())
+            workers[id(worker)] = worker
+        threads.park_current_thread_until_elapsed_or(
+            self.keep_alive,
+            lambda: worker.task is not None or self.is_shutdown)
+        with self.lock:
+            # the task is handed over under the lock, so if we are still
+            # idle no task is coming
+            if worker.task is None:
+                self.idle[worker.stack_size].pop(id(worker), None)
+            return worker.task
+
+    def shutdown(self) -> None:
+        with self.lock:
+            self.is_shutdown = True
+            idle = [w for workers in self.idle.values()
+                    for w in workers.values()]
+        for worker in idle:
+            threads.unpark(worker.thread)
+
+
+
+class _StealingWorker:
+    """A thread of a StealingExecutor, and the deque of the tasks forked by
+    the processes it runs. Only the worker touches its counters."""
+
+    def __init__(self) -> None:
+        self.tasks: Deque[util.Runnable] = deque()
+        self.thread: Optional[threading.Thread] = None
+        self.idle = False
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.steals = 0
+
+    def taken(self) -> int:
+        return self.local_hits + self.shared_hits + self.steals
+
+class StealingExecutor(CPOExecutor):
+    """Runs processes on workers which each have a deque of their own. A
+    process forked from a worker goes on the worker's deque and others on a
+    shared deque. A worker takes the newest task from its own deque, then
+    the oldest from the shared deque, and then steals the oldest from
+    another worker.
+
+    Up to workers threads are started as they are needed. CSO processes
+    block on each other, so a task which has waited for stall while no task
+    has been taken and no worker is idle has its workers doubled, up to the
+    number of waiting tasks. Threads idle for longer than keep_alive exit.
+    """
+
+    def __init__(self, workers: int, keep_alive: util.Nanoseconds,
+                 stall: util.Nanoseconds, stack_size: int = 0) -> None:
+        """
+
+        Args:
+            workers: The number of threads to start before waiting to see
+                whether they are blocked.
+            keep_alive: How long a thread may be idle before it exits.
+            stall: How long tasks may wait without any being taken before
+                more threads are started.
+            stack_size: The stack size of every thread.
+        """
+        self.workers = workers
+        self.keep_alive = keep_alive
+        self.stall = stall
+        self.stack_size = stack_size
+        self.lock = threading.Lock()
+        self.all: List[_StealingWorker] = []
+        self.idle: Deque[_StealingWorker] = deque()
+        self.shared: Deque[util.Runnable] = deque()
+        self.local = threading.local()
+        self.thread_count = atomic.AtomicCounter()
+        # the counts of workers which have exited
+        self.retired = {'local hits': 0, 'shared hits': 0, 'steals': 0}
+        self.compensations = 0
+        self.monitoring = False
+        self.last_taken = 0
+        self.is_shutdown = False
 
     def execute(self, runnable: util.Runnable, stack_size: int) -> None:
-        i = 0
-        if stack_size == 0:
-            self.other.execute(runnable, 0)
+        worker: Optional[_StealingWorker] = getattr(self.local, 'worker', None)
+        if worker is not None:
+            worker.tasks.append(runnable)
         else:
-            while i < self.N and stack_size > self.SIZES[i]:
-                i += 1
-            if i == self.N:
-                self.other.execute(runnable, 0)
+            self.shared.append(runnable)
+        try:
+            idle = self.idle.pop()
+        except IndexError:
+            idle = None
+        if idle is not None:
+            idle.idle = False
+            threads.unpark(idle.thread)
+            return
+        with self.lock:
+            if self.is_shutdown:
+                raise RuntimeError('StealingExecutor has been shut down')
+            if len(self.all) >= self.workers:
+                self._monitor()
+                return
+            worker = self._new_worker()
+        self._start(worker)
+
+    def _new_worker(self) -> _StealingWorker:
+        """A worker, counted as live, with the lock held"""
+        worker = _StealingWorker()
+        self.all.append(worker)
+        return worker
+
+    def _start(self, worker: _StealingWorker) -> None:
+        worker.thread = threading.Thread(
+            target=self._work,
+            args=(worker,),
+            name='cpo-stealing-%d' % self.thread_count.inc(1),
+            daemon=True,
+        )
+        with threads.StackSize(self.stack_size):
+            worker.thread.start()
+
+    def _work(self, worker: _StealingWorker) -> None:
+        self.local.worker = worker
+        try:
+            while True:
+                task = self._find(worker)
+                if task is None:
+                    task = self._wait(worker)
+                    if task is None:
+                        return
+                task.run()
+        finally:
+            with self.lock:
+                self.all.remove(worker)
+                self.retired['local hits'] += worker.local_hits
+                self.retired['shared hits'] += worker.shared_hits
+                self.retired['steals'] += worker.steals
+
+    def _find(self, worker: _StealingWorker) -> Optional[util.Runnable]:
+        try:
+            task = worker.tasks.pop()
+            worker.local_hits += 1
+            return task
+        except IndexError:
+            pass
+        try:
+            task = self.shared.popleft()
+            worker.shared_hits += 1
+            return task
+        except IndexError:
+            pass
+        victims = list(self.all)
+        start = random.randrange(len(victims)) if victims else 0
+        for i in range(len(victims)):
+            victim = victims[(start + i) % len(victims)]
+            if victim is worker:
+                continue
+            try:
+                task = victim.tasks.popleft()
+                worker.steals += 1
+                return task
+            except IndexError:
+                pass
+        return None
+
+    def _unidle(self, worker: _StealingWorker) -> bool:
+        """Stop worker being idle. Returns False if it had already been
+        taken off the idle deque to be handed a task."""
+        worker.idle = False
+        try:
+            self.idle.remove(worker)
+            return True
+        except ValueError:
+            return False
+
+    def _wait(self, worker: _StealingWorker) -> Optional[util.Runnable]:
+        """Wait, idle, for up to keep_alive for a task"""
+        deadline = util.nano_time() + self.keep_alive
+        while True:
+            # go idle before looking again, so that a task added after we
+            # have looked unparks us
+            worker.idle = True
+            self.idle.append(worker)
+            task = self._find(worker)
+            if task is not None:
+                self._unidle(worker)
+                return task
+            if self.is_shutdown:
+                self._unidle(worker)
+                return None
+            left = threads.park_current_thread_until_deadline_or(
+                deadline, lambda: not worker.idle or self.is_shutdown)
+            if left <= 0 and self._unidle(worker):
+                return None
+            if left <= 0:
+                # we were handed a task as we timed out
+                deadline = util.nano_time() + self.keep_alive
             else:
-                self.pools[i].execute(runnable, stack_size)
+                self._unidle(worker)
+
+    def _monitor(self) -> None:
+        """Watch for stalled tasks, with the lock held"""
+        if not self.monitoring:
+            self.monitoring = True
+            self.last_taken = self._taken()
+            timer.timers.after(self.stall, self._check_stall)
+
+    def _check_stall(self) -> None:
+        """Called by the timer service, start more workers if tasks are
+        waiting and none have been taken since the last check"""
+        depth = self.queue_depth()
+        with self.lock:
+            taken = self._taken()
+            if depth == 0 or self.is_shutdown:
+                self.monitoring = False
+                return
+            workers = []
+            if taken == self.last_taken and not self.idle:
+                n = min(depth, max(1, len(self.all)))
+                self.compensations += n
+                workers = [self._new_worker() for _ in range(n)]
+            self.last_taken = taken
+        for worker in workers:
+            self._start(worker)
+        timer.timers.after(self.stall, self._check_stall)
+
+    def _taken(self) -> int:
+        """The number of tasks workers have taken, with the lock held"""
+        return sum(w.taken() for w in self.all) + sum(self.retired.values())
+
+    def queue_depth(self) -> int:
+        """The number of tasks waiting to be run"""
+        return len(self.shared) + sum(len(w.tasks) for w in list(self.all))
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            workers = list(self.all)
+            result = {
+                'workers': len(workers),
+                'idle': len(self.idle),
+                'compensations': self.compensations,
+            }
+            retired = dict(self.retired)
+        result['local hits'] = retired['local hits'] + \
+            sum(w.local_hits for w in workers)
+        result['shared hits'] = retired['shared hits'] + \
+            sum(w.shared_hits for w in workers)
+        result['steals'] = retired['steals'] + sum(w.steals for w in workers)
+        result['queue depth'] = self.queue_depth()
+        return result
+
+    def activity(self) -> Dict[str, int]:
+        with self.lock:
+            workers, idle = len(self.all), len(self.idle)
+        return {
+            'threads': workers,
+            'active': workers - idle,
+            'queued': self.queue_depth(),
+        }
+
+    def __str__(self) -> str:
+        stats = ', '.join(f'{k}={v}' for k, v in self.stats().items())
+        return f'StealingExecutor({stats})'
 
     def shutdown(self) -> None:
-        if self.report:
-            for pool in self.pools:
-                pool.shutdown()
-            self.other.shutdown()
+        with self.lock:
+            self.is_shutdown = True
+            idle = list(self.idle)
+        for worker in idle:
+            threads.unpark(worker.thread)
 
 
 poolKIND = config.get('poolKIND', 'ADAPTIVE').upper()
@@ -88,6 +573,9 @@ poolREPORT = config.get('poolREPORT', False)
 poolG = config.get('poolG', 0)
 poolM = config.get('poolM', 0)
 poolK = config.get('poolK', 0)
+poolKEEPALIVE = config.get('poolKEEPALIVE', 60)  # seconds
+poolWORKERS = config.get('poolWORKERS', 0) or os.cpu_count() or 1
+poolSTALL = config.get('poolSTALL', 0.001)  # seconds
 poolSTACKSIZE = 1024 * (1024 * (1024 * poolG + poolM) + poolK)  # horners method
 
 def size_pooled_cpo_executor(stack_size: int):
@@ -101,16 +589,26 @@ def size_pooled_cpo_executor(stack_size: int):
 executor: Optional[CPOExecutor] = None
 if poolKIND == 'SIZED':
     executor = SizePooledExecutor(
-        size_pooled_cpo_executor,
+        util.Nanoseconds.from_seconds(poolKEEPALIVE),
         poolREPORT,
     )
 elif poolKIND == 'ADAPTIVE':
     executor = size_pooled_cpo_executor(poolSTACKSIZE)
 elif poolKIND == 'CACHED':
-    raise NotImplementedError
+    executor = CachedExecutor(util.Nanoseconds.from_seconds(poolKEEPALIVE))
+elif poolKIND == 'STEALING':
+    executor = StealingExecutor(
+        poolWORKERS,
+        util.Nanoseconds.from_seconds(poolKEEPALIVE),
+        util.Nanoseconds.from_seconds(poolSTALL),
+        poolSTACKSIZE,
+    )
 elif poolKIND == 'UNPOOLED':
     executor = UnpooledExecutor()
 else:
-    raise ValueError('poolKIND should be SIZED, ADAPTIVE, CACHED or UNPOOLED. '
-                     f'Not {poolKIND}')
+    raise ValueError('poolKIND should be SIZED, ADAPTIVE, CACHED, STEALING or '
+                     f'UNPOOLED. Not {poolKIND}')
+
+if poolREPORT:
+    atexit.register(executor.shutdown)
 
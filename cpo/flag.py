@@ -37,8 +37,12 @@ class _Flag(semaphore.Semaphore):
         current = threading.current_thread()
         if not self._waiting.compare_and_set(None, current):
             raise Exception(f"Logic Error: cannot wait already awaited: {self}")
-        while not self._available.get():
-            threads.park_current_thread()
+        try:
+            while not self._available.get():
+                threads.park_current_thread()
+        except util.Cancelled:
+            self._waiting.compare_and_set(current, None)
+            raise
 
     def cancelled(self) -> bool:
         return self._interrupted
@@ -47,22 +51,15 @@ class _Flag(semaphore.Semaphore):
         if self._available.get():
             return True
         current = threading.current_thread()
-        deadline = util.nano_time() + timeout
-        waiting, outcome = True, True
         if not self._waiting.compare_and_set(None, current):
             raise Exception(f"Logic Error: {current} cannot await "
                             f"already awaited: {self} ")
-        while waiting:
-            if self._available.get():
-                waiting = False
-            else:
-                left = deadline - util.nano_time()
-                if left <= 0:
-                    outcome, waiting = False, False
-                else:
-                    threads.park_current_thread(left)
-                    if deadline < util.nano_time():
-                        outcome, waiting = False, False
+        try:
+            outcome = 0 < threads.park_current_thread_until_elapsed_or(
+                timeout, self._available.get)
+        except util.Cancelled:
+            self._waiting.compare_and_set(current, None)
+            raise
         if outcome is False:
             self._waiting.set(None)
         return outcome
@@ -0,0 +1,379 @@
+from __future__ import annotations
+
+import atexit
+import io
+import itertools
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import traceback
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import channel
+from . import config
+from . import process
+from . import threads
+from . import util
+
+isolateMETHOD = config.get('isolateMETHOD', 'spawn')
+
+class WorkerDied(Exception):
+    """The worker process running an isolated process exited before it
+    finished"""
+    pass
+
+class IsolatedError(Exception):
+    """An exception raised by an isolated process which could not be sent
+    back to the parent as it was"""
+    pass
+
+# the operations which a worker may perform on a channel of its parent
+_OPS = {
+    '__invert__', 'read_before', 'read_many', '__lshift__', 'write_before',
+    'write_many', 'close', 'close_in', 'close_out', 'can_input', 'can_output',
+}
+
+class _Pickler(pickle.Pickler):
+    """Pickles channels by reference. The parent exports its channels to the
+    worker, and the worker refers back to them with RemoteChan. Channels
+    which can themselves cross processes, such as ShmN2NBuf, are pickled as
+    they are."""
+
+    def __init__(self, file, exports: Optional[Dict[int, channel.Chan]]):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.exports = exports
+
+    def persistent_id(self, obj):
+        if self.exports is not None and isinstance(obj, channel.Chan) \
+                and not getattr(obj, 'crosses_processes', False):
+            self.exports[id(obj)] = obj
+            return 'chan', id(obj), obj.name
+        if isinstance(obj, RemoteChan):
+            return 'chan', obj.key, obj.name
+        return None
+
+class _Unpickler(pickle.Unpickler):
+
+    def __init__(self, file, resolve: Callable[[int, str], Any]):
+        super().__init__(file)
+        self.resolve = resolve
+
+    def persistent_load(self, pid):
+        _, key, name = pid
+        return self.resolve(key, name)
+
+def _dumps(obj, exports: Optional[Dict[int, channel.Chan]] = None) -> bytes:
+    buffer = io.BytesIO()
+    _Pickler(buffer, exports).dump(obj)
+    return buffer.getvalue()
+
+def _loads(data: bytes, resolve: Callable[[int, str], Any]):
+    return _Unpickler(io.BytesIO(data), resolve).load()
+
+def _portable(exc: BaseException) -> BaseException:
+    """exc, or a stand in for it if it cannot be pickled"""
+    exc.remote_traceback = ''.join(
+        traceback.format_exception(type(exc), exc, exc.__traceback__))
+    try:
+        pickle.dumps(exc)
+        return exc
+    except Exception:
+        stand_in = IsolatedError(f'{type(exc).__name__}: {exc}')
+        stand_in.remote_traceback = exc.remote_traceback
+        return stand_in
+
+
+class RemoteChan(channel.InPort, channel.OutPort):
+    """Stands in for a channel of the parent, within a worker process. Each
+    operation is performed on the channel by the parent on behalf of the
+    worker."""
+
+    def __init__(self, client: _Client, key: int, name: str) -> None:
+        self.client = client
+        self.key = key
+        self.name = name
+
+    def __str__(self) -> str:
+        return f'RemoteChan({self.name})'
+
+    def _call(self, op: str, *args):
+        return self.client.call(self.key, op, args)
+
+    def __invert__(self):
+        return self._call('__invert__')
+
+    def read_before(self, ns: util.Nanoseconds):
+        return self._call('read_before', ns)
+
+    def read_many(self, max_n: int, timeout: Optional[util.Nanoseconds] = None):
+        return self._call('read_many', max_n, timeout)
+
+    def __lshift__(self, value):
+        return self._call('__lshift__', value)
+
+    def write_before(self, nswait: util.Nanoseconds, value) -> bool:
+        return self._call('write_before', nswait, value)
+
+    def write_many(self, values) -> int:
+        return self._call('write_many', list(values))
+
+    def close(self) -> None:
+        self._call('close')
+
+    def close_in(self) -> None:
+        self._call('close_in')
+
+    def close_out(self) -> None:
+        self._call('close_out')
+
+    @property
+    def can_input(self) -> bool:
+        return self._call('can_input')
+
+    @property
+    def can_output(self) -> bool:
+        return self._call('can_output')
+
+
+class _Client:
+    """The worker's end of the connection to its parent. Any thread of the
+    worker may use a RemoteChan, its replies are routed back to it by a
+    receiving thread."""
+
+    def __init__(self, conn) -> None:
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.request_ids = itertools.count()
+        # request id -> [waiting thread, done, result, exception]
+        self.replies: Dict[int, List] = {}
+        self.runs: queue.SimpleQueue = queue.SimpleQueue()
+        self.receiver = threading.Thread(
+            target=self._receive, name='cpo-isolate-receiver', daemon=True)
+        self.receiver.start()
+
+    def send(self, msg) -> None:
+        data = _dumps(msg)
+        with self.send_lock:
+            self.conn.send_bytes(data)
+
+    def _resolve(self, key: int, name: str) -> RemoteChan:
+        return RemoteChan(self, key, name)
+
+    def _receive(self) -> None:
+        while True:
+            try:
+                msg = _loads(self.conn.recv_bytes(), self._resolve)
+            except (EOFError, OSError):
+                # the parent has gone
+                os._exit(0)
+            if msg[0] == 'reply':
+                _, request, result, exc = msg
+                slot = self.replies.pop(request, None)
+                if slot is not None:
+                    slot[1:] = [True, result, exc]
+                    threads.unpark(slot[0])
+            else:
+                self.runs.put(msg)
+
+    def call(self, key: int, op: str, args: Tuple):
+        request = next(self.request_ids)
+        slot = [threading.current_thread(), False, None, None]
+        self.replies[request] = slot
+        self.send(('op', request, threading.get_ident(), key, op, args))
+        # not cancellable, the reply is still on its way
+        parker = threads.get_parker(threading.current_thread())
+        while not slot[1]:
+            parker.park()
+        if slot[3] is not None:
+            raise slot[3]
+        return slot[2]
+
+def _worker_main(conn) -> None:
+    client = _Client(conn)
+    while True:
+        msg = client.runs.get()
+        if msg[0] == 'stop':
+            return
+        _, fn, args, kwargs = msg
+        try:
+            outcome = ('done', fn(*args, **kwargs), None)
+        except BaseException as e:
+            outcome = ('done', None, _portable(e))
+        try:
+            client.send(outcome)
+        except Exception as e:
+            client.send(('done', None, _portable(e)))
+
+
+class _Worker:
+    """The parent's end of a worker process. Channel operations requested by
+    the worker are performed by a service thread for each thread of the
+    worker, so that the operations of each worker thread stay in order and
+    may block independently."""
+
+    def __init__(self, number: int) -> None:
+        context = multiprocessing.get_context(isolateMETHOD)
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn,),
+            name=f'cpo-isolate-{number}',
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.send_lock = threading.Lock()
+        self.exports: Dict[int, channel.Chan] = {}
+        self.services: Dict[int, queue.SimpleQueue] = {}
+        self.waiting: Optional[threading.Thread] = None
+        self.outcome: Optional[Tuple[Any, Optional[BaseException]]] = None
+        self.alive = True
+        self.receiver = threading.Thread(
+            target=self._receive, name=f'cpo-isolate-{number}-receiver',
+            daemon=True)
+        self.receiver.start()
+
+    def send(self, msg) -> None:
+        data = _dumps(msg, self.exports)
+        with self.send_lock:
+            self.conn.send_bytes(data)
+
+    def _resolve(self, key: int, name: str) -> channel.Chan:
+        return self.exports[key]
+
+    def _receive(self) -> None:
+        while True:
+            try:
+                msg = _loads(self.conn.recv_bytes(), self._resolve)
+            except (EOFError, OSError):
+                break
+            if msg[0] == 'done':
+                _, result, exc = msg
+                self._finish(result, exc)
+            else:
+                _, request, ident, key, op, args = msg
+                self._service(ident).put((request, key, op, args))
+        self.alive = False
+        self._finish(None, WorkerDied(self.process.name))
+
+    def _finish(self, result, exc: Optional[BaseException]) -> None:
+        if self.outcome is None:
+            self.outcome = (result, exc)
+            threads.unpark(self.waiting)
+
+    def _service(self, ident: int) -> queue.SimpleQueue:
+        requests = self.services.get(ident)
+        if requests is None:
+            requests = self.services[ident] = queue.SimpleQueue()
+            threading.Thread(
+                target=self._serve, args=(requests,),
+                name=f'{self.process.name}-service', daemon=True,
+            ).start()
+        return requests
+
+    def _serve(self, requests: queue.SimpleQueue) -> None:
+        while True:
+            request = requests.get()
+            if request is None:
+                return
+            request_id, key, op, args = request
+            result, exc = None, None
+            try:
+                chan = self.exports.get(key)
+                if chan is None or op not in _OPS:
+                    raise util.Closed(key)
+                attr = getattr(chan, op)
+                result = attr(*args) if callable(attr) else attr
+            except Exception as e:
+                exc = _portable(e)
+            try:
+                self.send(('reply', request_id, result, exc))
+            except Exception as e:
+                self.send(('reply', request_id, None, _portable(e)))
+
+    def run(self, fn: Callable, args: Tuple, kwargs: Dict) -> Any:
+        """Run fn(*args, **kwargs) in the worker process, and wait for its
+        result"""
+        self.waiting = threading.current_thread()
+        self.outcome = None
+        try:
+            if not self.alive:
+                raise WorkerDied(self.process.name)
+            self.send(('run', fn, args, kwargs))
+            # not cancellable, a later run would take the outcome as its own
+            parker = threads.get_parker(threading.current_thread())
+            while self.outcome is None:
+                parker.park()
+            result, exc = self.outcome
+        finally:
+            for requests in list(self.services.values()):
+                requests.put(None)
+            self.services.clear()
+            self.exports.clear()
+            self.waiting = None
+        if exc is not None:
+            raise exc
+        return result
+
+    def stop(self) -> None:
+        try:
+            self.send(('stop',))
+        except OSError:
+            pass
+
+
+class WorkerPool:
+    """The worker processes which run isolated processes. A worker is
+    started whenever none is idle, so that isolated processes which wait on
+    each other cannot deadlock the pool, and is kept to be reused."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.idle: List[_Worker] = []
+        self.started = 0
+
+    def acquire(self) -> _Worker:
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+            self.started += 1
+            number = self.started
+        return _Worker(number)
+
+    def release(self, worker: _Worker) -> None:
+        if worker.alive:
+            with self.lock:
+                self.idle.append(worker)
+
+    def shutdown(self) -> None:
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for worker in idle:
+            worker.stop()
+
+pool = WorkerPool()
+atexit.register(pool.shutdown)
+
+
+class Isolated(process.Simple):
+    """A process whose body runs in a worker OS process, so that CPU bound
+    processes are not serialised by the GIL. The body, and its arguments,
+    are pickled, so the body must be a module level function. Channels
+    among the arguments are passed by reference, each operation on them in
+    the worker being performed by the parent. The result or exception of
+    the body is returned to the parent."""
+
+    def __init__(self, fn: Callable, *args, name=None, **kwargs) -> None:
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        super().__init__(self.run_isolated, name=fn if name is None else name)
+
+    def run_isolated(self) -> Any:
+        worker = pool.acquire()
+        try:
+            return worker.run(self.fn, self.args, self.kwargs)
+        finally:
+            pool.release(worker)
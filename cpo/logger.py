@@ -1,67 +1,209 @@
 
-import collections
 from dataclasses import dataclass
+import heapq
 import inspect
+import sys
 import threading
+from time import time_ns
 import types
-from typing import Deque, Optional
+from typing import List, Optional, Tuple
+import weakref
 
 from . import config
 from .register import Debuggable
-from . import threads
+from . import trace
 from . import util
 from .util import Nanoseconds
 
+# A Logger is a flight recorder. Each thread logs into a ring of its own,
+# preallocated, so logging takes no lock and allocates only the tuple it
+# stores. Only the code object and line number of the caller are kept, the
+# rest of its frame info is worked out when the log is dumped, which merges
+# the rings in time order. The rings of threads which have exited are merged
+# into one retired ring, of the same size, so that threads which come and go
+# don't each leave a ring behind.
+
+# timestamp, thread name, code, line number, text
+Slot = Tuple[int, str, Optional[types.CodeType], int, object]
+
 @dataclass
 class Event:
     timestamp: Nanoseconds
     thread_id: str
-    tb: Optional[inspect.Traceback]
+    code: Optional[types.CodeType]
+    lineno: int
     text: str
 
+    @property
+    def function(self) -> str:
+        return "unknown" if self.code is None else self.code.co_name
+
+    @property
+    def filename(self) -> str:
+        return "unknown" if self.code is None else self.code.co_filename
+
+    @property
+    def tb(self) -> Optional[inspect.Traceback]:
+        """The frame info of the caller, as inspect.getframeinfo gave it,
+        without the source lines"""
+        if self.code is None:
+            return None
+        return inspect.Traceback(self.filename, self.lineno, self.function,
+                                 None, None)
+
     def __str__(self):
-        fn: str = "unknown" if self.tb is None else str(self.tb.function)
-        return f'{self.timestamp}:: {self.thread_id}@{fn}: {self.text}'
+        return f'{self.timestamp}:: {self.thread_id}@{self.function}:' \
+               f'{self.lineno}: {self.text}'
+
+class _Ring:
+    """The events logged by one thread, written only by that thread. A ring
+    of size 0 keeps every event."""
+
+    __slots__ = ('ident', 'thread', 'slots', 'size', 'count')
+
+    def __init__(self, size: int) -> None:
+        self.ident = threading.get_ident()
+        self.thread = weakref.ref(threading.current_thread())
+        self.slots: List[Optional[Slot]] = [None] * size
+        self.size = size
+        # the number of events ever logged
+        self.count = 0
+
+    def snapshot(self) -> List[Slot]:
+        """The events still in the ring, oldest first"""
+        count, slots = self.count, list(self.slots)
+        if self.size == 0 or count <= self.size:
+            result = slots[:count]
+        else:
+            i = count % self.size
+            result = slots[i:] + slots[:i]
+        return [s for s in result if s is not None]
+
+    def is_alive(self) -> bool:
+        thread = self.thread()
+        return thread is not None and thread.is_alive()
+
+# the loggers which dump when a process crashes
+_crash_recorders: 'weakref.WeakSet[Logger]' = weakref.WeakSet()
 
 class Logger(Debuggable):
+    """Records the last log_size events of each thread, or every event if
+    log_size is 0. An event is only logged if it has no bits, or one of
+    its bits is in mask. Events are also appended to sink, if there is one,
+    to keep the whole of a long run."""
 
-    def __init__(self, name: str, log_size: int, mask: int = 0xFFFFFFFF):
+    def __init__(self, name: str, log_size: int, mask: int = 0xFFFFFFFF,
+                 dump_on_crash: bool = False,
+                 sink: Optional[trace.TraceSink] = None):
         super().__init__()
         self.name = name
         self.log_size = log_size
         self.mask = mask
-        self.entries: Deque[Event] = collections.deque()
-        self.events: Deque[Event] = self.entries
-        self.lock = threading.Lock()
+        self.sink = sink
+        self._local = threading.local()
+        self._rings: List[_Ring] = []
+        # the events of threads which have exited, oldest first, with the
+        # thread already identified
+        self._retired: List[Slot] = []
+        # guards the rings and retired, which log itself never touches
+        self._lock = threading.Lock()
+        if dump_on_crash:
+            _crash_recorders.add(self)
         self.register()
 
+    def _ring(self) -> _Ring:
+        ring = self._local.ring = _Ring(self.log_size)
+        with self._lock:
+            self._retire()
+            self._rings.append(ring)
+        return ring
+
+    @staticmethod
+    def _identified(ring: _Ring) -> List[Slot]:
+        return [(t, f'{name}#{ring.ident}', code, line, text)
+                for t, name, code, line, text in ring.snapshot()]
+
+    def _retire(self) -> None:
+        """Merge the rings of threads which have exited into the retired
+        ring, with the lock held"""
+        dead = [ring for ring in self._rings if not ring.is_alive()]
+        if not dead:
+            return
+        self._rings = [ring for ring in self._rings if ring.is_alive()]
+        retired = list(heapq.merge(self._retired,
+                                   *(self._identified(r) for r in dead),
+                                   key=lambda slot: slot[0]))
+        if self.log_size > 0:
+            retired = retired[-self.log_size:]
+        self._retired = retired
+
     def log(self, text, bits: Optional[int] = None):
-        if bits is None or self.mask & bits != bits:
-            with self.lock:
-                frame: Optional[types.FrameType] = inspect.currentframe()
-                if frame is None:
-                    tb = None
-                else:
-                    tb = inspect.getframeinfo(frame)
-                message = Event(
-                    util.nano_time(),
-                    threads.get_thread_identity(threading.current_thread()),
-                    tb,
-                    text
-                )
-                self.entries.append(message)
-                if self.log_size > 0 and len(self.entries) > self.log_size:
-                    self.entries.popleft()
+        if bits is not None and not self.mask & bits:
+            return
+        try:
+            ring = self._local.ring
+        except AttributeError:
+            ring = self._ring()
+        frame = sys._getframe(1)
+        slot = (time_ns(), threading.current_thread().name,
+                frame.f_code, frame.f_lineno, text)
+        if ring.size == 0:
+            ring.slots.append(slot)
+        else:
+            ring.slots[ring.count % ring.size] = slot
+        ring.count += 1
+        if self.sink is not None:
+            self.sink.record(trace.LOG, str(text))
 
     __call__ = log
 
+    @property
+    def entries(self) -> List[Event]:
+        """Every event still recorded, in time order. Events logged while
+        this is read may or may not be included."""
+        with self._lock:
+            self._retire()
+            rings = [self._identified(ring) for ring in self._rings]
+            rings.append(list(self._retired))
+        return [Event(Nanoseconds(t), thread_id, code, line, str(text))
+                for t, thread_id, code, line, text in
+                heapq.merge(*rings, key=lambda slot: slot[0])]
+
+    events = entries
+
     @property
     def num_entries(self):
-        return len(self.entries)
+        with self._lock:
+            rings = list(self._rings)
+            retired = len(self._retired)
+        return retired + sum(min(ring.count, ring.size) if ring.size
+                             else ring.count for ring in rings)
+
+    def dump(self, file=None) -> None:
+        """Print the events in time order"""
+        if file is None:
+            file = sys.stderr
+        util.synced_print(f'{self.name} Log', *self.entries, sep='\n\t',
+                          file=file)
+
+    def crashed(self, name: str, exc: BaseException) -> None:
+        """Dump the log on behalf of process name, which failed with exc"""
+        util.synced_print(f'{self.name}: process {name} crashed with {exc!r}',
+                          file=sys.stderr)
+        self.dump()
 
     def show_state(self, file):
-        util.synced_print(f'{str(self)} Log', *self.entries, sep='\n\t', file=file)
+        self.dump(file)
 
     print_state = show_state
 
-LOG = Logger("Logging", config.log_size, config.logging)
+def crashed(name: str, exc: BaseException) -> None:
+    """Process name has failed with exc, dump the loggers which asked to be
+    dumped when a process crashes"""
+    for logger in list(_crash_recorders):
+        logger.crashed(name, exc)
+
+_log_trace = config.get('logTRACE', '')
+LOG = Logger("Logging", config.log_size, config.logging,
+             config.get('logDUMP', False),
+             trace.TraceSink(_log_trace) if _log_trace else None)
@@ -3,6 +3,7 @@ import inspect
 import random
 from typing import Callable, Iterable, Optional, Sequence, TypeVar
 
+from . import isolate
 from . import process
 from .util import Closed, Crashed, Stopped
 
@@ -17,6 +18,26 @@ def proc(fn: Optional[Callable] = None, *args, **kwargs):
     else:
         return decorator(fn)
 
+def async_proc(fn: Optional[Callable] = None, *args, **kwargs):
+    """A decorator to create a process from a coroutine function"""
+    def decorator(fn):
+        def proc_():
+            return fn(*args, **kwargs)
+        return process.AsyncProc(proc_, name=fn)
+    if fn is None:
+        return decorator
+    else:
+        return decorator(fn)
+
+def isolated_proc(fn: Optional[Callable] = None, *args, **kwargs):
+    """A decorator to create a process which runs in a worker OS process"""
+    def decorator(fn):
+        return isolate.Isolated(fn, *args, **kwargs)
+    if fn is None:
+        return decorator
+    else:
+        return decorator(fn)
+
 T = TypeVar('T')
 def procs(variant_arg: Optional[Iterable[T]] = None,
           variant_args: Optional[Iterable[Sequence]] = None):
@@ -30,6 +51,21 @@ def procs(variant_arg: Optional[Iterable[T]] = None,
                          "variant_args but not both")
     return decorator
 
+def isolated_procs(variant_arg: Optional[Iterable[T]] = None,
+                   variant_args: Optional[Iterable[Sequence]] = None):
+    """ A decorator to create multiple concurrent processes which each run in
+    a worker OS process """
+    def decorator(fn: Callable) -> process.PROC:
+        if variant_arg is not None and variant_args is None:
+            return process.ParSyntax([isolated_proc(fn, arg)
+                                      for arg in variant_arg])
+        if variant_arg is None and variant_args is not None:
+            return process.ParSyntax([isolated_proc(fn, *args)
+                                      for args in variant_args])
+        raise ValueError("Must set one of variant_arg and "
+                         "variant_args but not both")
+    return decorator
+
 def ordered_procs(variant_arg: Optional[Iterable[T]] = None,
           variant_args: Optional[Iterable[Sequence]] = None):
     """ A decorator to create multiple ordered processes """
@@ -0,0 +1,228 @@
+
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+import weakref
+
+from . import config
+from . import executor
+from . import register
+from . import server
+
+# Metrics in the Prometheus text format. Channels and semaphores already
+# keep their counts, so a scrape reads them from the registered objects and
+# the executor rather than the hot path paying to publish them. The one
+# thing counted for the endpoint alone is how long channel operations wait,
+# in histograms which take no lock.
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# the type and help of each metric family
+FAMILIES: Dict[str, Tuple[str, str]] = {
+    'cpo_channel_reads_total': ('counter', 'Values read from the channel.'),
+    'cpo_channel_writes_total': ('counter', 'Values written to the channel.'),
+    'cpo_channel_blocked_readers':
+        ('gauge', 'Readers waiting on the channel.'),
+    'cpo_channel_blocked_writers':
+        ('gauge', 'Writers waiting on the channel.'),
+    'cpo_channel_wait_seconds':
+        ('histogram', 'How long reads and writes waited for a peer or for '
+                      'the buffer.'),
+    'cpo_semaphore_waits_total':
+        ('counter', 'Acquires which could not proceed at once.'),
+    'cpo_semaphore_waiting': ('gauge', 'Threads waiting to acquire.'),
+    'cpo_semaphore_available': ('gauge', 'Permits available.'),
+    'cpo_executor_threads': ('gauge', 'Threads of the executor.'),
+    'cpo_executor_active_threads':
+        ('gauge', 'Threads of the executor running a process.'),
+    'cpo_executor_queue_depth':
+        ('gauge', 'Processes waiting for a thread of the executor.'),
+}
+
+metricsWAITS = config.get('metricsWAITS', True)
+
+class _Shard:
+    """The counts of one thread"""
+
+    __slots__ = ('counts', 'total', 'thread')
+
+    def __init__(self) -> None:
+        self.counts: List[int] = []
+        self.total = 0
+        self.thread = weakref.ref(threading.current_thread())
+
+    def is_alive(self) -> bool:
+        thread = self.thread()
+        return thread is not None and thread.is_alive()
+
+def _add(counts: List[int], more: List[int]) -> None:
+    """Add the counts more to counts, bucket by bucket"""
+    if len(more) > len(counts):
+        counts.extend([0] * (len(more) - len(counts)))
+    for i, n in enumerate(more):
+        counts[i] += n
+
+class Histogram:
+    """Counts of durations in nanoseconds, in buckets whose upper bounds are
+    powers of two. Each thread observes into a shard of its own, so observe
+    takes no lock, and a shard only has buckets up to the longest duration
+    it has seen. The shards are added up when the histogram is scraped."""
+
+    # durations under 2**FIRST ns, about a microsecond, share a bucket
+    FIRST = 10
+
+    def __init__(self, name: str, labels: Dict[str, str]) -> None:
+        self.name = name
+        self.labels = labels
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        # the counts of threads which have exited, as the counts of a
+        # histogram never go down, but their shards are dropped so that
+        # threads which come and go don't each leave one behind
+        self._retired: List[int] = []
+        self._retired_total = 0
+        # guards the shards and retired, which observe never touches
+        self._lock = threading.Lock()
+
+    def _shard(self) -> _Shard:
+        shard = self._local.shard = _Shard()
+        with self._lock:
+            self._retire()
+            self._shards.append(shard)
+        return shard
+
+    def _retire(self) -> None:
+        """Fold the shards of threads which have exited into retired, with
+        the lock held"""
+        dead = [shard for shard in self._shards if not shard.is_alive()]
+        if not dead:
+            return
+        self._shards = [shard for shard in self._shards if shard.is_alive()]
+        for shard in dead:
+            _add(self._retired, shard.counts)
+            self._retired_total += shard.total
+
+    def observe(self, ns: int) -> None:
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+        i = ns.bit_length()
+        counts = shard.counts
+        try:
+            counts[i] += 1
+        except IndexError:
+            counts.extend([0] * (i - len(counts)))
+            counts.append(1)
+        shard.total += ns
+
+    def snapshot(self) -> Tuple[List[int], int]:
+        """The count in each bucket and the total of the durations"""
+        with self._lock:
+            self._retire()
+            counts = list(self._retired)
+            total = self._retired_total
+            shards = list(self._shards)
+        for shard in shards:
+            _add(counts, list(shard.counts))
+            total += shard.total
+        return counts, total
+
+    def count(self) -> int:
+        return sum(self.snapshot()[0])
+
+    def lines(self) -> List[str]:
+        counts, total = self.snapshot()
+        result = []
+        cumulative = 0
+        for i, n in enumerate(counts):
+            cumulative += n
+            if i >= self.FIRST or i == len(counts) - 1:
+                labels = dict(self.labels, le=repr((1 << i) / 1e9))
+                result.append(_line(self.name + '_bucket', labels,
+                                    cumulative))
+        result.append(_line(self.name + '_bucket',
+                            dict(self.labels, le='+Inf'), cumulative))
+        result.append(_line(self.name + '_sum', self.labels, total / 1e9))
+        result.append(_line(self.name + '_count', self.labels, cumulative))
+        return result
+
+histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+
+def histogram(name: str, **labels: str) -> Histogram:
+    """The histogram of name with labels, made on first use"""
+    key = (name, tuple(sorted(labels.items())))
+    found = histograms.get(key)
+    if found is None:
+        # setdefault is atomic, so racing callers share one histogram
+        found = histograms.setdefault(key, Histogram(name, labels))
+    return found
+
+def waits(kind: str, op: str) -> Optional[Histogram]:
+    """The histogram of the waits of op on channels of kind, or None if
+    waits are not being measured"""
+    if not metricsWAITS:
+        return None
+    return histogram('cpo_channel_wait_seconds', kind=kind, op=op)
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"') \
+        .replace('\n', r'\n')
+
+def _line(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        pairs = ','.join(f'{k}="{_escape(str(v))}"'
+                         for k, v in labels.items())
+        name = f'{name}{{{pairs}}}'
+    if isinstance(value, float):
+        return f'{name} {value!r}'
+    return f'{name} {value}'
+
+def executor_samples(
+        pool: Optional[executor.CPOExecutor]) -> List[register.Sample]:
+    if pool is None:
+        return []
+    labels = {'executor': type(pool).__name__}
+    activity = pool.activity()
+    return [
+        ('cpo_executor_threads', labels, activity['threads']),
+        ('cpo_executor_active_threads', labels, activity['active']),
+        ('cpo_executor_queue_depth', labels, activity['queued']),
+    ]
+
+def samples() -> Iterator[register.Sample]:
+    """The samples of every registered object and of the executor"""
+    for ref in list(register.registered.values()):
+        obj = ref()
+        if obj is not None:
+            try:
+                yield from obj.metrics()
+            except Exception:
+                # an object may be closed or collected as we read it
+                pass
+    yield from executor_samples(executor.executor)
+
+def render() -> str:
+    """Every metric, in the Prometheus text format"""
+    families: Dict[str, List[str]] = {}
+    for name, labels, value in samples():
+        families.setdefault(name, []).append(_line(name, labels, value))
+    for h in list(histograms.values()):
+        families.setdefault(h.name, []).extend(h.lines())
+    out = []
+    for name, lines in families.items():
+        kind, text = FAMILIES.get(name, ('untyped', ''))
+        out.append(f'# HELP {name} {text}')
+        out.append(f'# TYPE {name} {kind}')
+        out.extend(lines)
+    return '\n'.join(out) + '\n'
+
+def route(path: str, params: Dict[str, str]) -> server.Response:
+    if path == '/metrics':
+        return server.Response(200, render(), CONTENT_TYPE)
+    return server.Response(404, f'no such page {path}\n')
+
+def serve(port: int = 0, host: str = 'localhost') -> server.HTTPServer:
+    """Serve /metrics alone, without the debugger, from a thread of its own.
+    The port chosen is that of server.sock."""
+    sock = server.create_server(host, port, 64)
+    return server.HTTPServer(sock, route, name='cpo-metrics').start()
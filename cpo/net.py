@@ -0,0 +1,548 @@
+from __future__ import annotations
+
+import itertools
+import pickle
+import socket
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from .channel import CLOSEDSTATE, READYSTATE, UNKNOWNSTATE, InPort, \
+    OutPort, PortState
+from .ring import RingBuffer
+from . import server
+from . import util
+from .util import Nanoseconds
+
+Address = Union[Tuple[str, int], str]
+
+class Codec:
+    """Turns the values written to a network channel into bytes, and back"""
+
+    def encode(self, value: Any) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: bytes) -> Any:
+        raise NotImplementedError
+
+class PickleCodec(Codec):
+
+    def encode(self, value: Any) -> bytes:
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data: bytes) -> Any:
+        return pickle.loads(data)
+
+class BytesCodec(Codec):
+    """For channels which carry bytes, as they are"""
+
+    def encode(self, value: Any) -> bytes:
+        return bytes(value)
+
+    def decode(self, data: bytes) -> Any:
+        return data
+
+# a frame is the id of the logical channel, the kind of frame and the
+# length of its payload, followed by the payload
+_FRAME = struct.Struct('!IBI')
+_OPEN, _DATA, _CREDIT, _CLOSE, _CLOSE_IN = range(5)
+_COUNT = struct.Struct('!I')
+
+
+class Connection:
+    """A socket to a peer, shared by any number of logical channels. Frames
+    are queued and sent by a sending thread, which lets small frames that
+    are queued close together gather into a single send, as Nagle's
+    algorithm would, and frames are dispatched by a receiving thread."""
+
+    def __init__(self, sock: socket.socket, name: str,
+                 server: Optional[NetServer] = None,
+                 coalesce_bytes: int = 1 << 16,
+                 coalesce_delay: float = 0.0002) -> None:
+        """
+
+        Args:
+            sock: The connected socket.
+            name: The name of the connection for debugging.
+            server: The server which accepted the connection, if any.
+            coalesce_bytes: Queued frames are sent at once when there are at
+                least this many bytes of them.
+            coalesce_delay: How long, in seconds, small frames may wait for
+                others to gather, if a send was made that recently.
+        """
+        if sock.family != getattr(socket, 'AF_UNIX', None):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.name = name
+        self.server = server
+        self.coalesce_bytes = coalesce_bytes
+        self.coalesce_delay = coalesce_delay
+        self.cond = threading.Condition()
+        self.out = bytearray()
+        self.last_send = 0.0
+        self.closed = False
+        self.lost_ = False
+        self.ids = itertools.count(1)
+        # the out ports writing over this connection, and the streams of
+        # the in ports reading from it, by id
+        self.out_ports: Dict[int, NetOutPort] = {}
+        self.streams: Dict[int, _Stream] = {}
+        self.sends = 0
+        self.frames = 0
+        self.sender = threading.Thread(
+            target=self._send_loop, name=f'{name}-send', daemon=True)
+        self.receiver = threading.Thread(
+            target=self._receive_loop, name=f'{name}-receive', daemon=True)
+        self.sender.start()
+        self.receiver.start()
+
+    def __str__(self) -> str:
+        return f'Connection({self.name}, frames={self.frames}, ' \
+               f'sends={self.sends}{", CLOSED" if self.closed else ""})'
+
+    def send_frame(self, id_: int, kind: int, payload: bytes = b'') -> None:
+        with self.cond:
+            if self.closed:
+                raise util.Closed(self.name)
+            self.out += _FRAME.pack(id_, kind, len(payload))
+            self.out += payload
+            self.frames += 1
+            self.cond.notify()
+
+    def _send_loop(self) -> None:
+        try:
+            while True:
+                with self.cond:
+                    while not self.out and not self.closed:
+                        self.cond.wait()
+                    if not self.out:
+                        return
+                    if len(self.out) < self.coalesce_bytes and \
+                            time.monotonic() - self.last_send < \
+                            self.coalesce_delay:
+                        self.cond.wait(self.coalesce_delay)
+                    data, self.out = self.out, bytearray()
+                self.sock.sendall(data)
+                self.last_send = time.monotonic()
+                self.sends += 1
+        except OSError:
+            self.lost()
+
+    def _receive_loop(self) -> None:
+        rfile = self.sock.makefile('rb')
+        try:
+            while True:
+                header = rfile.read(_FRAME.size)
+                if len(header) < _FRAME.size:
+                    break
+                id_, kind, length = _FRAME.unpack(header)
+                payload = rfile.read(length)
+                if len(payload) < length:
+                    break
+                self._dispatch(id_, kind, payload)
+        except OSError:
+            pass
+        finally:
+            rfile.close()
+            self.lost()
+
+    def _dispatch(self, id_: int, kind: int, payload: bytes) -> None:
+        if kind == _DATA:
+            stream = self.streams.get(id_)
+            if stream is not None:
+                stream.port._receive(stream, payload)
+        elif kind == _CREDIT:
+            port = self.out_ports.get(id_)
+            if port is not None:
+                port._credit(_COUNT.unpack(payload)[0])
+        elif kind == _OPEN:
+            if self.server is not None:
+                port = self.server.in_port(payload.decode())
+                stream = self.streams[id_] = _Stream(self, id_, port)
+                port._open(stream)
+        elif kind == _CLOSE:
+            stream = self.streams.pop(id_, None)
+            if stream is not None:
+                stream.port._stream_closed(stream)
+        elif kind == _CLOSE_IN:
+            port = self.out_ports.pop(id_, None)
+            if port is not None:
+                port._remote_closed()
+
+    def open_out(self, port: NetOutPort, name: str) -> int:
+        id_ = next(self.ids)
+        self.out_ports[id_] = port
+        self.send_frame(id_, _OPEN, name.encode())
+        return id_
+
+    def lost(self) -> None:
+        """The connection has closed, so have all of its channels"""
+        with self.cond:
+            if self.lost_:
+                return
+            self.closed = self.lost_ = True
+            self.cond.notify_all()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        for port in list(self.out_ports.values()):
+            port._remote_closed()
+        self.out_ports.clear()
+        for stream in list(self.streams.values()):
+            stream.port._stream_closed(stream)
+        self.streams.clear()
+
+    def close(self) -> None:
+        """Send any queued frames, then close"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.sender.join()
+        self.lost()
+
+
+def _connect(address: Address) -> socket.socket:
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+class ConnectionPool:
+    """Shares one connection to each peer among all the out ports writing
+    to it"""
+
+    def __init__(self, **connection_args) -> None:
+        self.lock = threading.Lock()
+        self.connections: Dict[Address, Connection] = {}
+        self.connection_args = connection_args
+
+    def connect(self, address: Address) -> Connection:
+        with self.lock:
+            conn = self.connections.get(address)
+            if conn is None or conn.closed:
+                conn = self.connections[address] = Connection(
+                    _connect(address), f'cpo-net-{address}',
+                    **self.connection_args)
+            return conn
+
+    def close(self) -> None:
+        with self.lock:
+            connections, self.connections = self.connections, {}
+        for conn in connections.values():
+            conn.close()
+
+default_pool = ConnectionPool()
+
+
+class NetOutPort(OutPort):
+    """The writing end of a channel to a NetInPort of a remote NetServer.
+    Each write takes a credit, and the reader returns credits as it reads,
+    so a writer can never overrun the reader's buffer."""
+
+    def __init__(self, address: Address, name: str,
+                 codec: Optional[Codec] = None,
+                 pool: Optional[ConnectionPool] = None) -> None:
+        """
+
+        Args:
+            address: The (host, port) or unix socket path of the server.
+            name: The name of the server's in port to write to.
+            codec: Encodes the values written, pickle by default.
+            pool: The pool to share a connection from, default_pool by
+                default.
+        """
+        self.name = name
+        self.codec = PickleCodec() if codec is None else codec
+        self.cond = threading.Condition()
+        self.credits = 0
+        self.closed = False
+        self.conn = (default_pool if pool is None else pool).connect(address)
+        self.id = self.conn.open_out(self, name)
+
+    def __str__(self) -> str:
+        return f'NetOutPort({self.name}, credits={self.credits}' \
+               f'{", CLOSED" if self.closed else ""})'
+
+    def _credit(self, n: int) -> None:
+        with self.cond:
+            self.credits += n
+            self.cond.notify_all()
+
+    def _remote_closed(self) -> None:
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def _take_credit(self, deadline: Optional[Nanoseconds]) -> bool:
+        with self.cond:
+            while self.credits == 0:
+                if self.closed:
+                    raise util.Closed(self.name)
+                if deadline is None:
+                    self.cond.wait()
+                else:
+                    left = deadline - util.nano_time()
+                    if left <= 0:
+                        return False
+                    self.cond.wait(left.to_seconds())
+            if self.closed:
+                raise util.Closed(self.name)
+            self.credits -= 1
+        return True
+
+    def _send(self, value: Any) -> None:
+        try:
+            self.conn.send_frame(self.id, _DATA, self.codec.encode(value))
+        except util.Closed:
+            raise util.Closed(self.name)
+
+    def __lshift__(self, value: Any) -> Any:
+        self._take_credit(None)
+        self._send(value)
+        return value
+
+    def write_before(self, nswait: Nanoseconds, value: Any) -> bool:
+        if not self._take_credit(util.nano_time() + nswait):
+            return False
+        self._send(value)
+        return True
+
+    def write_many(self, values: Iterable[Any]) -> int:
+        written = 0
+        for value in values:
+            try:
+                self << value
+            except util.Closed:
+                if written == 0:
+                    raise
+                break
+            written += 1
+        return written
+
+    def close_out(self) -> None:
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify_all()
+        self.conn.out_ports.pop(self.id, None)
+        try:
+            self.conn.send_frame(self.id, _CLOSE)
+        except util.Closed:
+            pass
+
+    def close(self) -> None:
+        self.close_out()
+
+    @property
+    def can_output(self) -> bool:
+        return not self.closed
+
+    @property
+    def out_port_state(self) -> PortState:
+        if self.closed:
+            return CLOSEDSTATE
+        return READYSTATE if self.credits > 0 else UNKNOWNSTATE
+
+
+class _Stream:
+    """The values from one NetOutPort to a NetInPort"""
+
+    def __init__(self, conn: Connection, id_: int, port: NetInPort) -> None:
+        self.conn = conn
+        self.id = id_
+        self.port = port
+        self.consumed = 0
+
+    def _return_credit(self, n: int) -> None:
+        try:
+            self.conn.send_frame(self.id, _CREDIT, _COUNT.pack(n))
+        except util.Closed:
+            pass
+
+
+class NetInPort(InPort):
+    """The reading end of the channels from remote NetOutPorts, made by a
+    NetServer. Each writer is given window credits, so at most window of its
+    values are buffered at once, and credits are returned in batches of half
+    the window as they are read."""
+
+    def __init__(self, server: NetServer, name: str, codec: Codec,
+                 writers: int, window: int) -> None:
+        self.server = server
+        self.name = name
+        self.codec = codec
+        self.writers = writers
+        self.window = window
+        self.closed_writers = 0
+        self.lock = threading.Lock()
+        self.streams: List[_Stream] = []
+        self.ring: RingBuffer[Tuple[_Stream, Any]] = RingBuffer(0, name)
+
+    def __str__(self) -> str:
+        return f'NetInPort({self.name}, writers={len(self.streams)}, ' \
+               f'buffered={len(self.ring)})'
+
+    def _open(self, stream: _Stream) -> None:
+        with self.lock:
+            closed = self.ring.closed
+            if not closed:
+                self.streams.append(stream)
+        if closed:
+            stream.conn.send_frame(stream.id, _CLOSE_IN)
+        else:
+            stream._return_credit(self.window)
+
+    def _receive(self, stream: _Stream, payload: bytes) -> None:
+        try:
+            self.ring.put((stream, self.codec.decode(payload)))
+        except util.Closed:
+            pass
+
+    def _stream_closed(self, stream: _Stream) -> None:
+        with self.lock:
+            if stream not in self.streams:
+                return
+            self.streams.remove(stream)
+            self.closed_writers += 1
+            output_closed = self.closed_writers == self.writers
+        if output_closed:
+            # readers may drain what is left before they see Closed
+            self.ring.close_output()
+
+    def _consumed(self, stream: _Stream) -> None:
+        with self.lock:
+            stream.consumed += 1
+            if stream.consumed < max(self.window // 2, 1):
+                return
+            n, stream.consumed = stream.consumed, 0
+        stream._return_credit(n)
+
+    def __invert__(self) -> Any:
+        stream, value = self.ring.get()
+        self._consumed(stream)
+        return value
+
+    def read_before(self, ns: Nanoseconds) -> Any:
+        item = self.ring.get(ns)
+        if item is None:
+            return None
+        stream, value = item
+        self._consumed(stream)
+        return value
+
+    def read_many(self, max_n: int,
+                  timeout: Optional[Nanoseconds] = None) -> List[Any]:
+        items = self.ring.get_many(max_n, timeout)
+        for stream, _ in items:
+            self._consumed(stream)
+        return [value for _, value in items]
+
+    def close_in(self) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self.lock:
+            streams, self.streams = self.streams, []
+        self.ring.close()
+        self.server.ports.pop(self.name, None)
+        for stream in streams:
+            stream.conn.streams.pop(stream.id, None)
+            try:
+                stream.conn.send_frame(stream.id, _CLOSE_IN)
+            except util.Closed:
+                pass
+
+    @property
+    def can_input(self) -> bool:
+        return not self.ring.output_closed or not self.ring.is_empty()
+
+    @property
+    def in_port_state(self) -> PortState:
+        if self.ring.is_empty():
+            return CLOSEDSTATE if self.ring.output_closed else UNKNOWNSTATE
+        return READYSTATE
+
+
+class NetServer:
+    """Accepts connections from NetOutPorts, and delivers their values to
+    its NetInPorts by name"""
+
+    def __init__(self, address: Address, codec: Optional[Codec] = None,
+                 window: int = 64, max_backlog: int = 16,
+                 **connection_args) -> None:
+        """
+
+        Args:
+            address: The (host, port) or unix socket path to listen on. Port
+                0 picks a free port.
+            codec: Decodes the values of in ports made on demand.
+            window: The number of values each writer may have buffered.
+            max_backlog: The number of connections which may wait to be
+                accepted.
+        """
+        if isinstance(address, str):
+            self.sock = server.create_unix_server(address, max_backlog)
+        else:
+            self.sock = server.create_server(*address, max_backlog)
+        self.address: Address = self.sock.getsockname()
+        self.codec = PickleCodec() if codec is None else codec
+        self.window = window
+        self.connection_args = connection_args
+        self.lock = threading.Lock()
+        self.ports: Dict[str, NetInPort] = {}
+        self.connections: List[Connection] = []
+        self.closed = False
+        self.acceptor = threading.Thread(
+            target=self._accept_loop, name=f'cpo-net-server-{self.address}',
+            daemon=True)
+        self.acceptor.start()
+
+    def _accept_loop(self) -> None:
+        while True:
+            try:
+                sock, peer = self.sock.accept()
+            except OSError:
+                return
+            conn = Connection(sock, f'cpo-net-{peer}', self,
+                              **self.connection_args)
+            with self.lock:
+                self.connections.append(conn)
+
+    def in_port(self, name: str, codec: Optional[Codec] = None,
+                writers: int = 1, window: Optional[int] = None) -> NetInPort:
+        """The in port called name, which is made if it does not exist
+
+        Args:
+            name: The name which writers connect to.
+            codec: Decodes the values read.
+            writers: The number of writers which must close before the port
+                does.
+            window: The number of values each writer may have buffered.
+        """
+        with self.lock:
+            port = self.ports.get(name)
+            if port is None:
+                port = self.ports[name] = NetInPort(
+                    self, name, self.codec if codec is None else codec,
+                    writers, self.window if window is None else window)
+            return port
+
+    def close(self) -> None:
+        self.closed = True
+        self.sock.close()
+        for port in list(self.ports.values()):
+            port.close()
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for conn in connections:
+            conn.close()
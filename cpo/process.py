@@ -2,14 +2,18 @@
 from __future__ import annotations
 
 from abc import ABCMeta
+import asyncio
 import threading
 import traceback
-from typing import List, Optional, Sequence, Union
+from typing import Callable, List, Optional, Sequence, Tuple, Union
 
-from .atomic import AtomicCounter
+from . import aio
+from .atomic import Atomic, AtomicCounter
 from . import channel
 from . import conc
 from . import executor
+from . import logger
+from . import threads
 from . import util
 
 Latch = conc.CountDownLatch
@@ -25,6 +29,9 @@ class Handle(util.Runnable):
         self.stack_size = stack_size
         self.exc: Optional[Exception] = None
         self.thread: Optional[threading.Thread] = None
+        self.token = threads.CancelToken(name)
+        # called when the process fails with anything but Stopped
+        self.on_failure: Optional[Callable[[], None]] = None
 
     def __repr__(self) -> str:
         return f'Handle({self.name}, ..., {self.latch}, {self.stack_size})'
@@ -39,8 +46,9 @@ class Handle(util.Runnable):
         return self.thread.is_alive()
 
     def interrupt(self) -> None:
-        #if thread is not None: thread.interrupt()
-        raise Exception('Not possible in python..')
+        """Cancel the process. It raises Cancelled from the blocking operation
+        it is waiting in, or from the next one it makes."""
+        self.token.cancel()
 
     def start(self) -> None:
         assert executor.executor is not None
@@ -51,23 +59,128 @@ class Handle(util.Runnable):
         if self.latch is not None:
             self.latch.wait()
 
+    def reset(self) -> None:
+        """Prepare a finished handle to be run again"""
+        self.exc = None
+        self.thread = None
+        self.token.reset()
+
     def run(self) -> None:
         orig_name = ""
+        orig_token = None
         try:
             self.thread = threading.current_thread()
             orig_name = self.thread.getName()
             self.thread.setName(self.name)
+            orig_token = threads.install_token(self.token)
             self.body()
         except util.Stopped as e:
             self.exc = e
         except Exception as e:
             if Process.handle_exception is not None:
                 Process.handle_exception(self.name, e)
+            logger.crashed(self.name, e)
             self.exc = e
+            if self.on_failure is not None:
+                self.on_failure()
         finally:
             if self.thread is not None:
                 self.thread.setName(orig_name)
+                threads.install_token(orig_token)
+            self.thread = None
+
+        if self.latch is not None:
+            self.latch.count_down()
+
+
+class AsyncHandle(Handle):
+    """Handle on an async process, which runs as a task on the shared event
+    loop"""
+
+    def __init__(self, name: str, body, latch: Optional[Latch]):
+        super().__init__(name, body, latch)
+        self.done = False
+        self.joiners: List[aio.Strand] = []
+        self.task: Optional[asyncio.Task] = None
+
+    def is_alive(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self) -> None:
+        loop_thread = aio.get_loop_thread()
+        if loop_thread.in_loop():
+            self._create_task()
+        else:
+            loop_thread.call_soon(self._create_task)
+
+    def _create_task(self) -> None:
+        self.task = aio.get_loop_thread().loop.create_task(self.run_async())
+
+    def interrupt(self) -> None:
+        """Cancel the task of the process, which raises Cancelled from the
+        await it is suspended in"""
+        self.token.cancel()
+        aio.get_loop_thread().call_soon(self._cancel_task)
+
+    def _cancel_task(self) -> None:
+        # a task which has not started yet sees the token as it does
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    @staticmethod
+    def start_all(handles: Sequence[AsyncHandle]) -> None:
+        """Start handles together, in a single call to the event loop"""
+        if not handles:
+            return
+        loop_thread = aio.get_loop_thread()
+        def create_tasks():
+            for handle in handles:
+                handle._create_task()
+        loop_thread.call_soon(create_tasks)
+
+    def reset(self) -> None:
+        super().reset()
+        self.done = False
+
+    async def ajoin(self) -> None:
+        """Suspend the calling coroutine until the process has finished"""
+        current = aio.current_strand()
+        while not self.done:
+            self.joiners.append(current)
+            await current.park()
+
+    def run(self) -> None:
+        """Run the process on the shared event loop, blocking the calling
+        thread until it has finished"""
+        loop_thread = aio.get_loop_thread()
+        assert not loop_thread.in_loop(), \
+            f'{self.name} would block the event loop, await it instead'
+        loop_thread.submit(self.run_async()).result()
+
+    async def run_async(self) -> None:
+        try:
+            self.thread = aio.current_strand()
+            self.task = asyncio.current_task()
+            self.token.check()
+            await self.body()
+        except util.Stopped as e:
+            self.exc = e
+        except asyncio.CancelledError:
+            self.exc = util.Cancelled(self.name)
+        except Exception as e:
+            if Process.handle_exception is not None:
+                Process.handle_exception(self.name, e)
+            logger.crashed(self.name, e)
+            self.exc = e
+            if self.on_failure is not None:
+                self.on_failure()
+        finally:
             self.thread = None
+            self.task = None
+            self.done = True
+            joiners, self.joiners = self.joiners, []
+            for strand in joiners:
+                threads.unpark(strand)
 
         if self.latch is not None:
             self.latch.count_down()
@@ -88,6 +201,12 @@ class PROC(metaclass=ABCMeta):
     def __str__(self):
         return self.name
 
+    def compile(self) -> PROC:
+        """The form of this process to be run, which may be run repeatedly.
+        Syntax trees compile to a Par or OrderedProcs once, and then reuse
+        it."""
+        return self
+
     def with_stack_size(self, stack_size: int) -> PROC:
         self._stack_size = stack_size
         return self
@@ -144,7 +263,8 @@ class Simple(PROC):
 
     def fork(self) -> Handle:
         assert self.name is not None
-        handle = Handle(self.name, self.body, conc.CountDownLatch())
+        handle = Handle(self.name, self.body, conc.CountDownLatch(),
+                        self.stack_size or 0)
         handle.start()
         return handle
 
@@ -152,6 +272,40 @@ class Simple(PROC):
         self.body()
 
 
+class AsyncProc(PROC):
+    """A process whose body is a coroutine function. It runs as a task on
+    the shared event loop rather than on a thread of its own, waiting on
+    channels with aread and awrite, so very many may run at once. Async and
+    thread based processes may share channels."""
+
+    def __init__(self, body, name=None):
+        super().__init__()
+        self.body = body
+        self._stack_size = 0
+        if name is None:
+            name = str(body)
+        self._name = name
+
+    def handle(self, latch: Optional[Latch]) -> AsyncHandle:
+        assert self.name is not None
+        return AsyncHandle(self.name, self.body, latch)
+
+    def fork(self) -> AsyncHandle:
+        handle = self.handle(conc.CountDownLatch())
+        handle.start()
+        return handle
+
+    def __call__(self) -> None:
+        loop_thread = aio.get_loop_thread()
+        assert not loop_thread.in_loop(), \
+            f'{self.name} would block the event loop, await it instead'
+        loop_thread.submit(self.body()).result()
+
+    async def run_async(self) -> None:
+        """Run the process within the calling coroutine"""
+        await self.body()
+
+
 class IterToChannel(Simple):
 
     def __init__(self, iter_, channel_: channel.OutPort, name=None):
@@ -190,24 +344,75 @@ SKIP = _SKIP()
 
 class Par(PROC):
 
-    def __init__(self, name: str, procs: Sequence[PROC]) -> None:
+    def __init__(self, name: str, procs: Sequence[PROC],
+                 fail_fast: bool = False) -> None:
+        """
+
+        Args:
+            name: The name of the process.
+            procs: The processes to run in parallel.
+            fail_fast: Whether to cancel the other processes as soon as one
+                fails with anything but Stopped, rather than waiting for them
+                to finish by themselves.
+        """
         super().__init__()
-        self.procs = procs
+        self.procs = [p.compile() for p in _flatten(procs)]
         self._stack_size = 0
         self._name = name
+        self.fail_fast = fail_fast
+        # the latch and handles are allocated once and reused by each run,
+        # a run which overlaps another falls back on allocating its own
+        self.running = Atomic(False)
+        self.latch, self.first_handle, self.peer_handles = self._allocate()
 
-    def __call__(self):
+    def _allocate(self) -> Tuple[Latch, Handle, List[Handle]]:
         procs = self.procs
         latch = conc.CountDownLatch(len(procs)-1)
-        peer_handles = [
-            Handle(proc.name, proc, latch, proc.stack_size)
-            for proc in procs[1:]
-        ]
-        first_handle = Handle(procs[0].name, procs[0], None, procs[0].stack_size)
+        peer_handles = [_handle(proc, latch) for proc in procs[1:]]
+        first_handle = _handle(procs[0], None)
+        return latch, first_handle, peer_handles
+
+    def __call__(self):
+        if not self.running.compare_and_set(False, True):
+            return self._run(*self._allocate())
+        try:
+            self.latch.reset(len(self.procs)-1)
+            self.first_handle.reset()
+            for handle in self.peer_handles:
+                handle.reset()
+            self._run(self.latch, self.first_handle, self.peer_handles)
+        finally:
+            self.running.set(False)
+
+    def with_fail_fast(self, fail_fast: bool = True) -> Par:
+        self.fail_fast = fail_fast
+        return self
+
+    def _run(self, latch: Latch, first_handle: Handle,
+             peer_handles: List[Handle]) -> None:
+        def cancel_all():
+            first_handle.interrupt()
+            for h in peer_handles:
+                h.interrupt()
+        on_failure = cancel_all if self.fail_fast else None
+        first_handle.on_failure = on_failure
         for handle in peer_handles:
-            handle.start()
-        first_handle.run()
-        latch.wait()
+            handle.on_failure = on_failure
+        # cancelling the process running the Par cancels its processes
+        parent = threads.current_token()
+        if parent is not None and not parent.add_callback(cancel_all):
+            cancel_all()
+        try:
+            AsyncHandle.start_all(
+                [h for h in peer_handles if isinstance(h, AsyncHandle)])
+            for handle in peer_handles:
+                if not isinstance(handle, AsyncHandle):
+                    handle.start()
+            first_handle.run()
+            latch.wait()
+        finally:
+            if parent is not None:
+                parent.remove_callback(cancel_all)
 
         # termination state
         exc = first_handle.exc
@@ -215,9 +420,10 @@ class Par(PROC):
             hexc = handle.exc
             if exc is None and hexc is None:
                 pass
-            elif isinstance(exc, util.Stopped):
+            elif isinstance(exc, util.Stopped) and \
+                    (hexc is None or isinstance(hexc, util.Stopped)):
                 pass  #exc = exc
-            elif isinstance(hexc, util.Stopped):
+            elif exc is None and isinstance(hexc, util.Stopped):
                 exc = hexc
             else:
                 raise ParException([first_handle.exc] +
@@ -232,11 +438,28 @@ class Par(PROC):
         return handle
 
 
+def _handle(proc: PROC, latch: Optional[Latch]) -> Handle:
+    if isinstance(proc, AsyncProc):
+        return proc.handle(latch)
+    return Handle(proc.name, proc, latch, proc.stack_size or 0)
+
+
+def _flatten(procs: Sequence[PROC]) -> List[PROC]:
+    """Expand nested ParSyntax trees into a single list of processes"""
+    result: List[PROC] = []
+    for p in procs:
+        if isinstance(p, ParSyntax):
+            result.extend(_flatten(p.procs))
+        else:
+            result.append(p)
+    return result
+
+
 class OrderedProcs(PROC):
 
     def __init__(self, name: str, procs: Sequence[PROC]) -> None:
         super().__init__()
-        self.procs = procs
+        self.procs = [p.compile() for p in procs]
         self._stack_size = 0
         self._name = name
 
@@ -258,20 +481,29 @@ class ParException(Exception):
     def __repr__(self):
         return f'ParException({", ".join(self.exceptions)})'
 
-# TODO - Compile and run as seperate class subtypes
-# Split up the compile and run steps of PROC's to avoid
-# these syntax specifiers being called directly and requiring
-# a _stack_size etc. (otherwise when nested they have to be
-# repeatably compiled on each run, which is mildly wasteful
 class ParSyntax(PROC):
 
     def __init__(self, _procs: List[PROC]):
         self.procs = _procs
         self._stack_size = 0
+        self._compiled: Optional[Par] = None
+        self._fail_fast = False
 
     @property
-    def compiled(self):
-        return Par(self.name, self.procs)
+    def compiled(self) -> Par:
+        if self._compiled is None:
+            self._compiled = Par(self.name, self.procs, self._fail_fast)
+        return self._compiled
+
+    def with_fail_fast(self, fail_fast: bool = True) -> ParSyntax:
+        """Cancel the other processes as soon as one fails"""
+        self._fail_fast = fail_fast
+        if self._compiled is not None:
+            self._compiled.fail_fast = fail_fast
+        return self
+
+    def compile(self) -> PROC:
+        return self.compiled
 
     def __call__(self):
         return self.compiled()
@@ -296,10 +528,16 @@ class OrderedSyntax(PROC):
     def __init__(self, _procs: List[PROC]):
         self.procs = _procs
         self._stack_size = 0
+        self._compiled: Optional[OrderedProcs] = None
 
     @property
-    def compiled(self):
-        return OrderedProcs(self.name, self.procs)
+    def compiled(self) -> OrderedProcs:
+        if self._compiled is None:
+            self._compiled = OrderedProcs(self.name, self.procs)
+        return self._compiled
+
+    def compile(self) -> PROC:
+        return self.compiled
 
     def __call__(self):
         return self.compiled()
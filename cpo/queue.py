@@ -1,7 +1,10 @@
 
-import queue as _queue
+from collections import deque
+import threading
 
-from typing import Generic, List, Optional, TypeVar
+from typing import Deque, Generic, List, Optional, TypeVar
+
+from .atomic import gil_enabled
 
 T = TypeVar('T')
 
@@ -22,6 +25,9 @@ class Queue(Generic[T]):
     def remove_first(self) -> None:
         raise NotImplementedError
 
+    def remove(self, value: T) -> bool:
+        raise NotImplementedError
+
     def length(self) -> int:
         raise NotImplementedError
 
@@ -34,43 +40,136 @@ class Queue(Generic[T]):
     def for_each(self, f) -> None:
         raise NotImplementedError
 
-class LockFreeQueue(Queue[T]):
+class Dequeue(Queue[T]):
 
-    def __init__(self):
-        self.queue = _queue.Queue()
+    def dequeue_last(self) -> Optional[T]:
+        raise NotImplementedError
+
+    def peek_last(self) -> Optional[T]:
+        raise NotImplementedError
+
+class GILQueue(Dequeue[T]):
+    """A queue on a collections.deque, which is a linked list of fixed size
+    blocks. Under the GIL each of its appends, pops, indexes of an end, len,
+    clear and copies is a single C call, and so atomic, without any lock of
+    our own. dequeue and peek return None once the queue is empty."""
+
+    def __init__(self) -> None:
+        self.queue: Deque[T] = deque()
 
     def length(self) -> int:
-        return self.queue.qsize()
+        return len(self.queue)
 
     def enqueue(self, value: T) -> None:
-        self.queue.put(value, block=False)
+        self.queue.append(value)
 
-    enqueue_first = enqueue
+    def enqueue_first(self, value: T) -> None:
+        self.queue.appendleft(value)
 
     def dequeue(self) -> Optional[T]:
         try:
-            return self.queue.get(block=False)
-        except _queue.Empty:
+            return self.queue.popleft()
+        except IndexError:
+            return None
+
+    def dequeue_last(self) -> Optional[T]:
+        try:
+            return self.queue.pop()
+        except IndexError:
             return None
 
     def peek(self) -> Optional[T]:
-        with self.queue.mutex:
-            # slow?
-            return next(iter(self.queue.queue), None)
+        try:
+            return self.queue[0]
+        except IndexError:
+            return None
+
+    def peek_last(self) -> Optional[T]:
+        try:
+            return self.queue[-1]
+        except IndexError:
+            return None
 
     def remove_first(self) -> None:
-        v = self.dequeue()
-        if v is None:
-            raise ValueError
+        try:
+            self.queue.popleft()
+        except IndexError:
+            raise ValueError('remove_first from an empty queue') from None
+
+    def remove(self, value: T) -> bool:
+        """Remove the first occurrence of value, returning whether there was
+        one"""
+        while True:
+            try:
+                self.queue.remove(value)
+                return True
+            except ValueError:
+                return False
+            except IndexError:
+                # an __eq__ let another thread in, which changed the deque
+                pass
 
     def elements(self) -> List[T]:
-        with self.queue.mutex:
-            return list(self.queue.queue)
+        return list(self.queue)
+
+    def clear(self) -> None:
+        self.queue.clear()
 
     def for_each(self, f) -> None:
         for e in self.elements():
             f(e)
 
-class LockFreeDequeue(Queue[T]):
-    # not implemented
-    pass
+class LockedQueue(GILQueue[T]):
+    """A queue which takes its lock for every operation. This is correct
+    without a GIL."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.lock = threading.Lock()
+
+    def length(self) -> int:
+        with self.lock:
+            return super().length()
+
+    def enqueue(self, value: T) -> None:
+        with self.lock:
+            super().enqueue(value)
+
+    def enqueue_first(self, value: T) -> None:
+        with self.lock:
+            super().enqueue_first(value)
+
+    def dequeue(self) -> Optional[T]:
+        with self.lock:
+            return super().dequeue()
+
+    def dequeue_last(self) -> Optional[T]:
+        with self.lock:
+            return super().dequeue_last()
+
+    def peek(self) -> Optional[T]:
+        with self.lock:
+            return super().peek()
+
+    def peek_last(self) -> Optional[T]:
+        with self.lock:
+            return super().peek_last()
+
+    def remove_first(self) -> None:
+        with self.lock:
+            super().remove_first()
+
+    def remove(self, value: T) -> bool:
+        with self.lock:
+            return super().remove(value)
+
+    def elements(self) -> List[T]:
+        with self.lock:
+            return super().elements()
+
+    def clear(self) -> None:
+        with self.lock:
+            super().clear()
+
+LockFreeQueue = GILQueue if gil_enabled() else LockedQueue
+LockFreeDequeue = LockFreeQueue
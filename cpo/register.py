@@ -3,7 +3,7 @@ from __future__ import annotations
 
 import collections
 import threading
-from typing import Dict, List, Optional, Sequence
+from typing import Dict, List, Optional, Sequence, Tuple
 import weakref
 
 from .atomic import AtomicCounter
@@ -17,15 +17,24 @@ stateKey = AtomicCounter()
 
 NONEWAITING: List[threading.Thread] = []
 
+# a sample of a metric: its name, its labels and its value
+Sample = Tuple[str, Dict[str, str], float]
+
 registered: Dict[int, weakref.ReferenceType[Debuggable]] = {}
 
 def register(obj: Debuggable) -> StateKey:
     key = next(stateKey)
-    registered[key] = weakref.ref(obj)
+    # the entry goes with the object, if it is never unregistered
+    registered[key] = weakref.ref(obj, lambda _: registered.pop(key, None))
     return key
 
 class Debuggable:
 
+    # whether something other than a process, such as the timer service or
+    # another OS process, releases the threads waiting on the object, so
+    # that processes waiting on it are not stalled however long they wait
+    external = False
+
     def __init__(self):
         self._key: StateKey = -1
 
@@ -44,6 +53,16 @@ class Debuggable:
     def get_waiting(self) -> List[threading.Thread]:
         return NONEWAITING.copy()
 
+    def get_blockers(self, thread: threading.Thread) -> List[threading.Thread]:
+        """The threads which must act before thread, one of those waiting,
+        can proceed, where they are known"""
+        return NONEWAITING.copy()
+
+    def metrics(self) -> List[Sample]:
+        """Samples of the metrics of the object, read when they are
+        scraped"""
+        return []
+
     def with_debugger(self, condition, func):
         if condition:
             self.register()
@@ -60,7 +79,7 @@ class Debuggable:
 
 def waiting() -> Dict[threading.Thread, List[Debuggable]]:
     result = collections.defaultdict(list)
-    for _, ref in registered.items():
+    for ref in list(registered.values()):
         obj: Optional[Debuggable] = ref()
         if obj is not None:
             for thread in obj.get_waiting():
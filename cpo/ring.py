@@ -0,0 +1,282 @@
+from collections import deque
+import threading
+from typing import Deque, Generic, List, Optional, Sequence, Set, Tuple, TypeVar
+
+from . import threads
+from . import util
+from .util import Nanoseconds
+
+T = TypeVar('T')
+
+class RingBuffer(Generic[T]):
+    """The engine behind buffered channels. Values are kept in a ring of
+    preallocated slots guarded by a single lock, with separate conditions
+    for readers waiting on an empty ring and writers waiting on a full one.
+    A ring of size 0 is unbounded, and doubles its slots whenever it fills.
+
+    Closing the output lets readers drain what is left before they see
+    Closed. Closing the ring drops its contents and wakes every waiter.
+
+    Tasks, which cannot wait on a condition, poll and offer instead, and are
+    queued to be unparked whenever the condition they would wait on is
+    notified."""
+
+    INITIAL_UNBOUNDED = 16
+
+    def __init__(self, size: int, name: str) -> None:
+        """
+
+        Args:
+            size: The number of values the ring can hold, or 0 for no limit.
+            name: The name of the owning channel, for Closed exceptions.
+        """
+        assert size >= 0
+        self.size = size
+        self.name = name
+        self._slots: List[Optional[T]] = \
+            [None] * (size if size > 0 else self.INITIAL_UNBOUNDED)
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        self.not_empty = threading.Condition(self._lock)
+        self.not_full = threading.Condition(self._lock)
+        self.async_readers: Deque[threading.Thread] = deque()
+        self.async_writers: Deque[threading.Thread] = deque()
+        # the threads waiting on each condition, for the debugger
+        self.blocked_readers: Set[threading.Thread] = set()
+        self.blocked_writers: Set[threading.Thread] = set()
+        self.output_closed = False
+        self.closed = False
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def blocked(self) -> Set[threading.Thread]:
+        return self.blocked_readers | self.blocked_writers
+
+    def is_empty(self) -> bool:
+        return self._count == 0
+
+    def is_full(self) -> bool:
+        return self.size > 0 and self._count >= self.size
+
+    def _grow(self) -> None:
+        """Double the slots of an unbounded ring, with the lock held"""
+        cap = len(self._slots)
+        first = self._slots[self._head:] + self._slots[:self._head]
+        self._slots = first + [None] * cap
+        self._head = 0
+
+    def _wait(self, cond: threading.Condition,
+              deadline: Optional[Nanoseconds]) -> bool:
+        """Wait on cond, with the lock held. Returns False once the deadline
+        has passed, and raises Cancelled if the waiting process is
+        cancelled."""
+        current = threading.current_thread()
+        token = threads.current_token()
+        blocked = self.blocked_readers if cond is self.not_empty \
+            else self.blocked_writers
+        blocked.add(current)
+        try:
+            if token is None:
+                return self._wait_on(cond, deadline)
+            def wake():
+                with self._lock:
+                    cond.notify_all()
+            if not token.add_callback(wake):
+                token.check()
+            try:
+                return self._wait_on(cond, deadline)
+            finally:
+                token.remove_callback(wake)
+                token.check()
+        finally:
+            blocked.discard(current)
+
+    @staticmethod
+    def _wait_on(cond: threading.Condition,
+                 deadline: Optional[Nanoseconds]) -> bool:
+        if deadline is None:
+            cond.wait()
+            return True
+        left = deadline - util.nano_time()
+        if left <= 0:
+            return False
+        cond.wait(left.to_seconds())
+        return True
+
+    @staticmethod
+    def _notify(cond: threading.Condition, waiters: Deque,
+                n: int = 1) -> None:
+        """Wake n of the threads waiting on cond, and n of the tasks which
+        would, with the lock held"""
+        cond.notify(n)
+        for _ in range(min(n, len(waiters))):
+            threads.unpark(waiters.popleft())
+
+    @staticmethod
+    def _notify_all(cond: threading.Condition, waiters: Deque) -> None:
+        cond.notify_all()
+        while waiters:
+            threads.unpark(waiters.popleft())
+
+    def _check_closed(self) -> None:
+        if self.closed:
+            raise util.Closed(self.name)
+
+    def put(self, value: T, timeout: Optional[Nanoseconds] = None) -> bool:
+        """Add value to the ring, waiting for room for up to timeout. Returns
+        whether the value was added, raising Closed if the ring closes
+        first."""
+        deadline = None if timeout is None else util.nano_time() + timeout
+        with self._lock:
+            while True:
+                self._check_closed()
+                cap = len(self._slots)
+                if self._count < cap:
+                    break
+                if self.size == 0:
+                    self._grow()
+                    break
+                if not self._wait(self.not_full, deadline):
+                    return False
+            self._slots[(self._head + self._count) % len(self._slots)] = value
+            self._count += 1
+            self._notify(self.not_empty, self.async_readers)
+        return True
+
+    def put_many(self, values: Sequence[T],
+                 timeout: Optional[Nanoseconds] = None) -> int:
+        """Add values to the ring, in order, waiting for room for up to
+        timeout. As much as fits is added at once. Returns the number of
+        values added, raising Closed if the ring closes before any were."""
+        deadline = None if timeout is None else util.nano_time() + timeout
+        written = 0
+        with self._lock:
+            while written < len(values):
+                if self.closed:
+                    if written == 0:
+                        self._check_closed()
+                    break
+                cap = len(self._slots)
+                if self._count == cap:
+                    if self.size == 0:
+                        self._grow()
+                        cap = len(self._slots)
+                    elif not self._wait(self.not_full, deadline):
+                        break
+                    else:
+                        continue
+                n = min(cap - self._count, len(values) - written)
+                tail = self._head + self._count
+                for i in range(n):
+                    self._slots[(tail + i) % cap] = values[written + i]
+                self._count += n
+                written += n
+                self._notify(self.not_empty, self.async_readers, n)
+        return written
+
+    def get(self, timeout: Optional[Nanoseconds] = None) -> Optional[T]:
+        """Remove and return the oldest value, waiting for one for up to
+        timeout. Returns None if the timeout passes, and raises Closed once
+        the ring is closed, or its output is closed and it is empty."""
+        deadline = None if timeout is None else util.nano_time() + timeout
+        with self._lock:
+            while self._count == 0:
+                if self.output_closed:
+                    raise util.Closed(self.name)
+                if not self._wait(self.not_empty, deadline):
+                    return None
+            value = self._slots[self._head]
+            self._slots[self._head] = None
+            self._head = (self._head + 1) % len(self._slots)
+            self._count -= 1
+            self._notify(self.not_full, self.async_writers)
+        return value
+
+    def get_many(self, max_n: int,
+                 timeout: Optional[Nanoseconds] = None) -> List[T]:
+        """Remove and return up to max_n of the oldest values, waiting for up
+        to timeout for there to be at least one. Returns an empty list if the
+        timeout passes, and raises Closed as get does."""
+        deadline = None if timeout is None else util.nano_time() + timeout
+        with self._lock:
+            while self._count == 0:
+                if self.output_closed:
+                    raise util.Closed(self.name)
+                if not self._wait(self.not_empty, deadline):
+                    return []
+            cap = len(self._slots)
+            n = min(max_n, self._count)
+            result = []
+            for i in range(n):
+                j = (self._head + i) % cap
+                result.append(self._slots[j])
+                self._slots[j] = None
+            self._head = (self._head + n) % cap
+            self._count -= n
+            self._notify(self.not_full, self.async_writers, n)
+        return result
+
+    def poll(self, waiter) -> Tuple[bool, Optional[T]]:
+        """Remove and return the oldest value as (True, value) without
+        waiting. If there is none returns (False, None), having queued waiter
+        to be unparked once there may be. Raises Closed as get does."""
+        with self._lock:
+            if self._count == 0:
+                if self.output_closed:
+                    raise util.Closed(self.name)
+                self.async_readers.append(waiter)
+                return False, None
+            value = self._slots[self._head]
+            self._slots[self._head] = None
+            self._head = (self._head + 1) % len(self._slots)
+            self._count -= 1
+            self._notify(self.not_full, self.async_writers)
+        return True, value
+
+    def offer(self, value: T, waiter) -> bool:
+        """Add value to the ring without waiting. If there is no room returns
+        False, having queued waiter to be unparked once there may be. Raises
+        Closed if the ring is closed."""
+        with self._lock:
+            self._check_closed()
+            if self._count == len(self._slots):
+                if self.size > 0:
+                    self.async_writers.append(waiter)
+                    return False
+                self._grow()
+            self._slots[(self._head + self._count) % len(self._slots)] = value
+            self._count += 1
+            self._notify(self.not_empty, self.async_readers)
+        return True
+
+    def withdraw(self, waiter, reading: bool) -> None:
+        """waiter, which polled if reading or else offered, has given up. If
+        it had already been woken, pass the wake up on to another task so
+        that it is not lost."""
+        waiters = self.async_readers if reading else self.async_writers
+        with self._lock:
+            try:
+                waiters.remove(waiter)
+            except ValueError:
+                if waiters:
+                    threads.unpark(waiters.popleft())
+
+    def close_output(self) -> None:
+        """No more values will be added, wake readers so that they don't wait
+        on an empty ring."""
+        with self._lock:
+            self.output_closed = True
+            self._notify_all(self.not_empty, self.async_readers)
+
+    def close(self) -> None:
+        """Drop the contents of the ring and wake every waiter"""
+        with self._lock:
+            self.output_closed = True
+            self.closed = True
+            self._slots = []
+            self._head = self._count = 0
+            self._notify_all(self.not_empty, self.async_readers)
+            self._notify_all(self.not_full, self.async_writers)
@@ -2,17 +2,18 @@
 from abc import ABC
 import queue
 import threading
-from typing import List, Optional, Sequence
+from typing import Dict, List, Optional, Sequence
 
 from .atomic import Atomic, AtomicNum
 from .name import NameGenerator
 from .queue import LockFreeQueue
+from .register import Debuggable, Sample
 from . import threads
 from . import util
 from .util import Nanoseconds, Singleton
 
 
-class Semaphore(ABC):
+class Semaphore(Debuggable, ABC):
 
     def acquire(self) -> None:
         raise NotImplementedError
@@ -41,6 +42,17 @@ class Semaphore(ABC):
     def cancelled(self) -> bool:
         raise NotImplementedError
 
+    def show_state(self, file) -> None:
+        print(f'SEMAPHORE {self}', end='', file=file)
+
+    def metrics(self) -> List[Sample]:
+        labels = {'semaphore': self.name}
+        return [
+            ('cpo_semaphore_waits_total', labels, self.waits.get()),
+            ('cpo_semaphore_waiting', labels, len(self.get_waiting())),
+            ('cpo_semaphore_available', labels, self.remaining()),
+        ]
+
     def __enter__(self):
         self.acquire()
 
@@ -48,6 +60,124 @@ class Semaphore(ABC):
         self.release()
 
 
+class _FairSemaphore(Semaphore):
+    """A semaphore which is acquired in the order it was asked for. A
+    release hands the semaphore straight to the waiters at the head of the
+    queue which can now proceed, which wake already holding it, rather than
+    freeing it for the waiters to race for. A waiter wanting more than is
+    free holds up those behind it, so it is not starved by smaller requests.
+    The mutex only guards the handover, nobody parks holding it."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._mutex = threading.Lock()
+        # how much each waiter wants
+        self._wants: Dict[threading.Thread, int] = {}
+        # the waiters which have been handed what they want but not yet woken
+        self._granted: Dict[threading.Thread, int] = {}
+
+    def _take(self, current: threading.Thread, n: int) -> bool:
+        """Take n if they are free, with the mutex held"""
+        raise NotImplementedError
+
+    def _free(self, n: int) -> None:
+        """Free n, with the mutex held"""
+        raise NotImplementedError
+
+    def _grant(self) -> List[threading.Thread]:
+        """Hand the semaphore to the waiters at the head of the queue which
+        can now proceed, with the mutex held. Returns those to be woken."""
+        successors = []
+        while True:
+            head = self._waiting.peek()
+            if head is None or not self._take(head, self._wants[head]):
+                return successors
+            self._waiting.dequeue()
+            self._granted[head] = self._wants.pop(head)
+            successors.append(head)
+
+    def cancel(self) -> None:
+        with self._mutex:
+            self._cancelled = True
+            waiting = self._waiting.elements()
+            self._waiting.clear()
+            self._wants.clear()
+        for waiter in waiting:
+            threads.unpark(waiter)
+
+    def _enqueue(self, current: threading.Thread, n: int) -> bool:
+        """Take n if nobody is waiting, otherwise join the back of the
+        waiters. Returns whether they were taken."""
+        with self._mutex:
+            if self._waiting.length() == 0 and self._take(current, n):
+                return True
+            self._wants[current] = n
+            self._waiting.enqueue(current)
+            return False
+
+    def _leave(self, current: threading.Thread) -> bool:
+        """current stops waiting. Returns whether it had been handed the
+        semaphore, otherwise those behind it may now proceed."""
+        with self._mutex:
+            if self._granted.pop(current, None) is not None:
+                return True
+            self._waiting.remove(current)
+            self._wants.pop(current, None)
+            successors = self._grant()
+        for successor in successors:
+            threads.unpark(successor)
+        return False
+
+    def _acquire(self, n: int) -> None:
+        if self._cancelled:
+            return
+        current = threading.current_thread()
+        if self._enqueue(current, n):
+            return
+        self.waits.inc(1)
+        try:
+            while current not in self._granted and not self._cancelled:
+                threads.park_current_thread()
+        except util.Cancelled:
+            self._withdraw(current)
+            raise
+        self._leave(current)
+
+    def _release(self, n: int) -> None:
+        with self._mutex:
+            self._free(n)
+            successors = self._grant()
+        for successor in successors:
+            threads.unpark(successor)
+
+    def _withdraw(self, current: threading.Thread) -> None:
+        """current was cancelled while waiting, give back what it had been
+        handed meanwhile"""
+        with self._mutex:
+            n = self._granted.pop(current, None)
+        if n is None:
+            self._leave(current)
+        else:
+            self._release(n)
+
+    def _try_acquire(self, timeout: Nanoseconds, n: int) -> bool:
+        if self._cancelled:
+            return False
+        current = threading.current_thread()
+        # a timed acquire waits its turn too: one which jumped the queue
+        # would overtake the waiters the semaphore is held up for, and be
+        # served only by a later release
+        if self._enqueue(current, n):
+            return True
+        self.waits.inc(1)
+        try:
+            threads.park_current_thread_until_elapsed_or(
+                timeout, lambda: current in self._granted or self._cancelled)
+        except util.Cancelled:
+            self._withdraw(current)
+            raise
+        return self._leave(current)
+
 class _BooleanSemaphore(Semaphore):
 
     def __init__(self, available: bool, name: str,
@@ -57,8 +187,12 @@ class _BooleanSemaphore(Semaphore):
         self.spin = spin
         self._owner = Atomic(None if available else threading.current_thread())
         self._waiting: LockFreeQueue[threading.Thread] = LockFreeQueue()
+        # the acquires which had to wait, counted off the fast path
+        self.waits = AtomicNum(0)
         self._behalf = self if parent is None else parent
         self._cancelled = False
+        Debuggable.__init__(self)
+        self.register()
 
     def cancel(self) -> None:
         self._cancelled = True
@@ -95,10 +229,15 @@ class _BooleanSemaphore(Semaphore):
         current = threading.current_thread()
         if self.acquire_fast(current):
             return
+        self.waits.inc(1)
         self._waiting.enqueue(current)
-        while self._waiting.peek() != current or \
-                not self._owner.compare_and_set(None, current):
-            threads.park_current_thread()
+        try:
+            while self._waiting.peek() != current or \
+                    not self._owner.compare_and_set(None, current):
+                threads.park_current_thread()
+        except util.Cancelled:
+            self._withdraw(current)
+            raise
         self._waiting.remove_first()
 
     def cancelled(self) -> bool:
@@ -109,6 +248,11 @@ class _BooleanSemaphore(Semaphore):
         waiter = self._waiting.peek()
         threads.unpark(waiter)
 
+    def _withdraw(self, current: threading.Thread) -> None:
+        """current was cancelled while waiting, pass its turn on"""
+        self._waiting.remove(current)
+        threads.unpark(self._waiting.peek())
+
     def try_acquire(self, timeout: Nanoseconds) -> bool:
         if self._cancelled:
             return False
@@ -117,20 +261,17 @@ class _BooleanSemaphore(Semaphore):
             return True
         if self._cancelled:
             return False
-        deadline = util.nano_time() + timeout
-        left = timeout
-        trying = True
-        outcome = False
+        self.waits.inc(1)
         self._waiting.enqueue_first(current)
-        while trying:
-            if self._waiting.peek() == current and \
-                    self._owner.compare_and_set(None, current):
-                trying = False
-                outcome = True
-            else:
-                threads.park_current_thread(left)
-                left = deadline - util.nano_time()
-                trying = left > 0
+        try:
+            outcome = 0 < threads.park_current_thread_until_elapsed_or(
+                timeout,
+                lambda: self._waiting.peek() == current and
+                self._owner.compare_and_set(None, current)
+            )
+        except util.Cancelled:
+            self._withdraw(current)
+            raise
         self._waiting.remove_first()
         return outcome
 
@@ -140,6 +281,33 @@ class _BooleanSemaphore(Semaphore):
     def remaining(self) -> int:
         return 0 if self._owner.get() is not None else 1
 
+    def get_blockers(self, thread: threading.Thread) -> List[threading.Thread]:
+        """A waiter is blocked by the owner of the semaphore"""
+        owner = self._owner.get()
+        if owner is None or owner is thread:
+            return []
+        return [owner]
+
+class _FairBooleanSemaphore(_FairSemaphore, _BooleanSemaphore):
+
+    def _take(self, current: threading.Thread, n: int) -> bool:
+        if self._owner.get() is None:
+            self._owner.set(current)
+            return True
+        return False
+
+    def _free(self, n: int) -> None:
+        self._owner.set(None)
+
+    def acquire(self) -> None:
+        self._acquire(1)
+
+    def release(self) -> None:
+        self._release(1)
+
+    def try_acquire(self, timeout: Nanoseconds) -> bool:
+        return self._try_acquire(timeout, 1)
+
 class _BooleanSemaphoreFactory(NameGenerator, metaclass=Singleton):
 
     def __init__(self):
@@ -153,7 +321,7 @@ class _BooleanSemaphoreFactory(NameGenerator, metaclass=Singleton):
         if name is None:
             name = self._new_name()
         if fair:
-            raise NotImplementedError
+            return _FairBooleanSemaphore(available, name, fair, parent, spin)
         return _BooleanSemaphore(available, name, fair, parent, spin)
 
 BooleanSemaphore = _BooleanSemaphoreFactory()
@@ -167,8 +335,17 @@ class _CountingSemaphore(Semaphore):
         self.spin = spin
         self._count = AtomicNum(available)
         self._waiting: LockFreeQueue[threading.Thread] = LockFreeQueue()
+        # the acquires which had to wait, counted off the fast path
+        self.waits = AtomicNum(0)
+        # how many permits each waiter wants
+        self._wants: Dict[threading.Thread, int] = {}
+        # the waiter at the head of the queue while it waits for more than
+        # one permit
+        self._bulk_head: Optional[threading.Thread] = None
         self._behalf = self if parent is None else parent
         self._cancelled = False
+        Debuggable.__init__(self)
+        self.register()
 
     def __str__(self) -> str:
         nm = self.name
@@ -183,10 +360,18 @@ class _CountingSemaphore(Semaphore):
         self._cancelled = True
         for _ in range(self._waiting.length()):
             self.release()
-
-    def acquire_fast(self) -> bool:
+        # the permits released may not be enough for a bulk waiter, which
+        # wakes to see the semaphore cancelled
+        for waiter in self._waiting.elements():
+            threads.unpark(waiter)
+
+    def acquire_fast(self, n: int = 1) -> bool:
+        # a bulk waiter at the head of the queue is not overtaken, or a
+        # stream of small acquires could keep it waiting forever
+        if self._bulk_head is not None:
+            return False
         for _ in range(self.spin):
-            if self.atomic_dec():
+            if self.atomic_dec(n):
                 return True
         return False
 
@@ -195,73 +380,139 @@ class _CountingSemaphore(Semaphore):
             f"Semaphore Interrupted: {self} for {self._behalf}"
         )
 
-    def acquire(self) -> None:
+    def _at_head(self, current: threading.Thread, n: int) -> bool:
+        """Take n if current is at the head of the queue and they are
+        available"""
+        if self._waiting.peek() != current:
+            return False
+        if self.atomic_dec(n):
+            return True
+        if n > 1:
+            self._bulk_head = current
+        return False
+
+    def _dequeued(self, current: threading.Thread) -> None:
+        """current has stopped waiting"""
+        self._wants.pop(current, None)
+        if self._bulk_head is current:
+            self._bulk_head = None
+
+    def acquire(self, n: int = 1) -> None:
         if self._cancelled:
             return
-        if self.acquire_fast():
+        if self.acquire_fast(n):
             return
+        self.waits.inc(1)
         current = threading.current_thread()
+        self._wants[current] = n
         self._waiting.enqueue(current)
-        while self._waiting.peek() != current or \
-            not self.atomic_dec():
-            threads.park_current_thread()
+        try:
+            while not self._at_head(current, n):
+                if self._cancelled:
+                    self._withdraw(current)
+                    return
+                threads.park_current_thread()
+        except util.Cancelled:
+            self._withdraw(current)
+            raise
         self._waiting.remove_first()
-        if self._count.get() > 0:
-            self.signal()
+        self._dequeued(current)
+        self.signal()
 
-    def atomic_dec(self) -> bool:
-        return 0 < self._count.get_and_update(
-            lambda x: x-1 if x > 0 else x
+    def atomic_dec(self, n: int = 1) -> bool:
+        return n <= self._count.get_and_update(
+            lambda x: x-n if x >= n else x
         )
 
     def signal(self) -> None:
-        threads.unpark(self._waiting.peek())
-
-    def release(self) -> None:
-        if self._count.inc(1) > 0:
+        """Wake the head waiter if what it wants is available"""
+        head = self._waiting.peek()
+        if head is not None and \
+                self._count.get() >= self._wants.get(head, 1):
+            threads.unpark(head)
+
+    def _withdraw(self, current: threading.Thread) -> None:
+        """current was cancelled while waiting, pass its turn on"""
+        self._waiting.remove(current)
+        self._dequeued(current)
+        self.signal()
+
+    def release(self, n: int = 1) -> None:
+        if self._count.inc(n) > 0:
             self.signal()
 
     def reinitialize(self) -> None:
         assert self._waiting.length() > 0
         self._count.set(0)
         self._waiting.clear()
+        self._wants.clear()
+        self._bulk_head = None
 
     def cancelled(self) -> bool:
         return self._cancelled
 
-    def try_acquire(self, timeout: Nanoseconds) -> bool:
+    def try_acquire(self, timeout: Nanoseconds, n: int = 1) -> bool:
         if self._cancelled:
             return False
-        if self.acquire_fast():
+        if self.acquire_fast(n):
             return True
         current = threading.current_thread()
-        deadline = util.nano_time() + timeout
-        left = timeout
-        trying = True
         outcome = False
+        def acquired() -> bool:
+            nonlocal outcome
+            outcome = self._at_head(current, n)
+            return outcome or self._cancelled
+        self.waits.inc(1)
+        self._wants[current] = n
         self._waiting.enqueue_first(current)
-        while trying and not self._cancelled:
-            if self._waiting.peek() == current and \
-                    self.atomic_dec():
-                trying = False
-                outcome = True
-            else:
-                threads.park_current_thread(left)
-                left = deadline - util.nano_time()
-                trying = left > 0
-        self._waiting.remove_first()
-        if self._count.get() > 0:
-            self.signal()
+        try:
+            threads.park_current_thread_until_elapsed_or(timeout, acquired)
+        except util.Cancelled:
+            self._withdraw(current)
+            raise
+        self._waiting.remove(current)
+        self._dequeued(current)
+        self.signal()
         return outcome
 
-
     def get_waiting(self) -> List[threading.Thread]:
         return self._waiting.elements()
 
+    def get_blockers(self, thread: threading.Thread) -> List[threading.Thread]:
+        """A waiter is blocked by the waiter ahead of it, which is served
+        first"""
+        waiting = self._waiting.elements()
+        if thread not in waiting:
+            return []
+        i = waiting.index(thread)
+        return waiting[i - 1:i] if i > 0 else []
+
     def remaining(self) -> int:
         return self._count.get()
 
 
+class _FairCountingSemaphore(_FairSemaphore, _CountingSemaphore):
+
+    def _take(self, current: threading.Thread, n: int) -> bool:
+        return self.atomic_dec(n)
+
+    def _free(self, n: int) -> None:
+        self._count.inc(n)
+
+    def acquire(self, n: int = 1) -> None:
+        self._acquire(n)
+
+    def release(self, n: int = 1) -> None:
+        self._release(n)
+
+    def try_acquire(self, timeout: Nanoseconds, n: int = 1) -> bool:
+        return self._try_acquire(timeout, n)
+
+    def reinitialize(self) -> None:
+        with self._mutex:
+            super().reinitialize()
+            self._granted.clear()
+
 class _CountingSemaphoreFactory(NameGenerator, metaclass=Singleton):
 
     def __init__(self):
@@ -275,7 +526,7 @@ class _CountingSemaphoreFactory(NameGenerator, metaclass=Singleton):
         if name is None:
             name = self._new_name()
         if fair:
-            raise NotImplementedError
+            return _FairCountingSemaphore(available, name, fair, parent, spin)
         return _CountingSemaphore(available, name, fair, parent, spin)
 
 CountingSemaphore = _CountingSemaphoreFactory()
@@ -1,5 +1,11 @@
 
+import selectors
 import socket
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Union
+import urllib.parse
 
 def create_server(host, port, max_backlog=1):
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -10,3 +16,188 @@ def create_server(host, port, max_backlog=1):
     except Exception as e:
         sock.close()
         raise e
+
+def create_unix_server(path, max_backlog=1):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.bind(path)
+        sock.listen(max_backlog)
+        return sock
+    except Exception as e:
+        sock.close()
+        raise e
+
+# The debugger is scraped by monitoring, so its server must not add threads,
+# or hold anything up, however often it is asked. One thread multiplexes
+# every connection with a selector: requests are read without blocking,
+# answered in full by the handler, and the response written back as the
+# socket will take it.
+
+class Response:
+
+    REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 431: 'Request Header Fields Too Large',
+               500: 'Internal Server Error'}
+
+    def __init__(self, status: int, body: Union[str, bytes],
+                 content_type: str = 'text/plain; charset=UTF-8') -> None:
+        self.status = status
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        self.content_type = content_type
+
+    def encode(self) -> bytes:
+        reason = self.REASONS.get(self.status, '')
+        header = f'HTTP/1.1 {self.status} {reason}\r\n' \
+                 f'Content-Type: {self.content_type}\r\n' \
+                 f'Content-Length: {len(self.body)}\r\n' \
+                 f'Server: CPO debugger\r\n' \
+                 f'Connection: close\r\n\r\n'
+        return header.encode('latin-1') + self.body
+
+Handler = Callable[[str, Dict[str, str]], Response]
+
+class _Connection:
+    __slots__ = ('sock', 'inbuf', 'outbuf', 'since')
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.inbuf = bytearray()
+        self.outbuf = b''
+        self.since = time.monotonic()
+
+class HTTPServer:
+    """A single threaded HTTP/1.1 server for GET requests, which passes the
+    path and query of each to handler and closes the connection once the
+    response is written"""
+
+    MAX_HEADER = 8192
+    IDLE = 10.0  # seconds a connection may take to send its request
+
+    def __init__(self, sock: socket.socket, handler: Handler,
+                 name: str = 'cpo-http') -> None:
+        self.sock = sock
+        self.sock.setblocking(False)
+        self.handler = handler
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        # written to by stop to wake the server
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ)
+        self._stopped = False
+        self.requests = 0
+        self.thread = threading.Thread(target=self.run, name=name,
+                                       daemon=True)
+
+    def start(self) -> 'HTTPServer':
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped = True
+        try:
+            self._wake_w.send(b'x')
+        except OSError:
+            pass
+
+    def run(self) -> None:
+        try:
+            while not self._stopped:
+                for key, events in self.selector.select(timeout=1.0):
+                    if key.fileobj is self.sock:
+                        self._accept()
+                    elif key.fileobj is self._wake_r:
+                        self._wake_r.recv(64)
+                    elif events & selectors.EVENT_READ:
+                        self._read(key.data)
+                    else:
+                        self._write(key.data)
+                self._reap()
+        finally:
+            for key in list(self.selector.get_map().values()):
+                if isinstance(key.data, _Connection):
+                    key.data.sock.close()
+            self.selector.close()
+            self.sock.close()
+            self._wake_r.close()
+            self._wake_w.close()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                sock, _ = self.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            conn = _Connection(sock)
+            self.selector.register(sock, selectors.EVENT_READ, conn)
+
+    def _close(self, conn: _Connection) -> None:
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.sock.close()
+
+    def _reap(self) -> None:
+        """Close connections which have not sent a request in time"""
+        now = time.monotonic()
+        for key in list(self.selector.get_map().values()):
+            conn = key.data
+            if isinstance(conn, _Connection) and not conn.outbuf and \
+                    now - conn.since > self.IDLE:
+                self._close(conn)
+
+    def _read(self, conn: _Connection) -> None:
+        try:
+            data = conn.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._close(conn)
+            return
+        if not data:
+            self._close(conn)
+            return
+        conn.inbuf += data
+        end = conn.inbuf.find(b'\r\n\r\n')
+        if end < 0:
+            end = conn.inbuf.find(b'\n\n')
+        if end < 0:
+            if len(conn.inbuf) > self.MAX_HEADER:
+                self._respond(conn, Response(431, 'request too large\n'))
+            return
+        self._respond(conn, self._dispatch(bytes(conn.inbuf[:end])))
+
+    def _dispatch(self, header: bytes) -> Response:
+        self.requests += 1
+        try:
+            method, target, _ = header.split(b'\n', 1)[0].decode(
+                'latin-1').split(' ', 2)
+        except ValueError:
+            return Response(400, 'bad request line\n')
+        if method != 'GET':
+            return Response(405, f'{method} is not supported\n')
+        path, _, query = target.partition('?')
+        params = dict(urllib.parse.parse_qsl(query))
+        try:
+            return self.handler(urllib.parse.unquote(path), params)
+        except Exception:
+            return Response(500, traceback.format_exc())
+
+    def _respond(self, conn: _Connection, response: Response) -> None:
+        conn.outbuf = response.encode()
+        self.selector.modify(conn.sock, selectors.EVENT_WRITE, conn)
+        self._write(conn)
+
+    def _write(self, conn: _Connection) -> None:
+        try:
+            sent = conn.sock.send(conn.outbuf)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._close(conn)
+            return
+        conn.outbuf = conn.outbuf[sent:]
+        if not conn.outbuf:
+            self._close(conn)
@@ -0,0 +1,435 @@
+from __future__ import annotations
+
+import contextlib
+import multiprocessing
+import multiprocessing.synchronize
+import pickle
+import struct
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+import weakref
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python < 3.8
+    shared_memory = None
+
+from .channel import CLOSEDSTATE, READYSTATE, UNKNOWNSTATE, PortState, \
+    SharedChan
+from .name import NameGenerator
+from . import util
+from .util import Nanoseconds, Singleton
+
+# the header of the segment, each field an int64
+_HEAD, _TAIL, _FREE, _COUNT, _CLOSED, _OUT_CLOSED, _WRITERS, _READERS = \
+    range(0, 64, 8)
+_HEADER = 64
+
+# the state of each slot
+_EMPTY, _FULL, _HELD, _DONE = range(4)
+
+# the kind of value in a slot, and the slot's header of kind and length
+_RAW, _PICKLED = range(2)
+_SLOT_HEADER = 16
+
+_ALIGN = 64
+
+def _round_up(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+if shared_memory is not None:
+    class _SharedMemory(shared_memory.SharedMemory):
+
+        def __del__(self):
+            try:
+                self.close()
+            except BufferError:
+                # a reader still has a view onto a slot, the mapping is
+                # freed along with the last view
+                pass
+
+def _semaphore_state(sem: multiprocessing.synchronize.SemLock) -> Tuple:
+    sl = sem._semlock
+    return sl.handle, sl.kind, sl.maxvalue, sl.name
+
+def _attach_semaphore(cls, state: Tuple) -> multiprocessing.synchronize.SemLock:
+    """Open a semaphore created by another process, by its name"""
+    sem = cls.__new__(cls)
+    sem.__setstate__(state)
+    return sem
+
+class _ShmN2NBuf(SharedChan):
+    """A buffered channel between OS processes, whose values are held in a
+    ring of slots in shared memory. A channel is passed to another process
+    by pickling it, for instance as an argument of a multiprocessing.Process
+    or an Isolated process, which attaches to the same memory.
+
+    Objects supporting the buffer protocol, such as bytes and numpy arrays,
+    are copied once into a slot, and read as bytes copied out of it, which
+    frees the slot at once. Other values are pickled into the slot. To read
+    a buffer without copying it, use view(), whose memoryview onto the slot
+    is only valid within its with block.
+
+    Blocking uses cross-process semaphores counting the empty and the full
+    slots. Closing releases each semaphore once, and each process woken by
+    the close releases it again, so every waiter wakes in O(1) per waiter.
+    Port events are only raised within the process doing the write or read.
+    """
+
+    crosses_processes = True
+    # its peers may be in other OS processes
+    external = True
+
+    def __init__(self, slots: int, slot_size: int, writers: int,
+                 readers: int, name: str) -> None:
+        if shared_memory is None:
+            raise NotImplementedError(
+                'Shared memory channels require python 3.8+')
+        assert slots > 0 and slot_size > 0
+        super().__init__()
+        self.set_name(name)
+        self.slots = slots
+        self.slot_size = slot_size
+        self.stride = _round_up(_SLOT_HEADER + slot_size)
+        self.slots_offset = _HEADER + _round_up(slots)
+        ctx = multiprocessing.get_context('spawn')
+        # the names of spawn context semaphores are kept, so that other
+        # processes can open them
+        self.empty = ctx.Semaphore(slots)
+        self.full = ctx.Semaphore(0)
+        self.write_lock = ctx.Lock()
+        self.meta = ctx.Lock()
+        self.shm = _SharedMemory(
+            create=True, size=self.slots_offset + slots * self.stride)
+        self.buf = self.shm.buf
+        self._set(_WRITERS, writers)
+        self._set(_READERS, readers)
+        weakref.finalize(self, self.shm.unlink)
+        self.register()
+
+    def __getstate__(self):
+        return (
+            self.name, self.slots, self.slot_size, self.shm.name,
+            [(type(sem), _semaphore_state(sem)) for sem in
+             (self.empty, self.full, self.write_lock, self.meta)],
+        )
+
+    def __setstate__(self, state) -> None:
+        name, self.slots, self.slot_size, shm_name, sems = state
+        SharedChan.__init__(self)
+        self.set_name(name)
+        self.stride = _round_up(_SLOT_HEADER + self.slot_size)
+        self.slots_offset = _HEADER + _round_up(self.slots)
+        self.empty, self.full, self.write_lock, self.meta = \
+            [_attach_semaphore(cls, s) for cls, s in sems]
+        # processes started by multiprocessing share the resource tracker of
+        # their parent, which unlinks the segment once the creator does
+        self.shm = _SharedMemory(name=shm_name)
+        self.buf = self.shm.buf
+        self.register()
+
+    def _get(self, field: int) -> int:
+        return struct.unpack_from('q', self.buf, field)[0]
+
+    def _set(self, field: int, value: int) -> None:
+        struct.pack_into('q', self.buf, field, value)
+
+    def _slot(self, i: int) -> int:
+        return self.slots_offset + i * self.stride
+
+    @property
+    def name_generator(self) -> NameGenerator:
+        return ShmN2NBuf
+
+    def __len__(self) -> int:
+        return self._get(_COUNT)
+
+    def is_empty(self) -> bool:
+        return self._get(_COUNT) == 0
+
+    def is_full(self) -> bool:
+        return self._get(_COUNT) == self.slots
+
+    @property
+    def in_port_state(self) -> PortState:
+        if self._get(_CLOSED):
+            return CLOSEDSTATE
+        if self.is_empty():
+            return CLOSEDSTATE if self._get(_OUT_CLOSED) else UNKNOWNSTATE
+        return READYSTATE
+
+    @property
+    def out_port_state(self) -> PortState:
+        if self._get(_OUT_CLOSED):
+            return CLOSEDSTATE
+        return UNKNOWNSTATE if self.is_full() else READYSTATE
+
+    def __str__(self) -> str:
+        closed = ' (CLOSED)' if self._get(_CLOSED) else \
+            ' (OutPort CLOSED)' if self._get(_OUT_CLOSED) else ''
+        return f'CHANNEL {self.name}: {self.name_generator._kind}{closed} ' \
+               f'(writers={self._get(_WRITERS)}, ' \
+               f'readers={self._get(_READERS)}) ' \
+               f'slots={self.slots}x{self.slot_size}, length={len(self)}'
+
+    def show_state(self, file) -> None:
+        print(str(self), end='', file=file)
+
+    @property
+    def can_input(self) -> bool:
+        return not (self._get(_CLOSED) or
+                    (self._get(_OUT_CLOSED) and self.is_empty()))
+
+    @property
+    def can_output(self) -> bool:
+        return not self._get(_OUT_CLOSED)
+
+    def close(self) -> None:
+        with self.meta:
+            already = self._get(_CLOSED)
+            self._set(_CLOSED, 1)
+            self._set(_OUT_CLOSED, 1)
+        if not already:
+            self.full.release()
+            self.empty.release()
+            self.out_port_event(CLOSEDSTATE)
+            self.in_port_event(CLOSEDSTATE)
+            self.unregister()
+
+    def close_out(self) -> None:
+        with self.meta:
+            writers = self._get(_WRITERS) - 1
+            self._set(_WRITERS, writers)
+            if writers == 0:
+                self._set(_OUT_CLOSED, 1)
+        if writers == 0:
+            # wake a reader, readers may drain what is left before they
+            # see Closed
+            self.full.release()
+            self.in_port_event(self.in_port_state)
+
+    def close_in(self) -> None:
+        with self.meta:
+            readers = self._get(_READERS) - 1
+            self._set(_READERS, readers)
+        if readers == 0:
+            self.close()
+
+    def _acquire(self, sem, timeout: Optional[Nanoseconds]) -> bool:
+        if timeout is None:
+            return sem.acquire()
+        return sem.acquire(timeout=max(timeout.to_seconds(), 0))
+
+    # writing
+
+    def _encode(self, value: Any) -> Tuple[int, memoryview]:
+        try:
+            view = memoryview(value)
+        except TypeError:
+            return _PICKLED, memoryview(pickle.dumps(value, -1))
+        if not view.c_contiguous:
+            view = memoryview(view.tobytes())
+        return _RAW, view.cast('B')
+
+    def _write(self, value: Any, timeout: Optional[Nanoseconds]) -> bool:
+        if self._get(_OUT_CLOSED):
+            raise util.Closed(self.name)
+        kind, data = self._encode(value)
+        if len(data) > self.slot_size:
+            raise ValueError(f'{len(data)} bytes will not fit in a slot of '
+                             f'{self.name}, of {self.slot_size} bytes')
+        if not self._acquire(self.empty, timeout):
+            return False
+        if self._get(_OUT_CLOSED):
+            self.empty.release()  # pass on the wake up
+            raise util.Closed(self.name)
+        with self.write_lock:
+            tail = self._get(_TAIL)
+            at = self._slot(tail)
+            struct.pack_into('qq', self.buf, at, kind, len(data))
+            self.buf[at + _SLOT_HEADER:at + _SLOT_HEADER + len(data)] = data
+            with self.meta:
+                self.buf[_HEADER + tail] = _FULL
+                self._set(_TAIL, (tail + 1) % self.slots)
+                self._set(_COUNT, self._get(_COUNT) + 1)
+        self.full.release()
+        self.in_port_event(READYSTATE)
+        return True
+
+    def __lshift__(self, value: Any) -> Any:
+        self._write(value, None)
+        return value
+
+    def write_before(self, ns: Nanoseconds, value: Any) -> bool:
+        return self._write(value, ns)
+
+    def write_many(self, values: Iterable[Any]) -> int:
+        written = 0
+        for value in values:
+            try:
+                self._write(value, None)
+            except util.Closed:
+                if written == 0:
+                    raise
+                break
+            written += 1
+        return written
+
+    # reading
+
+    def _free(self, slot: int) -> None:
+        """Give up a slot which has been read"""
+        freed = 0
+        with self.meta:
+            self.buf[_HEADER + slot] = _DONE
+            # slots are refilled in ring order, so only free up to the
+            # first slot which is still being read
+            free = self._get(_FREE)
+            while self.buf[_HEADER + free] == _DONE:
+                self.buf[_HEADER + free] = _EMPTY
+                free = (free + 1) % self.slots
+                freed += 1
+            self._set(_FREE, free)
+        for _ in range(freed):
+            self.empty.release()
+        if freed:
+            self.out_port_event(READYSTATE)
+
+    def _take(self, timeout: Optional[Nanoseconds]) -> Optional[int]:
+        """The slot of the next value, now held by the caller, or None if
+        timeout passed or the wake up was not for a value"""
+        if self._get(_CLOSED):
+            raise util.Closed(self.name)
+        if not self._acquire(self.full, timeout):
+            return None
+        with self.meta:
+            count = self._get(_COUNT)
+            if count == 0 or self._get(_CLOSED):
+                # a wake up from close rather than a value
+                closed = self._get(_CLOSED) or self._get(_OUT_CLOSED)
+                head = None
+            else:
+                head = self._get(_HEAD)
+                self._set(_HEAD, (head + 1) % self.slots)
+                self._set(_COUNT, count - 1)
+                self.buf[_HEADER + head] = _HELD
+        if head is None:
+            self.full.release()  # pass on the wake up
+            if closed:
+                raise util.Closed(self.name)
+        return head
+
+    def _claim(self, timeout: Optional[Nanoseconds]) -> Optional[int]:
+        """The slot of the next value, or None if timeout passes first"""
+        if timeout is None:
+            while True:
+                slot = self._take(None)
+                if slot is not None:
+                    return slot
+        deadline = util.nano_time() + timeout
+        while True:
+            slot = self._take(deadline - util.nano_time())
+            if slot is not None or deadline <= util.nano_time():
+                return slot
+
+    def _value(self, slot: int, copy: bool) -> Any:
+        """The value in slot, a view onto it if it is a buffer and not to
+        be copied"""
+        at = self._slot(slot)
+        kind, length = struct.unpack_from('qq', self.buf, at)
+        view = self.buf[at + _SLOT_HEADER:at + _SLOT_HEADER + length]
+        if kind == _RAW and not copy:
+            return view
+        value = pickle.loads(view) if kind == _PICKLED else bytes(view)
+        view.release()
+        return value
+
+    def _read(self, timeout: Optional[Nanoseconds]) -> Any:
+        slot = self._claim(timeout)
+        if slot is None:
+            return None
+        try:
+            return self._value(slot, True)
+        finally:
+            self._free(slot)
+
+    def __invert__(self) -> Any:
+        return self._read(None)
+
+    def read_before(self, ns: Nanoseconds) -> Any:
+        return self._read(ns)
+
+    def read_many(self, max_n: int,
+                  timeout: Optional[Nanoseconds] = None) -> List[Any]:
+        assert max_n > 0
+        first = self._claim(timeout)
+        if first is None:
+            return []
+        slots = [first]
+        try:
+            while len(slots) < max_n and not self.is_empty():
+                try:
+                    slot = self._take(Nanoseconds(0))
+                except util.Closed:
+                    break
+                if slot is None:
+                    break
+                slots.append(slot)
+            return [self._value(slot, True) for slot in slots]
+        finally:
+            for slot in slots:
+                self._free(slot)
+
+    @contextlib.contextmanager
+    def view(self, timeout: Optional[Nanoseconds] = None) -> Iterator[Any]:
+        """Read the next value without copying it out of its slot: a buffer
+        is read as a memoryview onto the slot, which is freed when the with
+        block exits. The view must not be used after that. Other values are
+        unpickled as usual. The value is None if timeout passes first.
+
+        Slots are refilled in ring order, so a view held for long keeps
+        writers waiting once the ring has come round to it."""
+        slot = self._claim(timeout)
+        if slot is None:
+            yield None
+            return
+        try:
+            value = self._value(slot, False)
+            try:
+                yield value
+            finally:
+                if isinstance(value, memoryview):
+                    value.release()
+        finally:
+            self._free(slot)
+
+
+class _ShmN2NBufFactory(NameGenerator, metaclass=Singleton):
+
+    def __init__(self):
+        super().__init__('ShmN2NBuf')
+
+    def __call__(self, slots: int = 8, slot_size: int = 1 << 20,
+                 writers: int = 0, readers: int = 0,
+                 name: Optional[str] = None) -> _ShmN2NBuf:
+        """
+        Args:
+            slots: The number of values the channel can hold.
+            slot_size: The largest value, in bytes, the channel can hold.
+            writers: The number of close_out calls which close the channel.
+            readers: The number of close_in calls which close the channel.
+            name: The name for the channel.
+
+        Returns: A new ShmN2NBuf channel
+        """
+        if name is None:
+            name = self._new_name()
+        return _ShmN2NBuf(slots, slot_size, writers, readers, name)
+
+ShmN2NBuf = _ShmN2NBufFactory()
+
+def ShmOneOne(slots: int = 8, slot_size: int = 1 << 20,
+              name: Optional[str] = None) -> _ShmN2NBuf:
+    if name is None:
+        name = ShmN2NBuf._new_name('ShmOneOne')
+    return ShmN2NBuf(slots=slots, slot_size=slot_size, writers=1, readers=1,
+                     name=name)
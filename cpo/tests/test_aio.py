@@ -0,0 +1,109 @@
+import asyncio
+import pytest
+import time
+
+from cpo import *
+
+def test_aio_thread_to_async():
+    c = OneOne()
+    result = []
+    @async_proc
+    async def reader():
+        async for x in c:
+            result.append(x)
+    @proc
+    def writer():
+        for i in range(100):
+            c << i
+        c.close()
+    (reader | writer)()
+    assert result == list(range(100))
+
+def test_aio_async_to_thread():
+    c = OneOne()
+    @async_proc
+    async def writer():
+        for i in range(100):
+            await c.awrite(i)
+        c.close()
+    handle = fork(writer)
+    assert list(c) == list(range(100))
+    handle.join()
+
+def test_aio_buffered():
+    c = N2NBuf(size=2, writers=2)
+    result = []
+    @async_proc
+    async def reader():
+        async for x in c:
+            result.append(x)
+    def writer(start):
+        async def write():
+            for i in range(start, start + 50):
+                await c.awrite(i)
+            c.close_out()
+        return AsyncProc(write)
+    (reader | writer(0) | writer(50))()
+    assert sorted(result) == list(range(100))
+    assert [x for x in result if x < 50] == list(range(50))
+
+def test_aio_n2n_falls_back_to_executor():
+    c = ManyOne(writers=2)
+    def writer(start):
+        async def write():
+            for i in range(start, start + 10):
+                await c.awrite(i)
+            c.close_out()
+        return AsyncProc(write)
+    handles = [fork(writer(0)), fork(writer(10))]
+    assert sorted(c) == list(range(20))
+    for handle in handles:
+        handle.join()
+
+def test_aio_cancel_read():
+    c = OneOne()
+    @async_proc
+    async def reader():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(c.aread(), 0.05)
+        # the reader slot was given up
+        assert await c.aread() == 1
+    handle = fork(reader)
+    time.sleep(0.2)
+    c << 1
+    handle.join()
+    assert handle.exc is None
+
+def test_aio_ajoin():
+    c = N2NBuf(writers=1)
+    @async_proc
+    async def main():
+        handles = [fork(async_proc(lambda i=i: c.awrite(i)))
+                   for i in range(10)]
+        for handle in handles:
+            await handle.ajoin()
+        c.close_out()
+    main()
+    assert sorted(c) == list(range(10))
+
+def test_aio_many_processes():
+    N = 20000
+    chans = [OneOne() for _ in range(N + 1)]
+    async def link(i):
+        await chans[i + 1].awrite(await chans[i].aread() + 1)
+    result = []
+    Par('chain', [async_proc(link, i) for i in range(N)] +
+        [proc(lambda: chans[0] << 0),
+         proc(lambda: result.append(~chans[N]))])()
+    assert result == [N]
+
+def test_aio_interrupt():
+    c = OneOne()
+    @async_proc
+    async def reader():
+        await c.aread()
+    handle = fork(reader)
+    time.sleep(0.1)
+    handle.interrupt()
+    handle.join()
+    assert isinstance(handle.exc, Cancelled)
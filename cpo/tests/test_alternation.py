@@ -0,0 +1,122 @@
+import pytest
+import time
+
+from cpo import *
+
+def test_alt_reads_ready_port():
+    a, b = OneOne(), OneOne()
+    @fork_proc
+    def write():
+        b << 2
+    result = alt(
+        InEvent(a, lambda x: ('a', x)),
+        InEvent(b, lambda x: ('b', x)),
+    )
+    assert result == ('b', 2)
+
+def test_alt_waits_for_port_event():
+    a, b = OneOne(), OneOneBuf(1)
+    @fork_proc
+    def write():
+        time.sleep(0.2)
+        a << 1
+    start = time.time()
+    assert alt(InEvent(a, lambda x: x), InEvent(b, lambda x: -x)) == 1
+    assert time.time() - start >= 0.15
+    write.join()
+    assert not a.in_listeners and not b.in_listeners
+
+def test_alt_output():
+    c = OneOne()
+    got = []
+    @fork_proc
+    def read():
+        got.append(~c)
+    assert alt(OutEvent(c, lambda: 5, lambda: 'sent')) == 'sent'
+    read.join()
+    assert got == [5]
+
+def test_alt_guards():
+    a, b = OneOneBuf(1), OneOneBuf(1)
+    a << 1
+    b << 2
+    assert alt(
+        InEvent(a, lambda x: x, guard=False),
+        InEvent(b, lambda x: x, guard=lambda: True),
+    ) == 2
+    with pytest.raises(Abort):
+        alt(InEvent(a, lambda x: x, guard=False))
+
+def test_alt_after():
+    c = OneOne()
+    start = time.time()
+    assert alt(
+        InEvent(c, lambda x: x),
+        After(Nanoseconds.from_seconds(0.1), lambda: 'timeout'),
+    ) == 'timeout'
+    assert time.time() - start >= 0.09
+
+def test_alt_orelse():
+    a, b = OneOne(), OneOne()
+    b.close()
+    assert alt(
+        InEvent(a, lambda x: x, guard=False),
+        InEvent(b, lambda x: x),
+        OrElse(lambda: 'none'),
+    ) == 'none'
+
+def test_alt_all_ports_close():
+    a, b = OneOne(), OneOne()
+    @fork_proc
+    def close():
+        time.sleep(0.1)
+        a.close()
+        b.close()
+    with pytest.raises(Abort):
+        alt(InEvent(a, lambda x: x), InEvent(b, lambda x: x))
+
+def test_prialt_order():
+    a, b = OneOneBuf(1), OneOneBuf(1)
+    a << 1
+    b << 2
+    events = [InEvent(a, lambda x: x), InEvent(b, lambda x: x)]
+    assert prialt(*events) == 1
+    assert prialt(*events) == 2
+
+def test_serve_many_ports():
+    N = 200
+    chans = [OneOne() for _ in range(N)]
+    @fork_procs(range(N))
+    def writers(i):
+        for j in range(5):
+            chans[i] << j
+        chans[i].close()
+    served = []
+    serve(*[InEvent(c, served.append) for c in chans])
+    writers.join()
+    assert len(served) == 5 * N
+    assert sum(served) == 10 * N
+    assert all(not c.in_listeners for c in chans)
+
+def test_serve_is_fair():
+    a, b = N2NBuf(size=0, writers=1, readers=1), \
+           N2NBuf(size=0, writers=1, readers=1)
+    a.write_many(['a'] * 10)
+    b.write_many(['b'] * 10)
+    a.close_out()
+    b.close_out()
+    served = []
+    serve(InEvent(a, served.append), InEvent(b, served.append))
+    assert len(served) == 20
+    assert served[:10].count('a') == 5
+
+def test_serve_stops():
+    c = OneOneBuf(10)
+    c.write_many(range(10))
+    served = []
+    def body(x):
+        if x == 3:
+            stop()
+        served.append(x)
+    serve(InEvent(c, body), OrElse(lambda: served.append('orelse')))
+    assert served == [0, 1, 2]
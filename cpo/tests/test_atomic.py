@@ -1,5 +1,9 @@
 
+import threading
+import time
+
 from cpo import *
+from cpo import atomic
 
 def test_atomic_init():
     Atomic("hello")
@@ -7,6 +11,15 @@ def test_atomic_init():
     AtomicCounter(2)
 
 def test_atomic():
+    for Backend in [atomic.LockedAtomic, atomic.GILAtomic]:
+        check_atomic(Backend)
+
+def test_atomic_backend():
+    expected = atomic.GILAtomic if atomic.gil_enabled() \
+        else atomic.LockedAtomic
+    assert Atomic is expected
+
+def check_atomic(Atomic):
     c = Atomic("a")
     assert c.get_and_set("b") == "a"
     assert c.get() == "b"
@@ -18,6 +31,22 @@ def test_atomic():
     assert c.compare_and_set("cc", "ee")
     assert c.get() == "ee"
 
+def test_atomic_set_during_update():
+    # a set racing a read-modify-write is ordered after it, not overwritten
+    for Backend in [atomic.LockedAtomic, atomic.GILAtomic]:
+        c = Backend(0)
+        updating = threading.Event()
+        def update(x):
+            updating.set()
+            time.sleep(0.05)
+            return x + 1
+        t = threading.Thread(target=c.get_and_update, args=(update,))
+        t.start()
+        updating.wait()
+        c.set(10)
+        t.join()
+        assert c.get() == 10
+
 def test_atomic_num():
     c = AtomicNum(0)
     @procs(range(1000))
@@ -36,3 +65,15 @@ def test_atomic_counter():
             next(c)
     workers()
     assert c.get() == 1000*1000
+
+def test_striped_counter():
+    c = StripedCounter(5, stripes=4)
+    @procs(range(100))
+    def workers(i):
+        for _ in range(1000):
+            c.inc(3)
+            c.dec(1)
+    workers()
+    assert c.get() == 5 + 2 * 100 * 1000
+    c.reset()
+    assert c.get() == 0
@@ -1,5 +1,6 @@
 
 import pytest
+import threading
 import time
 
 from cpo import *
@@ -163,6 +164,34 @@ def test_oneone_write_before():
     assert not c.write_before(Nanoseconds.from_seconds(0.15), 3)
     assert c.write_before(Nanoseconds.from_seconds(0.15), 4)
 
+def test_oneone_write_before_races_reader():
+    # writes which time out just as the reader arrives are either taken or
+    # withdrawn, never lost
+    c = OneOne()
+    received = []
+    @fork_proc
+    def reader():
+        try:
+            while True:
+                received.append(~c)
+        except Closed:
+            pass
+    sent = [i for i in range(2000)
+            if c.write_before(Nanoseconds.from_seconds(0.00002), i)]
+    c.close()
+    reader.join()
+    assert received == sent
+
+def test_oneone_extended_rendezvous_fails():
+    # a reader whose function fails has still taken the value
+    c = OneOne()
+    @fork_proc
+    def writer():
+        c << 1
+    with pytest.raises(ZeroDivisionError):
+        c.extended_rendezvous(lambda x: x / 0)
+    writer.join()
+
 def test_manymany():
     c = N2N(5, 5, "", False, False)
 
@@ -272,3 +301,173 @@ def test_faultyoneone():
     (reader | writer)()
     # could fail probabilistically (unlikely ~6 std)
     assert 0.35*N < total < 0.37*N
+
+def test_oneone_wait_strategies():
+    for strategy in [ParkWait(), SpinParkWait(0), SpinParkWait(10000)]:
+        c = OneOne(wait_strategy=strategy)
+        l = list(range(100))
+        @fork_proc
+        def write():
+            for x in l:
+                c << x
+        for x in l:
+            assert ~c == x
+        write.join()
+        stats = strategy.stats()
+        assert sum(stats.values()) == 2 * len(l)
+        strategy.reset_stats()
+        assert sum(strategy.stats().values()) == 0
+
+def test_n2n_wait_strategy_close():
+    strategy = SpinParkWait(10)
+    c = ManyMany(wait_strategy=strategy)
+    @fork_proc
+    def read():
+        with pytest.raises(Closed):
+            ~c
+    time.sleep(0.1)
+    c.close()
+    time.sleep(0.1)
+    assert not read.is_alive()
+    assert strategy.stats()['parked'] == 1
+
+def test_write_read_many():
+    for Channel in ALL_CHANNELS:
+        c = Channel()
+        l = list(range(100))
+        @fork_proc
+        def write():
+            assert c.write_many(l[:10]) == 10
+            assert c.write_many(l[10:]) == 90
+        result = []
+        while len(result) < len(l):
+            result += c.read_many(30)
+        assert result == l
+        write.join()
+        c.close()
+
+def test_oneone_write_many_one_rendezvous():
+    c = OneOne()
+    @fork_proc
+    def write():
+        c.write_many([1, 2, 3])
+    assert c.read_many(10) == [1, 2, 3]
+    @fork_proc
+    def write():
+        c.write_many([4, 5, 6])
+    assert ~c == 4
+    time.sleep(0.1)
+    assert write.is_alive()
+    assert c.read_many(10) == [5, 6]
+    time.sleep(0.1)
+    assert not write.is_alive()
+
+def test_read_many_timeout():
+    for Channel in ALL_CHANNELS:
+        c = Channel()
+        assert c.read_many(10, Nanoseconds.from_seconds(0.01)) == []
+        c.close()
+        with pytest.raises(Closed):
+            c.read_many(10, Nanoseconds.from_seconds(0.01))
+
+def test_write_many_closed_partway():
+    c = OneOne()
+    taken = []
+    @fork_proc
+    def write():
+        taken.append(c.write_many([1, 2, 3]))
+        with pytest.raises(Closed):
+            c.write_many([4])
+    assert c.read_many(2) == [1, 2]
+    c.close()
+    write.join()
+    assert taken == [2]
+    c = OneOneBuf(2)
+    @fork_proc
+    def write():
+        taken.append(c.write_many([1, 2, 3]))
+    assert c.read_many(1) == [1]
+    write.join()
+    c.close_in()
+    with pytest.raises(Closed):
+        c.write_many([4])
+    assert taken == [2, 3]
+
+def test_write_many_closed_while_taken():
+    c = OneOne()
+    taking = threading.Event()
+    closed = threading.Event()
+    taken = []
+    @fork_proc
+    def write():
+        taken.append(c.write_many([1, 2, 3]))
+    def slowly(value):
+        taking.set()
+        closed.wait()
+        return value
+    @fork_proc
+    def read():
+        taken.append(c.extended_rendezvous(slowly))
+    taking.wait()
+    c.close()
+    # the writer waits for the reader which claimed a value before the
+    # close, rather than withdrawing the batch from under it
+    time.sleep(0.05)
+    assert taken == []
+    closed.set()
+    read.join()
+    write.join()
+    assert sorted(taken) == [1, 1]
+    assert read.exc is None and write.exc is None
+
+def test_n2nbuf_unbounded():
+    c = OneOneBuf()
+    for i in range(1000):
+        c << i
+    assert c.read_many(10) == list(range(10))
+    assert [~c for _ in range(990)] == list(range(10, 1000))
+
+def test_n2nbuf_close_wakes_waiters():
+    full = OneOneBuf(1)
+    full << 0
+    empty = N2NBuf(size=1, writers=0, readers=0)
+    closed = AtomicNum(0)
+    @fork_procs(range(4))
+    def waiters(i):
+        try:
+            if i % 2:
+                full << i
+            else:
+                ~empty
+        except Closed:
+            closed.inc(1)
+    time.sleep(0.1)
+    assert closed.get() == 0
+    full.close()
+    empty.close()
+    waiters.join()
+    assert closed.get() == 4
+
+def test_n2nbuf_close_out_drains():
+    c = N2NBuf(size=4, writers=1, readers=2)
+    c.write_many([1, 2, 3])
+    c.close_out()
+    assert c.can_input
+    assert sorted([~c, ~c] + c.read_many(2)) == [1, 2, 3]
+    with pytest.raises(Closed):
+        ~c
+    assert not c.can_input
+
+def test_manymany_fair():
+    c = N2N(5, 5, "", True, True)
+    @procs(range(5))
+    def writers(i):
+        for j in range(100):
+            c << (i, j)
+    result = []
+    @procs(range(5))
+    def readers(i):
+        for _ in range(100):
+            result.append(~c)
+    (readers | writers)()
+    assert sorted(result) == [(i, j) for i in range(5) for j in range(100)]
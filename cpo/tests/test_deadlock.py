@@ -0,0 +1,192 @@
+
+import threading
+import time
+
+from cpo import *
+
+def _blocked(handle):
+    # wait for a forked process to block
+    while not handle.is_alive():
+        time.sleep(0.001)
+    time.sleep(0.05)
+
+def crossed_semaphores():
+    """Two processes which each hold the semaphore the other wants"""
+    a = BooleanSemaphore(available=True)
+    b = BooleanSemaphore(available=True)
+    both = threading.Barrier(2)
+    def taking(first, second):
+        def body():
+            first.acquire()
+            both.wait()
+            second.acquire()
+        return body
+    handles = [fork(proc(taking(a, b))), fork(proc(taking(b, a)))]
+    for handle in handles:
+        _blocked(handle)
+    return handles
+
+def stop(handles):
+    for handle in handles:
+        handle.interrupt()
+    for handle in handles:
+        handle.join()
+
+def test_deadlock_cycle():
+    handles = crossed_semaphores()
+    try:
+        deadlocks = DeadlockDetector.detect(0.05)
+        cycles = [d for d in deadlocks if d.kind == 'cycle']
+        assert len(cycles) == 1
+        assert set(cycles[0].threads) == {h.thread for h in handles}
+        for thread in cycles[0].threads:
+            assert len(cycles[0].edges[thread]) == 1
+    finally:
+        stop(handles)
+
+def test_deadlock_stall():
+    N = 4
+    forks = [OneOne() for _ in range(N)]
+    def philosopher(i):
+        def body():
+            forks[(i + 1) % N] << ~forks[i]
+        return body
+    handle = ParSyntax([proc(philosopher(i)) for i in range(N)]).fork()
+    _blocked(handle)
+    try:
+        stalls = [d for d in DeadlockDetector.detect(0.05)
+                  if d.kind == 'stall']
+        assert len(stalls) == 1
+        assert len(stalls[0].threads) == N
+        assert all(stalls[0].waits[t] for t in stalls[0].threads)
+    finally:
+        stop([handle])
+
+def test_deadlock_none_while_running():
+    c = OneOne()
+    @fork_proc
+    def producer():
+        for i in range(200):
+            c << i
+            time.sleep(0.001)
+    @fork_proc
+    def consumer():
+        for _ in range(200):
+            ~c
+    time.sleep(0.01)
+    assert DeadlockDetector.detect(0.05) == []
+    producer.join()
+    consumer.join()
+
+def test_deadlock_reported_once():
+    handles = crossed_semaphores()
+    try:
+        detector = DeadlockDetector()
+        assert detector.scan() == []
+        assert len(detector.scan()) == 1
+        assert detector.scan() == []
+        assert len(detector.found) == 1
+    finally:
+        stop(handles)
+
+def test_deadlock_found_bounded():
+    detector = DeadlockDetector()
+    detector.KEEP = 3
+    threads_ = [threading.Thread() for _ in range(5)]
+    def found(i):
+        return Deadlock('cycle', [threads_[i]], {}, {})
+    detector._record([found(i) for i in range(5)])
+    assert [d.threads[0] for d in detector.found] == threads_[2:]
+    # a deadlock found again replaces the one found before
+    detector._record([found(3)])
+    assert [d.threads[0] for d in detector.found] == \
+        [threads_[2], threads_[4], threads_[3]]
+    assert detector.found[-1].count == 2
+    assert 'found 2 times' in str(detector.found[-1])
+
+def test_deadlock_state_pages():
+    d = DEBUGGER(-1)
+    threads_ = [threading.Thread() for _ in range(5)]
+    d.detector._record([Deadlock('stall', [t], {}, {}) for t in threads_])
+    page = d.state(offset=1, limit=2)['deadlocks']
+    assert page['total'] == 5
+    assert [item['kind'] for item in page['items']] == ['stall', 'stall']
+    assert [item['count'] for item in page['items']] == [1, 1]
+    assert len(page['items']) == 2
+
+def test_deadlock_watchdog():
+    d = DEBUGGER(-1)
+    found = []
+    d.watch_deadlocks(0.02, found.append)
+    handles = crossed_semaphores()
+    try:
+        deadline = time.time() + 5
+        while not found and time.time() < deadline:
+            time.sleep(0.01)
+        assert found and found[0].kind == 'cycle'
+    finally:
+        d.stop_watching_deadlocks()
+        stop(handles)
+
+def test_deadlock_show():
+    handles = crossed_semaphores()
+    try:
+        d = DEBUGGER(-1)
+        class Out:
+            text = ''
+            def write(self, s):
+                self.text += s
+        out = Out()
+        d.detect_deadlocks(0.05, file=out)
+        assert 'DEADLOCK (cycle)' in out.text
+        assert 'blocked by' in out.text
+        assert 'second.acquire()' in out.text
+    finally:
+        stop(handles)
+
+def test_deadlock_extended_rendezvous():
+    # the reader of c, in its extended rendezvous, waits for a semaphore
+    # the writer of c holds
+    c = OneOne()
+    s = BooleanSemaphore(available=True)
+    @fork_proc
+    def writer():
+        with s:
+            c << 1
+    time.sleep(0.05)
+    @fork_proc
+    def reader():
+        c.extended_rendezvous(lambda x: s.acquire())
+    _blocked(reader)
+    try:
+        cycles = [d for d in DeadlockDetector.detect(0.05)
+                  if d.kind == 'cycle']
+        assert len(cycles) == 1
+        assert set(cycles[0].threads) == {writer.thread, reader.thread}
+    finally:
+        stop([writer, reader])
+
+def test_deadlock_counting_queue():
+    s = CountingSemaphore(0)
+    handles = []
+    for _ in range(2):
+        handles.append(fork(proc(s.acquire)))
+        _blocked(handles[-1])
+    try:
+        waits, edges = DeadlockDetector.snapshot()
+        # the second waiter waits for the first
+        assert edges[handles[1].thread] == frozenset([handles[0].thread])
+    finally:
+        s.release(2)
+        for handle in handles:
+            handle.join()
+
+def test_deadlock_no_stall_on_ticker():
+    ticker = Ticker(Nanoseconds.from_seconds(10))
+    handle = fork(proc(lambda: ~ticker))
+    _blocked(handle)
+    try:
+        assert DeadlockDetector.detect(0.05) == []
+    finally:
+        ticker.close()
+        handle.join()
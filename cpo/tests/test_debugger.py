@@ -1,5 +1,9 @@
 
+import json
+import threading
 import time
+import urllib.error
+import urllib.request
 
 from cpo import *
 
@@ -31,3 +35,88 @@ def test_debugger_runs():
     solver = Simple(solve)
     p = ParSyntax(philosophers + [solver])
     p()
+
+def get(d, path):
+    with urllib.request.urlopen(f'http://{d.host}:{d.port}{path}',
+                                timeout=10) as response:
+        return response.status, response.headers['Content-Type'], \
+            response.read().decode('utf-8')
+
+def test_debugger_text():
+    d = DEBUGGER()
+    try:
+        status, content_type, body = get(d, '/')
+        assert status == 200
+        assert content_type.startswith('text/plain')
+        assert 'CPO State' in body
+    finally:
+        d.stop()
+
+def test_debugger_state_json():
+    d = DEBUGGER()
+    chans = [OneOne() for _ in range(5)]
+    handle = fork(proc(lambda: ~chans[0]))
+    try:
+        while not chans[0].get_waiting():
+            time.sleep(0.001)
+        status, content_type, body = get(d, '/state.json?limit=1000')
+        assert status == 200 and content_type == 'application/json'
+        state = json.loads(body)
+        names = {o['name']: o for o in state['objects']['items']}
+        for c in chans:
+            assert names[c.name]['kind'] == 'channel'
+        assert names[chans[0].name]['waiting'] == [handle.thread.ident]
+        threads_ = {t['id']: t for t in state['threads']['items']}
+        assert threads_[handle.thread.ident]['process']
+        assert threads_[handle.thread.ident]['waiting_for'] == \
+            [names[chans[0].name]['key']]
+        # pages
+        _, _, body = get(d, '/state.json?offset=1&limit=2')
+        page = json.loads(body)
+        assert len(page['objects']['items']) == 2
+        # objects of other tests may be collected between the two pages
+        assert page['offset'] == 1 and page['limit'] == 2
+        assert get_error(d, '/state.json?limit=x') == 400
+    finally:
+        chans[0] << 1
+        handle.join()
+        d.stop()
+
+def get_error(d, path):
+    try:
+        get(d, path)
+    except urllib.error.HTTPError as e:
+        return e.code
+    return None
+
+def test_debugger_thread():
+    d = DEBUGGER()
+    try:
+        ident = threading.main_thread().ident
+        _, _, body = get(d, f'/threads/{ident}')
+        state = json.loads(body)
+        assert state['id'] == ident
+        assert any(f['function'] == 'test_debugger_thread'
+                   for f in state['stack'])
+        assert get_error(d, '/threads/1') == 404
+        assert get_error(d, '/nowhere') == 404
+    finally:
+        d.stop()
+
+def test_debugger_single_thread():
+    d = DEBUGGER()
+    try:
+        before = threading.active_count()
+        results = []
+        def scrape():
+            results.append(get(d, '/state.json')[0])
+        scrapers = [threading.Thread(target=scrape) for _ in range(20)]
+        for t in scrapers:
+            t.start()
+        for t in scrapers:
+            t.join()
+        assert results == [200] * 20
+        assert threading.active_count() == before
+        assert d.server.requests == 20
+    finally:
+        d.stop()
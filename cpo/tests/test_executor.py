@@ -0,0 +1,174 @@
+import ctypes
+import sys
+import threading
+import time
+
+import pytest
+
+from cpo import *
+from cpo import executor
+
+class Task:
+
+    def __init__(self, body):
+        self.body = body
+
+    def run(self):
+        self.body()
+
+def run_all(ex, n, body):
+    done = threading.Semaphore(0)
+    def task():
+        body()
+        done.release()
+    for _ in range(n):
+        ex.execute(Task(task), 0)
+    for _ in range(n):
+        assert done.acquire(timeout=10)
+
+def test_cached_executor_grows():
+    ex = executor.CachedExecutor(Nanoseconds.from_seconds(10))
+    N = 300
+    # every task must be running at once for any of them to finish
+    barrier = threading.Barrier(N)
+    run_all(ex, N, lambda: barrier.wait(timeout=10))
+    time.sleep(0.1)
+    assert ex.live_threads == N
+    assert ex.idle_threads == N
+    ex.shutdown()
+
+def test_cached_executor_reuses_threads():
+    ex = executor.CachedExecutor(Nanoseconds.from_seconds(10))
+    names = set()
+    for _ in range(20):
+        run_all(ex, 1, lambda: names.add(threading.current_thread().name))
+        time.sleep(0.01)
+    assert len(names) == 1
+    assert ex.thread_count.get() == 1
+    ex.shutdown()
+
+def test_cached_executor_reaps_idle():
+    ex = executor.CachedExecutor(Nanoseconds.from_seconds(0.1))
+    run_all(ex, 10, lambda: time.sleep(0.05))
+    time.sleep(0.5)
+    assert ex.live_threads == 0
+    assert ex.idle_threads == 0
+    run_all(ex, 1, lambda: None)
+    ex.shutdown()
+    time.sleep(0.1)
+    assert ex.live_threads == 0
+
+def thread_stack_size() -> int:
+    """The stack size of the current thread, as pthreads has it"""
+    libc = ctypes.CDLL(None)
+    attr = ctypes.create_string_buffer(128)  # larger than a pthread_attr_t
+    assert libc.pthread_getattr_np(
+        ctypes.c_ulong(threading.get_ident()), attr) == 0
+    size = ctypes.c_size_t()
+    libc.pthread_attr_getstacksize(attr, ctypes.byref(size))
+    libc.pthread_attr_destroy(attr)
+    return size.value
+
+def test_size_pooled_executor_buckets():
+    ex = executor.SizePooledExecutor(Nanoseconds.from_seconds(10), False)
+    assert ex.bucket(0) == 0
+    assert ex.bucket(1) == 32 * 1024
+    assert ex.bucket(40000) == 128 * 1024
+    assert ex.bucket((8 << 20) + 1) == (8 << 20) + 4096
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+                    reason='reads the stack size with pthread_getattr_np')
+def test_size_pooled_executor_stack_sizes():
+    ex = executor.SizePooledExecutor(Nanoseconds.from_seconds(10), False)
+    for stack_size in [1000, 40000, 3 << 20, 20 << 20]:
+        sizes = []
+        done = threading.Semaphore(0)
+        def task():
+            sizes.append(thread_stack_size())
+            done.release()
+        ex.execute(Task(task), stack_size)
+        assert done.acquire(timeout=10)
+        assert sizes == [ex.bucket(stack_size)]
+    ex.shutdown()
+
+def test_size_pooled_executor_report():
+    ex = executor.SizePooledExecutor(Nanoseconds.from_seconds(10), False)
+    N = 20
+    barrier = threading.Barrier(N)
+    done = threading.Semaphore(0)
+    def task():
+        barrier.wait(timeout=10)
+        done.release()
+    for _ in range(N):
+        ex.execute(Task(task), 1000)
+    for _ in range(N):
+        assert done.acquire(timeout=10)
+    stats = ex.stats()[32 * 1024]
+    assert stats['created'] == N
+    assert stats['peak running'] == N
+    assert ex.reserved_stack() == N * 32 * 1024
+    assert '32KiB: created=20' in ex.format_report()
+    ex.shutdown()
+
+def stealing_executor(workers):
+    return executor.StealingExecutor(workers, Nanoseconds.from_seconds(10),
+                                     Nanoseconds.from_seconds(0.001))
+
+def test_stealing_executor_local_forks():
+    ex = stealing_executor(2)
+    N = 100
+    done = threading.Semaphore(0)
+    def child():
+        done.release()
+    def parent():
+        for _ in range(N):
+            ex.execute(Task(child), 0)
+        done.release()
+    ex.execute(Task(parent), 0)
+    for _ in range(N + 1):
+        assert done.acquire(timeout=10)
+    stats = ex.stats()
+    assert stats['shared hits'] == 1
+    assert stats['local hits'] + stats['steals'] == N
+    assert stats['local hits'] > 0
+    assert stats['queue depth'] == 0
+    ex.shutdown()
+
+def test_stealing_executor_steals():
+    ex = stealing_executor(4)
+    N = 40
+    done = threading.Semaphore(0)
+    def child():
+        time.sleep(0.005)
+        done.release()
+    def parent():
+        for _ in range(N):
+            ex.execute(Task(child), 0)
+    run_all(ex, 1, parent)
+    for _ in range(N):
+        assert done.acquire(timeout=10)
+    assert ex.stats()['steals'] > 0
+    ex.shutdown()
+
+def test_stealing_executor_compensates_blocked():
+    ex = stealing_executor(2)
+    N = 50
+    # every task must be running at once for any of them to finish
+    barrier = threading.Barrier(N)
+    run_all(ex, N, lambda: barrier.wait(timeout=10))
+    stats = ex.stats()
+    assert stats['compensations'] >= N - 2
+    assert stats['workers'] >= N
+    ex.shutdown()
+
+def test_stealing_executor_reaps_idle():
+    ex = executor.StealingExecutor(4, Nanoseconds.from_seconds(0.1),
+                                   Nanoseconds.from_seconds(0.001))
+    run_all(ex, 10, lambda: time.sleep(0.01))
+    time.sleep(0.5)
+    assert ex.stats()['workers'] == 0
+    run_all(ex, 1, lambda: None)
+    ex.shutdown()
+    time.sleep(0.1)
+    assert ex.stats()['workers'] == 0
+    assert ex.stats()['idle'] == 0
@@ -18,3 +18,6 @@ def test_demo_primes():
 
 def test_demo_readers_writers():
     demo_readers_writers.run_demo()
+
+def test_demo_primes_async():
+    assert demo_primes.run_demo(asynchronous=True) == demo_primes.run_demo()
@@ -0,0 +1,54 @@
+import os
+import pytest
+
+from cpo import *
+from cpo.process import ParException
+
+def square_all(inp, out):
+    for x in inp:
+        out << x * x
+    out.close_out()
+
+def pid():
+    return os.getpid()
+
+def fail(message):
+    raise ValueError(message)
+
+def write_until_closed(out):
+    while True:
+        out << os.getpid()
+
+def test_isolated_result():
+    p = Isolated(pid)
+    assert p.run_isolated() != os.getpid()
+
+def test_isolated_channels():
+    inp, out = OneOne(), OneOne()
+    @proc
+    def write():
+        for x in range(10):
+            inp << x
+        inp.close()
+    result = []
+    @proc
+    def read():
+        result.extend(out)
+    (write | Isolated(square_all, inp, out) | read)()
+    assert result == [x * x for x in range(10)]
+
+def test_isolated_exception():
+    with pytest.raises(ParException) as info:
+        (isolated_proc(fail, 'boom') | isolated_proc(fail, 'bang'))()
+    messages = sorted(str(e) for e in info.value.exceptions)
+    assert messages == ['bang', 'boom']
+    assert 'fail' in info.value.exceptions[0].remote_traceback
+
+def test_isolated_closed():
+    out = ManyOne()
+    handle = isolated_procs(variant_args=[(out,), (out,)])(
+        write_until_closed).fork()
+    pids = {~out for _ in range(10)}
+    out.close()
+    handle.join()
+    assert os.getpid() not in pids
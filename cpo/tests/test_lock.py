@@ -1,5 +1,10 @@
 
+import time
+
+import pytest
+
 from cpo import *
+from cpo import conc
 
 def test_lock_init():
     SimpleLock()
@@ -45,3 +50,43 @@ def test_simplelock_withf():
     workers()
     assert val == 1000 * 100
 
+
+def test_fair_rlock_reentrant():
+    lock = conc.FairRLock()
+    with lock:
+        with lock:
+            assert lock.locked()
+        assert lock.locked()
+    assert not lock.locked()
+    with pytest.raises(RuntimeError):
+        lock.release()
+
+def test_fair_rlock_order():
+    lock = conc.FairRLock()
+    order = []
+    lock.acquire()
+    def worker(i):
+        with lock:
+            order.append(i)
+    handles = []
+    for i in range(5):
+        handles.append(fork_proc(worker, i))
+        time.sleep(0.05)
+    lock.release()
+    for handle in handles:
+        handle.join()
+    assert order == list(range(5))
+
+def test_fair_rlock_timeout():
+    lock = conc.FairRLock()
+    lock.acquire()
+    result = []
+    @fork_proc
+    def waiter():
+        result.append(lock.acquire(timeout=0.05))
+        result.append(lock.acquire(blocking=False))
+    waiter.join()
+    assert result == [False, False]
+    lock.release()
+    assert lock.acquire(blocking=False)
+    lock.release()
@@ -1,5 +1,6 @@
 
 import io
+import threading
 
 from cpo import *
 
@@ -24,8 +25,8 @@ def test_logger_bits():
     debug = DEBUGGER()
     f = io.StringIO()
     debug.show_cso_state(file=f)
-    assert special_string1 in f.getvalue()
-    assert not special_string2 in f.getvalue()
+    assert not special_string1 in f.getvalue()
+    assert special_string2 in f.getvalue()
 
 def test_logger_size():
     logger = Logger("my_logger", log_size=5)
@@ -40,3 +41,65 @@ def test_logger_zerosize():
         logger.log("hello")
     assert logger.num_entries == 5
 
+
+def test_logger_threads():
+    logger = Logger("my_logger", log_size=3)
+    barrier = threading.Barrier(5)
+    done = threading.Event()
+    def log(i):
+        barrier.wait()
+        for j in range(10):
+            logger.log(f'{i}.{j}')
+        barrier.wait()
+        done.wait()
+    threads_ = [threading.Thread(target=log, args=(i,)) for i in range(4)]
+    for t in threads_:
+        t.start()
+    barrier.wait()
+    barrier.wait()
+    # each live thread keeps its own last three
+    assert logger.num_entries == 12
+    events = logger.events
+    assert sorted(e.text for e in events) == \
+        sorted(f'{i}.{j}' for i in range(4) for j in range(7, 10))
+    assert [e.timestamp for e in events] == \
+        sorted(e.timestamp for e in events)
+    done.set()
+    for t in threads_:
+        t.join()
+    # and once they have exited, the last three of them all are kept
+    assert [e.text for e in logger.events] == \
+        [e.text for e in events[-3:]]
+
+def test_logger_caller():
+    logger = Logger("my_logger", log_size=5)
+    logger("called")
+    event, = logger.events
+    assert event.function == 'test_logger_caller'
+    assert event.filename == __file__
+    assert 'test_logger_caller' in str(event)
+
+def test_logger_crash(capsys):
+    logger = Logger("crash_logger", log_size=5, dump_on_crash=True)
+    def crash():
+        logger.log('before the crash')
+        raise ValueError('crash')
+    handle = fork(proc(crash))
+    handle.join()
+    assert isinstance(handle.exc, ValueError)
+    err = capsys.readouterr().err
+    assert 'crash_logger' in err and 'before the crash' in err
+
+def test_logger_retires_threads():
+    logger = Logger("my_logger", log_size=3)
+    for i in range(20):
+        t = threading.Thread(target=logger.log, args=(f'thread {i}',))
+        t.start()
+        t.join()
+    logger.log('main')
+    # the rings of exited threads are merged into one of the same size
+    assert len(logger._rings) == 1
+    assert [e.text for e in logger.events] == \
+        ['thread 17', 'thread 18', 'thread 19', 'main']
+    assert logger.num_entries == 4
+    assert logger.entries[-1].tb.function == 'test_logger_retires_threads'
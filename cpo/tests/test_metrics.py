@@ -0,0 +1,162 @@
+import threading
+import time
+import urllib.request
+
+from cpo import *
+from cpo import executor
+from cpo import metrics
+
+def sample(text, name, **labels):
+    """The value of the sample of name whose labels include labels"""
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        key, value = line.rsplit(' ', 1)
+        if key.split('{')[0] != name:
+            continue
+        if all(f'{k}="{v}"' in key for k, v in labels.items()):
+            return float(value)
+    return None
+
+def test_histogram_buckets():
+    h = metrics.Histogram('h_seconds', {'op': 'x'})
+    assert h.lines()[-1] == 'h_seconds_count{op="x"} 0'
+    for ns in (0, 1000, 1000, 3000, 1 << 20):
+        h.observe(ns)
+    counts, total = h.snapshot()
+    # buckets are only made up to the longest duration seen
+    assert len(counts) == 22
+    assert counts[0] == 1 and counts[10] == 2 and counts[12] == 1
+    assert total == 5000 + (1 << 20)
+    text = '\n'.join(h.lines())
+    assert sample(text, 'h_seconds_bucket', le=repr(1024 / 1e9)) == 3
+    assert sample(text, 'h_seconds_bucket', le='+Inf') == 5
+    assert sample(text, 'h_seconds_count') == 5
+
+def test_histogram_threads():
+    h = metrics.Histogram('h_seconds', {})
+    def observe():
+        for ns in range(1000):
+            h.observe(ns)
+    threads_ = [threading.Thread(target=observe) for _ in range(8)]
+    for t in threads_:
+        t.start()
+    for t in threads_:
+        t.join()
+    assert h.count() == 8000
+    # the shards of the threads which have exited are folded and dropped
+    assert h._shards == []
+    assert h.snapshot()[1] == 8 * sum(range(1000))
+
+def test_histogram_retires_threads():
+    h = metrics.Histogram('h_seconds', {})
+    h.observe(1 << 20)
+    observed = threading.Event()
+    done = threading.Event()
+    def observe(ns):
+        h.observe(ns)
+        observed.set()
+        done.wait()
+    alive = threading.Thread(target=observe, args=(1000,))
+    alive.start()
+    observed.wait()
+    for ns in (2000, 3000):
+        t = threading.Thread(target=h.observe, args=(ns,))
+        t.start()
+        t.join()
+    counts, total = h.snapshot()
+    assert len(h._shards) == 2
+    assert sum(counts) == 4 and total == (1 << 20) + 6000
+    done.set()
+    alive.join()
+    counts, total = h.snapshot()
+    assert len(h._shards) == 1
+    assert sum(counts) == 4 and total == (1 << 20) + 6000
+    assert counts[11] == 1 and counts[12] == 1
+
+def test_histogram_shared():
+    assert metrics.histogram('h', a='1', b='2') is \
+        metrics.histogram('h', b='2', a='1')
+
+def test_metrics_channels():
+    c = OneOne()
+    b = OneOneBuf(1)
+    handle = fork(proc(lambda: ~c))
+    try:
+        while not c.get_waiting():
+            time.sleep(0.001)
+        b << 1
+        blocked = fork(proc(lambda: b << 2))
+        while not b.get_waiting():
+            time.sleep(0.001)
+        text = metrics.render()
+        assert sample(text, 'cpo_channel_blocked_readers',
+                      channel=c.name) == 1
+        assert sample(text, 'cpo_channel_blocked_writers',
+                      channel=c.name) == 0
+        assert sample(text, 'cpo_channel_blocked_writers',
+                      channel=b.name, kind='N2NBuf') == 1
+        assert sample(text, 'cpo_channel_writes_total', channel=b.name) == 1
+        ~b
+        ~b
+        blocked.join()
+    finally:
+        c << 1
+        handle.join()
+    text = metrics.render()
+    assert sample(text, 'cpo_channel_reads_total', channel=c.name) == 1
+    assert sample(text, 'cpo_channel_writes_total', channel=c.name) == 1
+    assert sample(text, 'cpo_channel_blocked_readers', channel=c.name) == 0
+    assert '# TYPE cpo_channel_wait_seconds histogram' in text
+    assert sample(text, 'cpo_channel_wait_seconds_count',
+                  kind='OneOne', op='read') >= 1
+
+def test_metrics_semaphore():
+    s = BooleanSemaphore(False)
+    handle = fork(proc(s.acquire))
+    while not s.get_waiting():
+        time.sleep(0.001)
+    text = metrics.render()
+    assert sample(text, 'cpo_semaphore_waiting', semaphore=s.name) == 1
+    assert sample(text, 'cpo_semaphore_waits_total', semaphore=s.name) == 1
+    s.release()
+    handle.join()
+    assert s.waits.get() == 1
+    fair = CountingSemaphore(2, fair=True)
+    fair.acquire(2)
+    assert fair.try_acquire(Nanoseconds.from_seconds(0.01)) is False
+    assert fair.waits.get() == 1
+
+def test_metrics_executor():
+    pool = executor.CachedExecutor(Nanoseconds.from_seconds(1))
+    done = threading.Event()
+    class Runnable:
+        def run(self):
+            done.wait()
+    pool.execute(Runnable(), 0)
+    assert pool.activity() == {'threads': 1, 'active': 1, 'queued': 0}
+    done.set()
+    pool.shutdown()
+    samples = metrics.executor_samples(pool)
+    assert {name for name, _, _ in samples} == {
+        'cpo_executor_threads', 'cpo_executor_active_threads',
+        'cpo_executor_queue_depth'}
+    text = metrics.render()
+    assert sample(text, 'cpo_executor_threads',
+                  executor=type(executor.executor).__name__) is not None
+
+def test_metrics_endpoints():
+    d = DEBUGGER()
+    standalone = metrics.serve()
+    try:
+        for port in (d.port, standalone.sock.getsockname()[1]):
+            with urllib.request.urlopen(f'http://localhost:{port}/metrics',
+                                        timeout=10) as response:
+                assert response.status == 200
+                assert response.headers['Content-Type'] == \
+                    metrics.CONTENT_TYPE
+                body = response.read().decode('utf-8')
+            assert '# TYPE cpo_executor_threads gauge' in body
+    finally:
+        standalone.stop()
+        d.stop()
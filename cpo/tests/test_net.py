@@ -0,0 +1,102 @@
+import os
+import pytest
+import tempfile
+import threading
+import time
+
+from cpo import *
+from cpo import net
+
+@pytest.fixture
+def pool():
+    p = net.ConnectionPool()
+    yield p
+    p.close()
+
+def test_net_round_trip(pool):
+    server = NetServer(('127.0.0.1', 0), window=128)
+    inp = server.in_port('numbers')
+    out = NetOutPort(server.address, 'numbers', pool=pool)
+    for i in range(100):
+        out << i
+    out << {'a': [1, 2]}
+    assert [~inp for _ in range(100)] == list(range(100))
+    assert ~inp == {'a': [1, 2]}
+    out.close_out()
+    with pytest.raises(Closed):
+        ~inp
+    server.close()
+
+def test_net_unix_socket(pool):
+    path = os.path.join(tempfile.mkdtemp(), 'cpo.sock')
+    server = NetServer(path, codec=BytesCodec())
+    inp = server.in_port('bytes')
+    out = NetOutPort(path, 'bytes', codec=BytesCodec(), pool=pool)
+    out.write_many([b'x', b'yz'])
+    out.close_out()
+    assert list(inp) == [b'x', b'yz']
+    server.close()
+    os.unlink(path)
+
+def test_net_flow_control(pool):
+    server = NetServer(('127.0.0.1', 0), window=4)
+    inp = server.in_port('c')
+    out = NetOutPort(server.address, 'c', pool=pool)
+    for i in range(4):
+        out << i
+    # the reader has buffered a whole window, the writer must wait
+    assert not out.write_before(Nanoseconds.from_seconds(0.2), 4)
+    assert ~inp == 0
+    assert ~inp == 1
+    # reading half of the window returns its credits
+    assert out.write_before(Nanoseconds.from_seconds(2), 4)
+    assert [~inp for _ in range(3)] == [2, 3, 4]
+    server.close()
+
+def test_net_reader_close_propagates(pool):
+    server = NetServer(('127.0.0.1', 0), window=1)
+    inp = server.in_port('c')
+    out = NetOutPort(server.address, 'c', pool=pool)
+    out << 1
+    def close_soon():
+        time.sleep(0.1)
+        inp.close_in()
+    threading.Thread(target=close_soon).start()
+    with pytest.raises(Closed):
+        out << 2
+    assert not out.can_output
+    server.close()
+
+def test_net_many_writers(pool):
+    server = NetServer(('127.0.0.1', 0))
+    inp = server.in_port('c', writers=3)
+    def writer(i):
+        out = NetOutPort(server.address, 'c', pool=pool)
+        for j in range(50):
+            out << (i, j)
+        out.close_out()
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(3)]
+    for t in threads:
+        t.start()
+    values = list(inp)
+    for t in threads:
+        t.join()
+    assert sorted(values) == [(i, j) for i in range(3) for j in range(50)]
+    for i in range(3):
+        assert [j for k, j in values if k == i] == list(range(50))
+    # the writers shared one connection
+    assert len(pool.connections) == 1
+    server.close()
+
+def test_net_connection_lost(pool):
+    server = NetServer(('127.0.0.1', 0))
+    inp = server.in_port('c')
+    out = NetOutPort(server.address, 'c', pool=pool)
+    out << 1
+    pool.close()
+    assert ~inp == 1
+    with pytest.raises(Closed):
+        ~inp
+    with pytest.raises(Closed):
+        out << 2
+    server.close()
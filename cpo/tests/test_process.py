@@ -1,7 +1,9 @@
 
 import pytest
+import time
 
 from cpo import *
+from cpo.process import ParException
 
 def test_process__init():
     c = OneOne()
@@ -162,3 +164,100 @@ def test_crash():
         pass
     with pytest.raises(Crashed):
         worker()
+
+def test_par_compiled_once():
+    runs = AtomicNum(0)
+    @procs(range(3))
+    def workers(i):
+        runs.inc(1)
+    par = workers.compiled
+    handles = list(par.peer_handles)
+    for _ in range(100):
+        workers()
+    assert runs.get() == 300
+    assert workers.compiled is par
+    assert par.peer_handles == handles
+
+def test_par_flattens_nested():
+    @proc
+    def a():
+        pass
+    p = a | (a | (a | a))
+    assert len(p.compiled.procs) == 4
+    assert all(not isinstance(x, ParSyntax) for x in p.compiled.procs)
+
+def test_par_overlapping_runs():
+    c = N2NBuf(size=0)
+    @procs(range(2))
+    def wait(i):
+        ~c
+    h1 = wait.fork()
+    h2 = wait.fork()
+    c.write_many(range(4))
+    h1.join()
+    h2.join()
+
+def _blocked(handle):
+    # wait for a forked process to block
+    while not handle.is_alive():
+        time.sleep(0.001)
+    time.sleep(0.05)
+
+def test_interrupt_reader():
+    c = OneOne()
+    handle = fork(proc(lambda: ~c))
+    _blocked(handle)
+    handle.interrupt()
+    handle.join()
+    assert isinstance(handle.exc, Cancelled)
+    # the reader gave up its slot
+    handle = fork(proc(lambda: ~c))
+    c << 1
+    handle.join()
+    assert handle.exc is None
+
+def test_interrupt_writer():
+    c = OneOne()
+    handle = fork(proc(lambda: c << 1))
+    _blocked(handle)
+    handle.interrupt()
+    handle.join()
+    assert isinstance(handle.exc, Cancelled)
+    # the value was withdrawn
+    assert c.read_before(Nanoseconds.from_seconds(0.05)) is None
+
+def test_interrupt_buffered_and_semaphore():
+    c = N2NBuf(size=1)
+    s = BooleanSemaphore(available=False)
+    handles = [fork(proc(lambda: ~c)), fork(proc(s.acquire))]
+    for handle in handles:
+        _blocked(handle)
+        handle.interrupt()
+        handle.join()
+        assert isinstance(handle.exc, Cancelled)
+    # the semaphore passes on to the next waiter
+    handle = fork(proc(s.acquire))
+    s.release()
+    handle.join()
+    assert handle.exc is None
+
+def test_interrupt_par():
+    c1, c2 = OneOne(), OneOne()
+    p = proc(lambda: ~c1) | proc(lambda: ~c2)
+    handle = p.fork()
+    time.sleep(0.1)
+    handle.interrupt()
+    handle.join()
+    assert isinstance(handle.exc, Cancelled)
+
+def test_par_fail_fast():
+    c1, c2 = OneOne(), OneOne()
+    @proc
+    def fail():
+        time.sleep(0.05)
+        raise ValueError
+    p = (proc(lambda: ~c1) | proc(lambda: c2 << 1) | fail).with_fail_fast()
+    with pytest.raises(ParException) as e:
+        p()
+    assert any(isinstance(x, ValueError) for x in e.value.exceptions)
+    assert any(isinstance(x, Cancelled) for x in e.value.exceptions)
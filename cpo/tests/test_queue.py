@@ -1,7 +1,11 @@
 
+import threading
+
 import pytest
 
 from cpo import *
+from cpo import atomic
+from cpo import queue
 
 def test_queue_init():
     LockFreeQueue()
@@ -58,3 +62,73 @@ def test_lockfreequeue_for_each():
     assert q.length() == 5
     assert q.dequeue() == 0
 
+
+def test_queue_backend():
+    expected = queue.GILQueue if atomic.gil_enabled() else queue.LockedQueue
+    assert LockFreeQueue is expected
+
+@pytest.mark.parametrize('Backend', [queue.GILQueue, queue.LockedQueue])
+def test_queue_enqueue_first(Backend):
+    q = Backend()
+    q.enqueue(1)
+    q.enqueue_first(0)
+    assert q.peek() == 0
+    assert q.elements() == [0, 1]
+
+@pytest.mark.parametrize('Backend', [queue.GILQueue, queue.LockedQueue])
+def test_queue_clear(Backend):
+    q = Backend()
+    for x in range(3):
+        q.enqueue(x)
+    q.clear()
+    assert q.length() == 0
+    assert q.peek() is None
+    assert q.dequeue() is None
+
+@pytest.mark.parametrize('Backend', [queue.GILQueue, queue.LockedQueue])
+def test_queue_remove(Backend):
+    q = Backend()
+    for x in [1, 2, 1]:
+        q.enqueue(x)
+    assert q.remove(1)
+    assert q.elements() == [2, 1]
+    assert not q.remove(3)
+
+@pytest.mark.parametrize('Backend', [queue.GILQueue, queue.LockedQueue])
+def test_dequeue_ends(Backend):
+    q = Backend()
+    assert q.peek_last() is None
+    assert q.dequeue_last() is None
+    for x in range(3):
+        q.enqueue(x)
+    assert q.peek_last() == 2
+    assert q.dequeue_last() == 2
+    assert q.dequeue() == 0
+    assert q.elements() == [1]
+
+@pytest.mark.parametrize('Backend', [queue.GILQueue, queue.LockedQueue])
+def test_queue_concurrent(Backend):
+    q = Backend()
+    N, M = 8, 2000
+    got = [[] for _ in range(N)]
+    def writer(i):
+        for x in range(M):
+            q.enqueue((i, x))
+    def reader(i):
+        while len(got[i]) < M:
+            v = q.dequeue()
+            if v is not None:
+                got[i].append(v)
+    ts = [threading.Thread(target=writer, args=(i,)) for i in range(N)] + \
+         [threading.Thread(target=reader, args=(i,)) for i in range(N)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    assert sorted(sum(got, [])) == sorted((i, x) for i in range(N)
+                                          for x in range(M))
+    # each writer's values are dequeued in the order they were enqueued
+    for values in got:
+        for i in range(N):
+            mine = [x for j, x in values if j == i]
+            assert mine == sorted(mine)
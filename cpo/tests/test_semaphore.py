@@ -2,6 +2,8 @@
 import collections
 import time
 
+import pytest
+
 from cpo import *
 
 def test_semaphore_init():
@@ -59,3 +61,172 @@ def test_count_semaphore_max():
                 vl.dec(1)
     workers()
     assert len(set(res)) == 5
+
+def queue_waiters(sem, n):
+    """Fork n processes which each wait on sem in turn, and record the
+    order in which they get it"""
+    order = []
+    done = CountingSemaphore(0)
+    def worker(i):
+        sem.acquire()
+        order.append(i)
+        sem.release()
+        done.release()
+    for i in range(n):
+        fork_proc(worker, i)
+        time.sleep(0.05)
+    return order, done
+
+def test_fair_bool_semaphore_order():
+    s = BooleanSemaphore(available=False, fair=True)
+    order, done = queue_waiters(s, 5)
+    assert order == []
+    s.release()
+    for _ in range(5):
+        done.acquire()
+    assert order == list(range(5))
+    assert s.remaining() == 1
+
+def test_fair_count_semaphore_order():
+    s = CountingSemaphore(0, fair=True)
+    order, done = queue_waiters(s, 5)
+    s.release()
+    for _ in range(5):
+        done.acquire()
+    assert order == list(range(5))
+    assert s.remaining() == 1
+
+def test_fair_bool_semaphore_max():
+    sem = BooleanSemaphore(available=True, fair=True)
+    vl = AtomicNum(0)
+    @procs(range(20))
+    def workers(i):
+        for _ in range(500):
+            with sem:
+                assert vl.inc(1) == 1
+                vl.dec(1)
+    workers()
+    assert sem.remaining() == 1
+
+def test_fair_count_semaphore_max():
+    sem = CountingSemaphore(3, fair=True)
+    vl = AtomicNum(0)
+    @procs(range(20))
+    def workers(i):
+        for _ in range(500):
+            with sem:
+                assert vl.inc(1) <= 3
+                vl.dec(1)
+    workers()
+    assert sem.remaining() == 3
+
+def test_fair_semaphore_try_acquire():
+    for s in [BooleanSemaphore(available=False, fair=True),
+              CountingSemaphore(0, fair=True)]:
+        assert not s.try_acquire(Nanoseconds.from_seconds(0.1))
+        assert s.get_waiting() == []
+        s.release()
+        assert s.try_acquire(Nanoseconds.from_seconds(0.1))
+
+def test_fair_semaphore_interrupt():
+    for s in [BooleanSemaphore(available=False, fair=True),
+              CountingSemaphore(0, fair=True)]:
+        first = fork(proc(s.acquire))
+        time.sleep(0.05)
+        second = fork(proc(s.acquire))
+        time.sleep(0.05)
+        first.interrupt()
+        first.join()
+        assert isinstance(first.exc, Cancelled)
+        # the semaphore passes over the withdrawn waiter
+        s.release()
+        second.join()
+        assert second.exc is None
+        assert s.get_waiting() == []
+
+@pytest.mark.parametrize('fair', [False, True])
+def test_count_semaphore_bulk(fair):
+    s = CountingSemaphore(10, fair=fair)
+    s.acquire(4)
+    assert s.remaining() == 6
+    assert not s.try_acquire(Nanoseconds.from_seconds(0.05), 7)
+    assert s.get_waiting() == []
+    assert s.try_acquire(Nanoseconds.from_seconds(0.05), 6)
+    s.release(10)
+    assert s.remaining() == 10
+
+@pytest.mark.parametrize('fair', [False, True])
+def test_count_semaphore_bulk_release_wakes(fair):
+    s = CountingSemaphore(0, fair=fair)
+    handles = []
+    for _ in range(3):
+        handles.append(fork(proc(lambda: s.acquire(2))))
+        time.sleep(0.05)
+    s.release(4)
+    time.sleep(0.1)
+    assert [h.is_alive() for h in handles] == [False, False, True]
+    assert s.remaining() == 0
+    s.release(2)
+    handles[2].join()
+    assert s.remaining() == 0
+
+@pytest.mark.parametrize('fair', [False, True])
+def test_count_semaphore_bulk_not_starved(fair):
+    s = CountingSemaphore(4, fair=fair)
+    stop = time.time() + 1
+    got_bulk = []
+    @fork_procs(range(4))
+    def small(i):
+        while time.time() < stop:
+            with s:
+                time.sleep(0.001)
+    time.sleep(0.05)
+    @fork_proc
+    def bulk():
+        s.acquire(4)
+        got_bulk.append(time.time())
+        s.release(4)
+    bulk.join()
+    assert got_bulk[0] < stop
+    small.join()
+    assert s.remaining() == 4
+
+def test_fair_count_semaphore_try_acquire_behind_bulk():
+    s = CountingSemaphore(3, fair=True)
+    order = []
+    def bulk():
+        s.acquire(64)
+        order.append('bulk')
+        s.release(64)
+    def timed():
+        outcome = s.try_acquire(Nanoseconds.from_seconds(10), 1)
+        order.append(outcome)
+        s.release()
+    first = fork(proc(bulk))
+    while not s.get_waiting():
+        time.sleep(0.001)
+    # a timed acquire queues behind the bulk waiter at the head
+    assert not s.try_acquire(Nanoseconds.from_seconds(0.05), 1)
+    assert s.remaining() == 3
+    assert len(s.get_waiting()) == 1
+    second = fork(proc(timed))
+    while len(s.get_waiting()) < 2:
+        time.sleep(0.001)
+    s.release(61)
+    first.join()
+    second.join()
+    assert order == ['bulk', True]
+    assert s.remaining() == 64
+    assert s.get_waiting() == []
+
+@pytest.mark.parametrize('fair', [False, True])
+def test_count_semaphore_cancel_bulk(fair):
+    s = CountingSemaphore(0, fair=fair)
+    handle = fork(proc(lambda: s.acquire(4)))
+    while not s.get_waiting():
+        time.sleep(0.001)
+    s.cancel()
+    handle.join()
+    assert handle.exc is None
+    assert s.get_waiting() == []
+    assert s.cancelled()
@@ -0,0 +1,91 @@
+import multiprocessing
+import pytest
+import sys
+
+from cpo import *
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 8),
+                                reason='shared memory requires python 3.8+')
+
+def write_blobs(c, n, size):
+    for i in range(n):
+        c << bytes([i % 256]) * size
+    c.close_out()
+
+def echo_sum(inp, out):
+    while True:
+        try:
+            with inp.view() as view:
+                out << sum(view)
+        except Closed:
+            break
+    out.close_out()
+
+def test_shm_oneone():
+    c = ShmOneOne(slots=2, slot_size=64)
+    c << b'hello'
+    c << {'a': 1}
+    assert ~c == b'hello'
+    assert ~c == {'a': 1}
+    assert c.read_before(Nanoseconds.from_seconds(0.01)) is None
+    with pytest.raises(ValueError):
+        c << b'x' * 65
+    c.close()
+    with pytest.raises(Closed):
+        ~c
+    with pytest.raises(Closed):
+        c << b'x'
+
+def test_shm_ring_order():
+    c = ShmOneOne(slots=3, slot_size=8)
+    for i in range(10):
+        c << bytes([i])
+        assert ~c == bytes([i])
+    # values read are copied out, which frees their slots
+    assert c.write_many([b'1', b'2', b'3']) == 3
+    with c.view() as view:
+        assert isinstance(view, memoryview)
+        assert bytes(view) == b'1'
+        # a viewed slot is held until the block exits
+        assert not c.write_before(Nanoseconds.from_seconds(0.01), b'4')
+    assert c.write_before(Nanoseconds.from_seconds(0.01), b'4')
+    assert c.read_many(5) == [b'2', b'3', b'4']
+    with c.view(Nanoseconds.from_seconds(0.01)) as view:
+        assert view is None
+
+def test_shm_between_processes():
+    ctx = multiprocessing.get_context('spawn')
+    c = ShmOneOne(slots=4, slot_size=1 << 16)
+    writer = ctx.Process(target=write_blobs, args=(c, 50, 1 << 16))
+    writer.start()
+    received = [blob[:1] for blob in c]
+    writer.join()
+    assert received == [bytes([i]) for i in range(50)]
+
+def test_shm_isolated():
+    inp = ShmOneOne(slots=2, slot_size=1024)
+    out = OneOne()
+    @proc
+    def write():
+        for i in range(20):
+            inp << bytes([i]) * 100
+        inp.close_out()
+    sums = []
+    @proc
+    def read():
+        sums.extend(out)
+    (write | Isolated(echo_sum, inp, out) | read)()
+    assert sums == [i * 100 for i in range(20)]
+
+def test_shm_close_wakes_readers():
+    c = ShmN2NBuf(slots=2, slot_size=8)
+    closed = AtomicNum(0)
+    @fork_procs(range(3))
+    def readers(i):
+        try:
+            ~c
+        except Closed:
+            closed.inc(1)
+    c.close()
+    readers.join()
+    assert closed.get() == 3
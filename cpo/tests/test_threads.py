@@ -0,0 +1,55 @@
+import threading
+import time
+
+from cpo import *
+from cpo import threads
+
+def test_parker_reused():
+    current = threading.current_thread()
+    parker = threads.get_parker(current)
+    assert threads.get_parker(current) is parker
+    threads.unpark(current)
+    threads.park_current_thread()
+    assert threads.get_parker(current) is parker
+
+def test_unpark_before_park():
+    # the permit is not lost
+    threads.unpark(threading.current_thread())
+    start = time.time()
+    assert threads.park_current_thread(Nanoseconds.from_seconds(1))
+    assert time.time() - start < 0.5
+
+def test_permits_do_not_accumulate():
+    current = threading.current_thread()
+    threads.park_current_thread(Nanoseconds(0))  # drop any stale permit
+    threads.unpark(current)
+    threads.unpark(current)
+    assert threads.park_current_thread(Nanoseconds.from_seconds(0.1))
+    assert not threads.park_current_thread(Nanoseconds.from_seconds(0.1))
+
+def test_park_timeout():
+    threads.park_current_thread(Nanoseconds(0))  # drop any stale permit
+    start = time.time()
+    assert not threads.park_current_thread(Nanoseconds.from_seconds(0.1))
+    assert time.time() - start >= 0.09
+
+def test_unpark_other():
+    parked = threading.Event()
+    done = threading.Event()
+    def park():
+        parked.set()
+        threads.park_current_thread()
+        done.set()
+    t = threading.Thread(target=park, daemon=True)
+    t.start()
+    parked.wait()
+    time.sleep(0.1)
+    assert not done.is_set()
+    threads.unpark(t)
+    assert done.wait(timeout=1)
+
+def test_unpark_ident():
+    current = threading.current_thread()
+    threads.get_parker(current)
+    threads.unpark_ident(current.ident)
+    assert threads.park_current_thread(Nanoseconds.from_seconds(0.1))
@@ -0,0 +1,75 @@
+import threading
+import time
+
+from cpo import *
+from cpo import threads
+from cpo.timer import TimerService
+
+def test_timer_fires_in_order():
+    service = TimerService('test-timer')
+    fired = []
+    done = threading.Event()
+    now = Nanoseconds.from_seconds(time.time())
+    for i in [3, 1, 2]:
+        service.schedule(now + Nanoseconds.from_seconds(i * 0.01),
+                         lambda i=i: fired.append(i))
+    service.schedule(now + Nanoseconds.from_seconds(0.05), done.set)
+    assert done.wait(5)
+    assert fired == [1, 2, 3]
+    assert service.pending() == 0
+
+def test_timer_cancel():
+    service = TimerService('test-timer')
+    fired = []
+    timeouts = [service.after(Nanoseconds.from_seconds(10),
+                              lambda: fired.append(1))
+                for _ in range(1000)]
+    assert service.pending() == 1000
+    assert all(t.cancel() for t in timeouts)
+    assert not timeouts[0].cancel()
+    assert service.pending() == 0
+    # cancelled timeouts don't pile up
+    assert len(service._heap) < 100
+    assert fired == []
+
+def test_timed_park():
+    orig = threads.timer_parks
+    try:
+        for threads.timer_parks in (False, True):
+            start = time.time()
+            left = threads.park_current_thread_until_elapsed_or(
+                Nanoseconds.from_seconds(0.05), lambda: False)
+            assert left <= 0
+            assert time.time() - start >= 0.05
+            assert alt(InEvent(OneOne(), lambda x: 'read'),
+                       After(Nanoseconds.from_seconds(0.01),
+                             lambda: 'timeout')) == 'timeout'
+    finally:
+        threads.timer_parks = orig
+
+def test_ticker():
+    ticker = Ticker(Nanoseconds.from_seconds(0.01), count=5)
+    ticks = list(ticker)
+    assert len(ticks) == 5
+    assert ticks == sorted(ticks)
+
+def test_ticker_counts_delivered_ticks():
+    ticker = Ticker(Nanoseconds.from_seconds(0.005), count=3)
+    # the reader is away for several periods, the ticks meanwhile are
+    # dropped rather than counted
+    time.sleep(0.05)
+    ticks = list(ticker)
+    assert len(ticks) == 3
+
+def test_ticker_close():
+    ticker = Ticker(Nanoseconds.from_seconds(0.001))
+    ~ticker
+    ticker.close()
+    time.sleep(0.01)
+    assert not ticker.timeout.cancel()
+
+def test_after_in_alt():
+    c = OneOne()
+    timeout = after(Nanoseconds.from_seconds(0.02))
+    assert alt(InEvent(c, lambda x: 'read'),
+               InEvent(timeout, lambda t: 'timeout')) == 'timeout'
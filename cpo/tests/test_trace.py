@@ -0,0 +1,142 @@
+import io
+import json
+import os
+import threading
+import time
+
+from cpo import *
+from cpo import trace
+
+def test_trace_records(tmp_path):
+    path = str(tmp_path / 'run')
+    with TraceSink(path) as sink:
+        def record(i):
+            for j in range(100):
+                sink.record(trace.LOG, f'{i}.{j % 10}')
+        threads_ = [threading.Thread(target=record, args=(i,), name=f't{i}')
+                    for i in range(4)]
+        for t in threads_:
+            t.start()
+        for t in threads_:
+            t.join()
+    records = list(trace.read_trace(path))
+    logged = [r for r in records if r.event == trace.LOG]
+    assert len(logged) == 400
+    assert sorted({r.text for r in logged}) == \
+        sorted(f'{i}.{j}' for i in range(4) for j in range(10))
+    assert [r.timestamp for r in records] == \
+        sorted(r.timestamp for r in records)
+    names = {r.text for r in records if r.event == trace.NAME}
+    assert names == {'t0', 't1', 't2', 't3'}
+    # strings are written once each
+    segment, = trace.segment_paths(path)
+    assert len(trace.read_strings(segment)) == 1 + 40 + 4
+
+def test_trace_rotates(tmp_path):
+    path = str(tmp_path / 'run')
+    sink = TraceSink(path, segment_records=10, max_segments=3)
+    for i in range(100):
+        sink.record(trace.LOG, str(i))
+    sink.close()
+    # each segment names the thread once, so holds nine records logged
+    assert [os.path.basename(p) for p in trace.segment_paths(path)] == \
+        ['run.000009', 'run.000010', 'run.000011']
+    texts = [r.text for r in trace.read_trace(path) if r.event == trace.LOG]
+    assert texts == [str(i) for i in range(81, 100)]
+    assert sum(r.event == trace.NAME for r in trace.read_trace(path)) == 3
+    # the strings of a segment are deleted with it
+    assert sorted(os.listdir(str(tmp_path))) == \
+        ['run.000009', 'run.000009.strings', 'run.000010',
+         'run.000010.strings', 'run.000011', 'run.000011.strings']
+    assert len(trace.read_strings(str(tmp_path / 'run.000011'))) == 1 + 2
+    # a new trace replaces the old one
+    TraceSink(path).close()
+    assert len(trace.segment_paths(path)) == 1
+
+def test_trace_rotates_names(tmp_path):
+    path = str(tmp_path / 'run')
+    sink = TraceSink(path, segment_records=4, max_segments=2)
+    def record(n):
+        for i in range(n):
+            sink.record(trace.LOG, str(i))
+    for name, n in (('first', 7), ('second', 9)):
+        t = threading.Thread(target=record, args=(n,), name=name)
+        t.start()
+        t.join()
+    sink.close()
+    out = io.StringIO()
+    trace.to_text(path, out)
+    lines = out.getvalue().splitlines()
+    assert lines
+    assert all('second#' in line for line in lines)
+    events = trace.chrome_events(path)
+    assert {e['args']['name'] for e in events if e['ph'] == 'M'} == \
+        {'second'}
+
+def test_trace_logger(tmp_path):
+    path = str(tmp_path / 'log')
+    with TraceSink(path) as sink:
+        logger = Logger('traced', log_size=2, sink=sink)
+        for i in range(10):
+            logger.log(f'event {i}')
+        logger.log('masked out', bits=0)
+    out = io.StringIO()
+    trace.to_text(path, out)
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 10
+    assert lines[0].endswith('LOG event 0')
+    assert threading.current_thread().name in lines[0]
+
+def test_trace_channels(tmp_path):
+    path = str(tmp_path / 'chans')
+    c = OneOne('traced')
+    b = OneOneBuf(4, 'buffered')
+    sink = TraceSink(path)
+    trace.trace_channels(sink)
+    try:
+        def writer():
+            for i in range(5):
+                c << i
+                b << i
+        def reader():
+            for i in range(5):
+                ~c
+                ~b
+        (Simple(writer, 'writer') | Simple(reader, 'reader'))()
+    finally:
+        trace.trace_channels(None)
+        sink.close()
+    events = trace.chrome_events(path)
+    json.dumps(events)
+    slices = [e for e in events if e['ph'] == 'B']
+    assert sum(e['name'] == 'traced <<' for e in slices) == 5
+    assert sum(e['name'] == '~traced' for e in slices) == 5
+    assert sum(e['name'] == 'buffered <<' for e in slices) == 5
+    assert len([e for e in events if e['ph'] == 'E']) == 20
+    names = {e['args']['name'] for e in events if e['ph'] == 'M'}
+    assert {'writer', 'reader'} <= names
+    out = io.StringIO()
+    trace.to_chrome(path, out)
+    assert len(json.loads(out.getvalue())['traceEvents']) == len(events)
+
+def test_trace_ends_failed_reads(tmp_path):
+    path = str(tmp_path / 'closed')
+    b = OneOneBuf(1, 'closed')
+    def close():
+        while not b.get_waiting():
+            time.sleep(0.001)
+        b.close()
+    with TraceSink(path) as sink:
+        trace.trace_channels(sink)
+        closer = threading.Thread(target=close, name='closer')
+        closer.start()
+        try:
+            try:
+                ~b
+            except Closed:
+                pass
+        finally:
+            trace.trace_channels(None)
+            closer.join()
+    events = trace.chrome_events(path)
+    assert [e['ph'] for e in events] == ['M', 'B', 'E']
@@ -1,8 +1,12 @@
 
+import mmap
 import threading
 import time
-from typing import Callable, Optional, Sequence
+from typing import Callable, List, MutableMapping, Optional, Sequence
+import weakref
 
+from . import config
+from . import timer
 from . import util
 from .util import Nanoseconds
 
@@ -19,49 +23,213 @@ def get_thread_identity(thread: Optional[threading.Thread]):
     status = daemon + alive
     return f'{thread.getName()}#{status}#{thread.ident}'
 
-# python doesnt allow us to park threads, so this is a hack for now
-# the use of concurrency primitives will mean that the parking and
-# unparking is handled at the kernel level and so is slow.
-# otherwise we would def park(blocker: Optional[Thread])
-
-parking_lot = {}
-
-def park_current_thread(timeout: Optional[Nanoseconds] = None):
-    timeout_sec = None if timeout is None else timeout.to_seconds()
-    ident = threading.get_ident()
-    assert not ident in parking_lot
-    parking_lot[ident] = threading.Event()
-    parking_lot[ident].wait(timeout=timeout_sec)
-    parking_lot[ident].clear()
-    del parking_lot[ident]  # TODO remove this safety check and the assert above
-
+# python doesnt allow us to park threads, so we simulate LockSupport with a
+# long-lived Parker per thread. The permit is a plain lock which is held
+# while no permit is available, so park and unpark are a single acquire or
+# release of the lock rather than an Event (and its Condition) per park.
+# As with LockSupport, an unpark which arrives before the matching park is
+# not lost, and a parked thread may return spuriously so callers should
+# always recheck their condition.
+
+class Parker:
+
+    def __init__(self, thread: threading.Thread):
+        self.thread = thread
+        self._permit = threading.Lock()
+        self._permit.acquire()
+        # the cancellation token of the process the thread is running, if any
+        self.token: Optional[CancelToken] = None
+
+    def park(self, timeout: Optional[Nanoseconds] = None) -> bool:
+        """Consume the permit, waiting for up to timeout for it to be made
+        available. Returns whether the permit was consumed."""
+        if timeout is None:
+            return self._permit.acquire()
+        return self._permit.acquire(timeout=max(timeout.to_seconds(), 0))
+
+    def unpark(self) -> None:
+        """Make the permit available. Permits do not accumulate."""
+        try:
+            self._permit.release()
+        except RuntimeError:
+            pass  # the permit was already available
+
+    def has_permit(self) -> bool:
+        return not self._permit.locked()
+
+    def __repr__(self) -> str:
+        return f'Parker({get_thread_identity(self.thread)})'
+
+# only used to find parkers by thread ident, threads themselves hold their
+# parker so the entry goes once the thread has gone
+parkers: MutableMapping[int, Parker] = weakref.WeakValueDictionary()
+_parker_lock = threading.Lock()
+
+def get_parker(thread: threading.Thread) -> Parker:
+    try:
+        return thread._cpo_parker  # type: ignore
+    except AttributeError:
+        pass
+    with _parker_lock:
+        parker = thread.__dict__.get('_cpo_parker')
+        if parker is None:
+            parker = Parker(thread)
+            thread._cpo_parker = parker  # type: ignore
+            if thread.ident is not None:
+                parkers[thread.ident] = parker
+        return parker
+
+def park_current_thread(timeout: Optional[Nanoseconds] = None) -> bool:
+    """Park the current thread for up to timeout. Raises Cancelled, rather
+    than parking or once unparked, if the process it is running has been
+    cancelled."""
+    parker = get_parker(threading.current_thread())
+    token = parker.token
+    if token is None:
+        return parker.park(timeout)
+    token.check()
+    result = parker.park(timeout)
+    token.check()
+    return result
 
 def unpark(blocker: Optional[threading.Thread]):
     if blocker is None:
         return
-    unpark_ident(blocker.ident)
+    get_parker(blocker).unpark()
 
 def unpark_ident(ident: Optional[int]):
     if ident is None:
         return
-    pl = parking_lot.get(ident)
-    if pl is not None:
-        pl.set()
+    parker = parkers.get(ident)
+    if parker is not None:
+        parker.unpark()
+
+# whether timed parks schedule their unpark at the deadline with the timer
+# service and park without a timeout, rather than each park waiting with a
+# timeout of its own. Under CPython the timeouts are the quicker, as the
+# single timer thread has to wake every waiter under the GIL.
+timer_parks = config.get('timerPARKS', False)
 
 def park_current_thread_until_deadline_or(deadline: Nanoseconds, condition: Callable[[],bool]) -> Nanoseconds:
+    """Park until condition holds or deadline has passed, returning the time
+    left"""
     left = deadline - util.nano_time()
-    while left > 0 and not condition():
-        park_current_thread(timeout=left)
-        left = deadline - util.nano_time()
+    if not timer_parks:
+        while left > 0 and not condition():
+            park_current_thread(timeout=left)
+            left = deadline - util.nano_time()
+        return left
+    if left <= 0 or condition():
+        return left
+    timeout = timer.timers.schedule(
+        deadline, get_parker(threading.current_thread()).unpark)
+    try:
+        while left > 0 and not condition():
+            park_current_thread()
+            left = deadline - util.nano_time()
+    finally:
+        timeout.cancel()
     return left
 
 def park_current_thread_until_elapsed_or(timeout: Nanoseconds, condition: Callable[[],bool]) -> Nanoseconds:
-    deadline = timeout + util.nano_time()
-    left = timeout
-    while left > 0 and not condition():
-        park_current_thread(timeout=left)
-        left = deadline - util.nano_time()
-    return left
+    return park_current_thread_until_deadline_or(
+        timeout + util.nano_time(), condition)
+
+# python can't interrupt a thread either, so cancellation is cooperative. The
+# handle of each process holds a CancelToken, which is installed in the
+# parker of the thread running the process. Blocking operations check the
+# token each time they wake and raise Cancelled once it has been cancelled,
+# and cancelling unparks the thread so that a parked process wakes to see it.
+# Waits which are not on the parker register a callback to be woken by.
+
+class CancelToken:
+
+    def __init__(self, name: str = '') -> None:
+        self.name = name
+        self._cancelled = False
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.parker: Optional[Parker] = None
+
+    def cancel(self) -> None:
+        """Cancel the process, waking it if it is blocked"""
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks = list(self._callbacks)
+        parker = self.parker
+        if parker is not None:
+            parker.unpark()
+        for fn in callbacks:
+            fn()
+
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def check(self) -> None:
+        """Raise Cancelled if the token has been cancelled"""
+        if self._cancelled:
+            raise util.Cancelled(self.name)
+
+    def add_callback(self, fn: Callable[[], None]) -> bool:
+        """Call fn when the token is cancelled. Returns False, without
+        calling fn, if it has already been cancelled."""
+        with self._lock:
+            if self._cancelled:
+                return False
+            self._callbacks.append(fn)
+            return True
+
+    def remove_callback(self, fn: Callable[[], None]) -> None:
+        with self._lock:
+            try:
+                self._callbacks.remove(fn)
+            except ValueError:
+                pass
+
+    def reset(self) -> None:
+        """Prepare the token of a finished process to be used again"""
+        with self._lock:
+            self._cancelled = False
+            self._callbacks.clear()
+
+    def __repr__(self) -> str:
+        can = '[cancelled]' if self._cancelled else ''
+        return f'CancelToken({self.name}){can}'
+
+def current_token() -> Optional[CancelToken]:
+    """The cancellation token of the process the current thread is running"""
+    return get_parker(threading.current_thread()).token
+
+def process_threads() -> List[threading.Thread]:
+    """The live threads which are running a process"""
+    return [parker.thread for parker in list(parkers.values())
+            if parker.token is not None and parker.thread.is_alive()]
+
+def install_token(token: Optional[CancelToken]) -> Optional[CancelToken]:
+    """Make token the cancellation token of the current thread, returning
+    the token it replaces so that it can be restored"""
+    parker = get_parker(threading.current_thread())
+    previous, parker.token = parker.token, token
+    if token is not None:
+        token.parker = parker
+    return previous
+
+# threading.stack_size is process wide and is read as each thread starts,
+# not as it is constructed, so threads must be started inside StackSize.
+# The lock stops threads of different sizes being started at once.
+_stack_size_lock = threading.RLock()
+MIN_STACK_SIZE = 32 * 1024
+PAGE_SIZE = mmap.PAGESIZE
+
+def round_stack_size(stack_size: Optional[int]) -> int:
+    """The smallest stack size threading accepts which is at least
+    stack_size, or 0 for the platform default"""
+    if not stack_size:
+        return 0
+    stack_size = max(stack_size, MIN_STACK_SIZE)
+    return -(-stack_size // PAGE_SIZE) * PAGE_SIZE
 
 class StackSize:
 
@@ -70,11 +238,15 @@ class StackSize:
         self.prev_size = None
 
     def __enter__(self):
+        _stack_size_lock.acquire()
         self.prev_size = threading.stack_size()
         if self.stack_size is not None:
-            threading.stack_size(self.stack_size)
+            threading.stack_size(round_stack_size(self.stack_size))
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.prev_size is not None:
-            threading.stack_size(self.prev_size)
-            self.prev_size = None
+        try:
+            if self.prev_size is not None:
+                threading.stack_size(self.prev_size)
+                self.prev_size = None
+        finally:
+            _stack_size_lock.release()
@@ -0,0 +1,136 @@
+import heapq
+import itertools
+import os
+import threading
+from typing import Callable, List, Optional, Tuple
+
+from . import util
+from .util import Nanoseconds
+
+# Timed operations don't each wait with a timeout of their own. They park
+# without one, having scheduled their own unpark with the shared timer
+# service, whose single thread sleeps until the earliest deadline and then
+# fires every timeout which has expired in one batch. An operation which
+# completes in time cancels its timeout, which only marks it: it stays in
+# the heap until it would have expired, unless cancelled timeouts come to
+# dominate the heap, which is then rebuilt without them.
+
+class Timeout:
+    """A call of fn at deadline, which may be cancelled until it is made"""
+
+    __slots__ = ('deadline', 'fn', 'service', 'done')
+
+    def __init__(self, deadline: Nanoseconds, fn: Callable[[], None],
+                 service: 'TimerService') -> None:
+        self.deadline = deadline
+        self.fn = fn
+        self.service = service
+        # set once the timeout has either fired or been cancelled
+        self.done = False
+
+    def cancel(self) -> bool:
+        """Cancel the timeout. Returns False if it has already fired."""
+        return self.service._cancel(self)
+
+    def __repr__(self) -> str:
+        return f'Timeout({self.deadline}, {self.fn})'
+
+
+class TimerService:
+    """Owns the deadlines of timed operations, firing them from a daemon
+    thread which is started on first use"""
+
+    COMPACT_MIN = 64
+
+    def __init__(self, name: str = 'cpo-timer') -> None:
+        self.name = name
+        self._heap: List[Tuple[Nanoseconds, int, Timeout]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition(threading.Lock())
+        self._cancelled = 0
+        self._thread: Optional[threading.Thread] = None
+        self.fired = 0
+
+    def _after_fork(self) -> None:
+        """The timer thread does not survive a fork, a child starts its own"""
+        self._cond = threading.Condition(threading.Lock())
+        self._thread = None
+
+    def schedule(self, deadline: Nanoseconds,
+                 fn: Callable[[], None]) -> Timeout:
+        """Call fn, from the timer thread, once deadline has passed. fn
+        should be quick and must not block, as unpark is."""
+        timeout = Timeout(deadline, fn, self)
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name=self.name, daemon=True)
+                self._thread.start()
+            heapq.heappush(self._heap, (deadline, next(self._seq), timeout))
+            # the timer thread only needs waking if it would sleep past us
+            if self._heap[0][2] is timeout:
+                self._cond.notify()
+        return timeout
+
+    def after(self, ns: Nanoseconds, fn: Callable[[], None]) -> Timeout:
+        """Call fn once ns have elapsed"""
+        return self.schedule(util.nano_time() + ns, fn)
+
+    def _cancel(self, timeout: Timeout) -> bool:
+        with self._cond:
+            if timeout.done:
+                return False
+            timeout.done = True
+            self._cancelled += 1
+            if self._cancelled > self.COMPACT_MIN and \
+                    2 * self._cancelled > len(self._heap):
+                self._heap = [e for e in self._heap if not e[2].done]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+        return True
+
+    def pending(self) -> int:
+        """The number of timeouts which have neither fired nor been
+        cancelled"""
+        with self._cond:
+            return len(self._heap) - self._cancelled
+
+    def _expired(self) -> List[Timeout]:
+        """Wait for, and remove, the timeouts which have expired"""
+        with self._cond:
+            while True:
+                # compaction may have replaced the heap while we waited
+                heap = self._heap
+                now = util.nano_time()
+                expired = []
+                while heap and heap[0][0] <= now:
+                    timeout = heapq.heappop(heap)[2]
+                    if timeout.done:
+                        self._cancelled -= 1
+                    else:
+                        timeout.done = True
+                        expired.append(timeout)
+                if expired:
+                    return expired
+                if heap:
+                    self._cond.wait((heap[0][0] - now).to_seconds())
+                else:
+                    self._cond.wait()
+
+    def _run(self) -> None:
+        while True:
+            expired = self._expired()
+            self.fired += len(expired)
+            for timeout in expired:
+                try:
+                    timeout.fn()
+                except Exception as e:
+                    util.synced_print(f'Timeout {timeout} failed with {e}')
+
+    def __str__(self) -> str:
+        return f'TimerService({self.name}, pending={self.pending()}, ' \
+               f'fired={self.fired})'
+
+# shared by every timed operation
+timers = TimerService()
+os.register_at_fork(after_in_child=timers._after_fork)
@@ -0,0 +1,348 @@
+
+import glob
+import heapq
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from time import time_ns
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, \
+    Tuple
+
+# A trace is a series of segment files of fixed size records, each the
+# time, the thread, the kind of event and the id of a string, such as the
+# text logged or the name of a channel. The strings are interned per
+# segment, each is appended once to the segment's string file. A record's
+# slot is claimed by taking the next of a count, which is atomic in CPython,
+# so threads write their records into the mapped segment without taking a
+# lock. Only interning a new string or moving on to the next segment takes
+# the lock.
+#
+# Segments are named path.000000, path.000001 and so on, with their strings
+# in path.000000.strings and so on. Once there are more than max_segments
+# the oldest is deleted along with its strings, so a segment holds at most
+# as many strings as records, and a long run keeps no more than
+# max_segments of either. For the same reason each segment names the threads
+# which write to it.
+
+MAGIC = b'CPOTRACE'
+VERSION = 2
+# magic, version, record size, pid, segment, records
+HEADER = struct.Struct('<8sHHIIQ4x')
+# time (ns), thread ident, event, string id
+RECORD = struct.Struct('<QQII')
+STRING = struct.Struct('<II')
+
+# events
+NAME = 1          # the thread's name is the string
+LOG = 2           # the string was logged
+WRITE = 3         # a write to the channel named by the string began
+WRITE_END = 4
+READ = 5          # a read from the channel began
+READ_END = 6
+
+EVENTS = {NAME: 'NAME', LOG: 'LOG', WRITE: 'WRITE', WRITE_END: 'WRITE_END',
+          READ: 'READ', READ_END: 'READ_END'}
+
+class TraceSink:
+    """Appends records to a trace at path, in segments of segment_records
+    records, keeping the last max_segments of them (at least two), or all
+    if 0"""
+
+    def __init__(self, path: str, segment_records: int = 1 << 20,
+                 max_segments: int = 8) -> None:
+        assert segment_records > 0 and max_segments >= 0
+        self.path = path
+        self.capacity = segment_records
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        # the current segment and the one before, which may still be being
+        # written to by threads which claimed its last slots, each with its
+        # string table and the file it is written to
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._tables: Dict[int, Tuple[Dict[str, int], BinaryIO]] = {}
+        self._current: Tuple[int, Optional[mmap.mmap], Dict[str, int]] = \
+            (-1, None, {})
+        # the oldest segment which has not been deleted
+        self._oldest = 0
+        self._local = threading.local()
+        self.closed = False
+        # records lost to the segment they were claimed in being closed
+        self.dropped = 0
+        for old in segment_paths(path):
+            _remove(old)
+        self._segment(0)
+
+    def _segment_path(self, seg: int) -> str:
+        return f'{self.path}.{seg:06d}'
+
+    def _map(self, seg: int) -> mmap.mmap:
+        size = HEADER.size + self.capacity * RECORD.size
+        with open(self._segment_path(seg), 'w+b') as f:
+            f.truncate(size)
+            mm = mmap.mmap(f.fileno(), size)
+        HEADER.pack_into(mm, 0, MAGIC, VERSION, RECORD.size, os.getpid(),
+                         seg, self.capacity)
+        self._tables[seg] = ({}, open(_strings_path(self._segment_path(seg)),
+                                      'wb'))
+        return mm
+
+    def _unmap(self, seg: int) -> None:
+        self._maps.pop(seg).close()
+        self._tables.pop(seg)[1].close()
+
+    def _segment(self, seg: int) -> Optional[Tuple[mmap.mmap,
+                                                   Dict[str, int]]]:
+        """The map and string table of segment seg, made along with any
+        before it if need be. None if it has already been closed."""
+        with self._lock:
+            mm = self._maps.get(seg)
+            if mm is not None:
+                return mm, self._tables[seg][0]
+            if self.closed:
+                return None
+            current = self._current[0]
+            if seg < current:
+                return None
+            for s in range(current + 1, seg + 1):
+                self._maps[s] = self._map(s)
+            self._current = (seg, self._maps[seg], self._tables[seg][0])
+            for s in [s for s in self._maps if s < seg - 1]:
+                self._unmap(s)
+            if self.max_segments > 0:
+                # the segment before the current one is kept while it is
+                # still mapped
+                keep = max(self.max_segments, 2)
+                while self._oldest <= seg - keep:
+                    _remove(self._segment_path(self._oldest))
+                    self._oldest += 1
+            return self._current[1], self._current[2]
+
+    def _intern(self, seg: int, text: str) -> int:
+        """The id of text in segment seg's strings, 0 if the segment has
+        been closed"""
+        with self._lock:
+            table = self._tables.get(seg)
+            if table is None:
+                return 0
+            ids, strings = table
+            sid = ids.get(text)
+            if sid is None:
+                sid = len(ids) + 1
+                data = text.encode('utf-8', 'replace')
+                strings.write(STRING.pack(sid, len(data)) + data)
+                strings.flush()
+                ids[text] = sid
+            return sid
+
+    def _write(self, event: int, text: str) -> int:
+        """Append a record, returning the segment it is in, -1 if it was
+        dropped"""
+        seg, slot = divmod(next(self._seq), self.capacity)
+        current, mm, ids = self._current
+        if seg != current:
+            got = self._segment(seg)
+            if got is None:
+                self.dropped += 1
+                return -1
+            mm, ids = got
+        # the string is interned in the segment the record is in, so that
+        # the two are deleted together
+        sid = ids.get(text) or self._intern(seg, text)
+        try:
+            RECORD.pack_into(mm, HEADER.size + slot * RECORD.size,
+                             time_ns(), threading.get_ident(), event, sid)
+        except ValueError:
+            # the segment was closed under us
+            self.dropped += 1
+            return -1
+        return seg
+
+    def record(self, event: int, text: str) -> None:
+        """Append a record of event, naming the thread first if it has not
+        been named in the current segment, or has been renamed, as process
+        threads are. Each segment names the threads which write to it, so
+        that they are still named once the segments before it are gone."""
+        if self.closed:
+            return
+        name = threading.current_thread().name
+        local = self._local
+        if getattr(local, 'name', None) != name or \
+                getattr(local, 'segment', -1) != self._current[0]:
+            local.name = name
+            local.segment = self._write(NAME, name)
+        if self._write(event, text) != local.segment:
+            # the record went into the next segment, name the thread there
+            # too
+            local.segment = self._write(NAME, name)
+
+    def flush(self) -> None:
+        with self._lock:
+            for mm in self._maps.values():
+                mm.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            for mm in self._maps.values():
+                mm.flush()
+            for seg in list(self._maps):
+                self._unmap(seg)
+            self._current = (-1, None, {})
+
+    def __enter__(self) -> 'TraceSink':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def __str__(self) -> str:
+        return f'TraceSink({self.path}, segment={self._current[0]}, ' \
+               f'strings={len(self._current[2])}, dropped={self.dropped})'
+
+# the sink channels trace their reads and writes to, if any
+sink: Optional[TraceSink] = None
+
+def trace_channels(to: Optional[TraceSink]) -> None:
+    """Trace every channel read and write to the sink to, or stop if None"""
+    global sink
+    sink = to
+
+# reading traces
+
+class TraceRecord(NamedTuple):
+    timestamp: int
+    pid: int
+    thread: int
+    event: int
+    text: str
+
+def _strings_path(segment: str) -> str:
+    return f'{segment}.strings'
+
+def _remove(segment: str) -> None:
+    """Delete a segment file along with its strings"""
+    os.remove(segment)
+    try:
+        os.remove(_strings_path(segment))
+    except FileNotFoundError:
+        pass
+
+def segment_paths(path: str) -> List[str]:
+    """The segment files of the trace at path, oldest first"""
+    return sorted(p for p in glob.glob(glob.escape(path) + '.*')
+                  if p[len(path) + 1:].isdigit())
+
+def read_strings(segment: str) -> Dict[int, str]:
+    """The strings of the segment file segment, by id"""
+    strings = {0: ''}
+    try:
+        with open(_strings_path(segment), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return strings
+    i = 0
+    while i + STRING.size <= len(data):
+        sid, n = STRING.unpack_from(data, i)
+        i += STRING.size
+        strings[sid] = data[i:i + n].decode('utf-8', 'replace')
+        i += n
+    return strings
+
+def _read_segment(path: str) -> List[TraceRecord]:
+    strings = read_strings(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, size, pid, _, capacity = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION or size != RECORD.size:
+        raise ValueError(f'{path} is not a CPO trace segment')
+    records = []
+    # slots which were claimed but never written are left zero
+    for t, thread, event, sid in RECORD.iter_unpack(
+            data[HEADER.size:HEADER.size + capacity * RECORD.size]):
+        if t:
+            records.append(TraceRecord(t, pid, thread, event,
+                                       strings.get(sid, '?')))
+    records.sort()
+    return records
+
+def read_trace(path: str) -> Iterator[TraceRecord]:
+    """The records of the trace at path, in time order"""
+    return heapq.merge(*(_read_segment(p) for p in segment_paths(path)))
+
+def to_text(path: str, file=None) -> None:
+    """Print the trace at path, a record to a line"""
+    if file is None:
+        file = sys.stdout
+    records = list(read_trace(path))
+    # a record at the start of a segment may come just before its thread is
+    # named in it
+    first: Dict[int, str] = {}
+    for r in records:
+        if r.event == NAME:
+            first.setdefault(r.thread, r.text)
+    names: Dict[int, str] = {}
+    for r in records:
+        if r.event == NAME:
+            names[r.thread] = r.text
+            continue
+        name = names.get(r.thread) or first.get(r.thread, '?')
+        thread = f'{name}#{r.thread}'
+        print(f'{r.timestamp}:: {thread} {EVENTS.get(r.event, r.event)} '
+              f'{r.text}', file=file)
+
+def chrome_events(path: str) -> List[dict]:
+    """The trace at path as Chrome trace events, which Perfetto also reads.
+    Reads and writes are slices on their thread's track, named for the
+    channel, and logged text is an instant event."""
+    result = []
+    named = set()
+    for r in read_trace(path):
+        ids = {'pid': r.pid, 'tid': r.thread}
+        ts = r.timestamp / 1000  # microseconds
+        if r.event == NAME:
+            if (r.pid, r.thread, r.text) not in named:
+                named.add((r.pid, r.thread, r.text))
+                result.append(dict(ids, ph='M', name='thread_name',
+                                   args={'name': r.text}))
+        elif r.event == LOG:
+            result.append(dict(ids, ph='i', s='t', ts=ts, name=r.text,
+                               cat='log'))
+        elif r.event in (WRITE, READ):
+            op = f'{r.text} <<' if r.event == WRITE else f'~{r.text}'
+            result.append(dict(ids, ph='B', ts=ts, name=op,
+                               cat='channel', args={'channel': r.text}))
+        elif r.event in (WRITE_END, READ_END):
+            result.append(dict(ids, ph='E', ts=ts))
+    return result
+
+def to_chrome(path: str, file=None) -> None:
+    """Write the trace at path as Chrome trace JSON, for chrome://tracing or
+    ui.perfetto.dev"""
+    if file is None:
+        file = sys.stdout
+    json.dump({'traceEvents': chrome_events(path),
+               'displayTimeUnit': 'ns'}, file)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='python -m cpo.trace',
+        description='Convert a CPO trace to text or Chrome trace JSON')
+    parser.add_argument('path', help='the path the trace was written to')
+    parser.add_argument('--chrome', action='store_true',
+                        help='write Chrome trace JSON rather than text')
+    args = parser.parse_args(argv)
+    if args.chrome:
+        to_chrome(args.path)
+    else:
+        to_text(args.path)
+
+if __name__ == '__main__':
+    main()
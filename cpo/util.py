@@ -56,6 +56,20 @@ class Crashed(Stopped):
 class Closed(Stopped):
     def __init__(self, name):
         super().__init__(f'Closed({name})')
+        self.name = str(name)
+
+    def __reduce__(self):
+        return Closed, (self.name,)
+
+
+class Cancelled(Stopped):
+    """The process was cancelled while it was blocked"""
+    pass
+
+
+class Abort(Stopped):
+    """An alternation found none of its branches feasible"""
+    pass
 
 
 def get_prop_else(name, orelse, coerce=None):
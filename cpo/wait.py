@@ -0,0 +1,108 @@
+import time
+from typing import Callable, Dict, Optional
+
+from .atomic import StripedCounter
+from . import config
+from . import threads
+
+class WaitStrategy:
+    """How a process waits for a channel to reach the state it needs. Each
+    strategy counts the phase in which the waits it served were satisfied, so
+    it can be tuned to the handoff latencies of a particular network. The
+    counts are striped, as the default strategy is shared by every channel
+    which is not given its own, so waits on different threads don't contend
+    to count themselves."""
+
+    kind = '?'
+
+    def __init__(self) -> None:
+        self.immediate = StripedCounter(stripes=16)
+        self.spun = StripedCounter(stripes=16)
+        self.parked = StripedCounter(stripes=16)
+
+    def wait_until(self, condition: Callable[[], bool]) -> None:
+        """Block the current thread until condition() holds. The condition
+        must be made to hold by a thread which then unparks this one."""
+        raise NotImplementedError
+
+    def park_until(self, condition: Callable[[], bool]) -> None:
+        while not condition():
+            threads.park_current_thread()
+        self.parked.inc(1)
+
+    def stats(self) -> Dict[str, int]:
+        """The number of waits satisfied in each phase"""
+        return {
+            'immediate': self.immediate.get(),
+            'spun': self.spun.get(),
+            'parked': self.parked.get(),
+        }
+
+    def reset_stats(self) -> None:
+        self.immediate.reset()
+        self.spun.reset()
+        self.parked.reset()
+
+    def __str__(self) -> str:
+        stats = ', '.join(f'{k}={v}' for k, v in self.stats().items())
+        return f'{self.kind}({stats})'
+
+
+class ParkWait(WaitStrategy):
+    """Park as soon as the condition does not hold"""
+
+    kind = 'PARK'
+
+    def wait_until(self, condition: Callable[[], bool]) -> None:
+        if condition():
+            self.immediate.inc(1)
+            return
+        self.park_until(condition)
+
+
+class SpinParkWait(WaitStrategy):
+    """Yield the processor up to spin times, rechecking the condition each
+    time, before parking. Handoffs which complete within a few microseconds
+    then avoid the kernel round trip of a park and unpark."""
+
+    kind = 'SPIN'
+
+    def __init__(self, spin: int = 100) -> None:
+        """
+
+        Args:
+            spin: The maximum number of yields before parking.
+        """
+        super().__init__()
+        self.spin = spin
+
+    def wait_until(self, condition: Callable[[], bool]) -> None:
+        if condition():
+            self.immediate.inc(1)
+            return
+        for _ in range(self.spin):
+            time.sleep(0)
+            if condition():
+                self.spun.inc(1)
+                return
+        self.park_until(condition)
+
+    def __str__(self) -> str:
+        return f'{super().__str__()}[spin={self.spin}]'
+
+
+waitKIND = config.get('waitKIND', 'PARK').upper()
+waitSPIN = config.get('waitSPIN', 100)
+
+def make_wait_strategy(kind: str, spin: int = waitSPIN) -> WaitStrategy:
+    if kind == 'PARK':
+        return ParkWait()
+    elif kind == 'SPIN':
+        return SpinParkWait(spin)
+    raise ValueError(f'waitKIND should be PARK or SPIN. Not {kind}')
+
+# shared by every channel which is not given its own strategy
+default: WaitStrategy = make_wait_strategy(waitKIND)
+
+def get_wait_strategy(strategy: Optional[WaitStrategy]) -> WaitStrategy:
+    return default if strategy is None else strategy
@@ -1,37 +1,46 @@
-
 import math
 import random
 import statistics
 
 from cpo import *
 
-def run_demo(num_drops=1e6):
-    """ Estimate pi by dropping needles onto a surface """
-    NUM_WORKERS = 40
-    DROPS_PER_TASK = 10000
-    SCALE = 100000
+DROPS_PER_TASK = 10000
+SCALE = 100000
+
+def drop_needle() -> bool:
+    """ drop a needle and see whether it crosses a line """
+    x = random.randrange(SCALE, (4 * SCALE)) / SCALE
+    theta = random.randrange(0, 360 * SCALE) / SCALE
+    x_end = x + math.sin(math.radians(theta))  # use pi to calculate pi!
+    return abs(int(x) - int(x_end)) == 1
 
+@repeat
+def drop_needles(output):
+    hits = sum(drop_needle() for _ in range(DROPS_PER_TASK))
+    prob = hits / DROPS_PER_TASK
+    estimate = 2 / prob
+    output << estimate
+
+def drop_needles_isolated(output):
+    # repeat's wrapper cannot be pickled to be sent to a worker process
+    drop_needles(output)
+
+def run_demo(num_drops=1e6, num_workers=40, isolate=False):
+    """ Estimate pi by dropping needles onto a surface """
     output = ManyOne()
 
-    def drop_needle() -> bool:
-        """ drop a needle and see whether it crosses a line """
-        x = random.randrange(SCALE, (4 * SCALE)) / SCALE
-        theta = random.randrange(0, 360 * SCALE) / SCALE
-        x_end = x + math.sin(math.radians(theta))  # use pi to calculate pi!
-        return abs(int(x) - int(x_end)) == 1
-
-    @fork_procs(range(NUM_WORKERS))
-    @repeat
-    def workers(i):
-        hits = sum(drop_needle() for _ in range(DROPS_PER_TASK))
-        prob = hits / DROPS_PER_TASK
-        estimate = 2 / prob
-        output << estimate
+    if isolate:
+        workers = isolated_procs(variant_args=[(output,)] * num_workers)(
+            drop_needles_isolated)
+    else:
+        workers = procs(variant_args=[(output,)] * num_workers)(drop_needles)
+    handle = workers.fork()
 
     num_outputs = int(num_drops // DROPS_PER_TASK)
     estimates = [~output for _ in range(num_outputs)]
 
     output.close()
+    handle.join()
 
     return statistics.mean(estimates)
 
@@ -43,4 +52,4 @@ def main():
     )
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
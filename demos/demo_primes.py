@@ -1,10 +1,9 @@
-
 import itertools
 
 from cpo import *
 
-def run_demo(num_primes=30):
-    """ Calculate primes by recursive filtering """
+def run_threaded(num_primes):
+    """ Each filter is a process running on a thread of its own """
 
     input = OneOne()
     output = ManyOne()
@@ -18,14 +17,16 @@ def run_demo(num_primes=30):
         prime = ~port_in
         port_out << prime
         c = OneOne()
-        fork_proc(lambda: worker(c, port_out))
         try:
+            fork_proc(lambda: worker(c, port_out))
             while True:
                 val = ~port_in
                 if val % prime != 0:
                     c << val
         finally:
+            # close upstream too, so that no writer is left waiting on us
             c.close()
+            port_in.close()
     fork_proc(lambda: worker(input, output))
 
     result = [~output for _ in range(num_primes)]
@@ -34,8 +35,50 @@ def run_demo(num_primes=30):
     output.close()
     return result
 
+def run_async(num_primes):
+    """ Each filter is an async process, a task on the shared event loop, so
+    there may be very many of them """
+
+    input = OneOne()
+    output = N2NBuf()
+
+    @fork
+    @async_proc
+    async def source():
+        for n in itertools.count(start=2):
+            await input.awrite(n)
+
+    async def worker(port_in, port_out):
+        prime = await port_in.aread()
+        await port_out.awrite(prime)
+        c = OneOne()
+        try:
+            fork(async_proc(worker, c, port_out))
+            while True:
+                val = await port_in.aread()
+                if val % prime != 0:
+                    await c.awrite(val)
+        finally:
+            c.close()
+            port_in.close()
+    fork(async_proc(worker, input, output))
+
+    # the reader is a thread, sharing the channel with the async writers
+    result = [~output for _ in range(num_primes)]
+
+    input.close()
+    output.close()
+    return result
+
+def run_demo(num_primes=30, asynchronous=False):
+    """ Calculate primes by recursive filtering """
+    if asynchronous:
+        return run_async(num_primes)
+    return run_threaded(num_primes)
+
 def main():
     print('We have found the following primes: ', run_demo())
+    print('And again, asynchronously: ', run_demo(asynchronous=True))
 
 if __name__ == '__main__':
     main()
@@ -40,8 +40,8 @@ class RWSolution:
 
     def __init__(self, data_len):
         self.data = [0] * data_len
-        self.n_reads = AtomicNum(0)
-        self.n_writes = AtomicNum(0)
+        self.n_reads = StripedCounter()
+        self.n_writes = StripedCounter()
         self.n_corrupted = AtomicNum(0)
         self._kill = False
 